@@ -0,0 +1,71 @@
+"""
+Latency of jarvice-cli commands through the agent, compared to direct runs.
+
+Starts the local mock server and an agent on a temporary socket, then runs
+every command in fresh processes through the jarvice-cli entry point, with
+and without the agent. `python -c pass` is measured too, as the floor set
+by interpreter startup.
+
+    python -m benchmarks.bench_agent [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.mockserver import MockJarviceServer
+
+COMMANDS = {
+    "status": ["status", "-j", "1", "--no-rich"],
+    "jobs --no-rich": ["jobs", "--no-rich"],
+    "jobs": ["jobs"],
+    "machines": ["machines", "--no-rich"],
+}
+
+_ENTRY = ["-c", "from jarvice_cli.agent import main; main()"]
+
+
+def wallTime(argv : List[str], env : Dict[str, str], repeat : int) -> float:
+    """
+    Fastest of `repeat` runs of a python process, in ms
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7, help="runs per command, the fastest is kept")
+    args = parser.parse_args()
+
+    server = MockJarviceServer().start()
+    directory = tempfile.mkdtemp(prefix="jarvice-cli-bench-")
+    env = dict(os.environ, JARVICE_USER="bench", JARVICE_API_KEY="key", JARVICE_API_URL=server.url,
+               JARVICE_CLI_CACHE_DIR=directory, JARVICE_CLI_AGENT_SOCKET=os.path.join(directory, "agent.sock"))
+    agent = subprocess.Popen([sys.executable, "-m", "jarvice_cli", "agent"], env=env,
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        agent.stdout.readline()
+        print(f"{'command':<16} {'agent (ms)':>10} {'direct (ms)':>11}")
+        print(f"{'python -c pass':<16} {wallTime(['-c', 'pass'], env, args.repeat):>10.1f}")
+        direct = dict(env, JARVICE_CLI_AGENT="0")
+        for name, argv in COMMANDS.items():
+            # The first command opens the session of the agent
+            wallTime(_ENTRY + argv, env, 1)
+            print(f"{name:<16} {wallTime(_ENTRY + argv, env, args.repeat):>10.1f} "
+                  f"{wallTime(_ENTRY + argv, direct, max(1, args.repeat // 2)):>11.1f}")
+    finally:
+        subprocess.run([sys.executable, "-m", "jarvice_cli", "agent", "--stop"], env=env, stdout=subprocess.DEVNULL)
+        agent.wait()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark of jarvice-cli commands and jarviceapi methods against the
+local mock Jarvice XE server.
+
+Every scenario runs in a fresh process. Its wall time, number of API
+requests and peak RSS are compared to benchmarks/baseline.json, and the
+run fails if one of them regressed beyond the tolerance (any extra
+request is a regression), or if the scenario has no baseline.
+
+    python -m benchmarks.bench_commands [--only REGEX] [--latency S]
+    python -m benchmarks.bench_commands --update-baseline
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from benchmarks.mockserver import MockServerProcess
+
+BASELINE = Path(__file__).parent / "baseline.json"
+ROOT = Path(__file__).parent.parent
+
+
+class Scenario(NamedTuple):
+    name : str
+    # Arguments of jarvice-cli, or ["@method", args...] to call a jarviceapi method
+    argv : List[str]
+    # Arguments of MockJarviceServer.configure
+    server : Dict = {}
+
+
+SCENARIOS : List[Scenario] = [
+    Scenario("jobs 10", ["jobs"]),
+    Scenario("jobs 10k", ["jobs"], {"njobs": 10000}),
+    Scenario("jobs 50k --no-rich", ["jobs", "--no-rich"], {"njobs": 50000}),
+    Scenario("jobs 10k -v --no-rich", ["jobs", "-v", "--no-rich"], {"njobs": 10000}),
+    Scenario("apps 2k", ["apps"], {"napps": 2000}),
+    Scenario("apps -n 2k", ["apps", "-n", "app-5"], {"napps": 2000}),
+    Scenario("machines", ["machines"], {"nmachines": 100}),
+    Scenario("status", ["status", "-j", "1"]),
+    Scenario("tail 100k lines", ["tail", "-j", "1", "-l", "100000"], {"output_lines": 100000}),
+    Scenario("shutdown-all 300", ["shutdown-all"], {"njobs": 300}),
+    Scenario("wait-for 20 jobs", ["wait-for", "--status", "R", "--min-interval", "0.2", "--no-rich"],
+             {"njobs": 20, "job_duration": 2.0}),
+    Scenario("submit 200", ["submit", "{submissions}", "-p", "8", "--no-rich"]),
+    Scenario("api.jobs 50k", ["@method", "jobs"], {"njobs": 50000}),
+    Scenario("api.apps 5k", ["@method", "apps"], {"napps": 5000}),
+    Scenario("api.status", ["@method", "status", "1"]),
+    Scenario("api.shutdown_all 300", ["@method", "shutdown_all"], {"njobs": 300}),
+    Scenario("api.wait_for 20 jobs", ["@method", "wait_for", "1", "10", "20"], {"njobs": 20, "job_duration": 2.0}),
+]
+
+
+def callMethod(method : str, args : List[str]):
+    """
+    Calls a jarviceapi method with credentials from the environment (child process side)
+    """
+    from jarvice_cli.jarviceapi import jarviceapi
+
+    with jarviceapi(os.environ["JARVICE_USER"], os.environ["JARVICE_API_KEY"], os.environ["JARVICE_API_URL"]) as api:
+        values = [int(arg) if arg.isdigit() else arg for arg in args]
+        if method == "wait_for":
+            api.wait_for(values, min_interval=0.2)
+        else:
+            getattr(api, method)(*values)
+
+
+class Measure(NamedTuple):
+    wall : float
+    requests : int
+    rss_kb : int
+    returncode : int
+
+
+def runScenario(scenario : Scenario, server : MockServerProcess, workdir : Path, latency : float) -> Measure:
+    server.configure(**dict(scenario.server, latency=latency))
+    submissions = workdir / "submissions.jsonl"
+    argv = [arg.replace("{submissions}", str(submissions)) for arg in scenario.argv]
+    if argv[0] == "@method":
+        command = [sys.executable, "-m", "benchmarks.bench_commands", "--call"] + argv[1:]
+    else:
+        command = [sys.executable, "-m", "jarvice_cli"] + argv
+    env = dict(os.environ,
+               JARVICE_USER="bench", JARVICE_API_KEY="key", JARVICE_API_URL=server.url,
+               JARVICE_CACHE_TTL="0", JARVICE_CLI_CACHE_DIR=str(workdir / "cache"),
+               PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+
+    server.reset_counters()
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere. It includes the
+    # RSS of this process at fork time, which is why the server runs apart.
+    rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    return Measure(wall, server.requests, rss_kb, proc.returncode)
+
+
+def compare(name : str, measure : Dict, baseline : Optional[Dict], tolerance : float) -> List[str]:
+    if baseline is None:
+        # Without a baseline nothing would ever be reported as a regression
+        return ["no baseline, run with --update-baseline"]
+    errors = []
+    if measure["requests"] > baseline["requests"]:
+        errors.append(f"requests {baseline['requests']} -> {measure['requests']}")
+    if measure["wall"] > baseline["wall"] * (1 + tolerance):
+        errors.append(f"wall {baseline['wall']:.3f}s -> {measure['wall']:.3f}s")
+    if measure["rss_kb"] > baseline["rss_kb"] * (1 + tolerance):
+        errors.append(f"rss {baseline['rss_kb']}KB -> {measure['rss_kb']}KB")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="only run scenarios matching this regex")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency added to every response, in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the best one is kept")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative increase of wall time and RSS")
+    parser.add_argument("--submissions", type=int, default=200, help="number of submissions of the submit scenario")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--output", type=Path, help="also write the results to this JSON file")
+    parser.add_argument("--call", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.call:
+        callMethod(args.call[0], args.call[1:])
+        return
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results = {}
+    failures = []
+    server = MockServerProcess()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            with open(workdir / "submissions.jsonl", "w") as submissions_hd:
+                for n in range(args.submissions):
+                    submissions_hd.write(json.dumps({"app": "jarvice-cli", "name": f"bench-{n}",
+                                                     "machine": {"type": "n0", "nodes": 1}}) + "\n")
+
+            print(f"{'scenario':<26} {'wall (s)':>9} {'requests':>8} {'rss (MB)':>9}  result")
+            for scenario in SCENARIOS:
+                if args.only and not re.search(args.only, scenario.name):
+                    continue
+                runs = [runScenario(scenario, server, workdir, args.latency) for _ in range(max(1, args.repeat))]
+                measure = {
+                    "wall": round(min(run.wall for run in runs), 4),
+                    "requests": max(run.requests for run in runs),
+                    "rss_kb": min(run.rss_kb for run in runs),
+                }
+                results[scenario.name] = measure
+                errors = [f"exit code {run.returncode}" for run in runs[:1] if run.returncode != 0]
+                if not args.update_baseline:
+                    errors += compare(scenario.name, measure, baseline.get(scenario.name), args.tolerance)
+                if errors:
+                    failures.append(scenario.name)
+                print(f"{scenario.name:<26} {measure['wall']:>9.3f} {measure['requests']:>8} "
+                      f"{measure['rss_kb'] / 1024:>9.1f}  {'; '.join(errors) or 'OK'}")
+    finally:
+        server.stop()
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.update_baseline:
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+    if failures:
+        sys.exit(f"Performance regression: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
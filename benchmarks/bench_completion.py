@@ -0,0 +1,90 @@
+"""
+Latency of shell completion through the jarvice-cli entry point.
+
+Job numbers, job names, apps and machine types are completed from the
+completion index, which must take less than its budget on top of the start
+of the interpreter. Options are completed by typer, shown for comparison.
+
+    python -m benchmarks.bench_completion [--repeat N] [--jobs N] [--scale X]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from jarvice_cli.completion import CompletionIndex
+
+URL = "http://127.0.0.1:1/api/"
+USERNAME = "bench"
+# Runs the entry point like the jarvice-cli script
+ENTRY_POINT = "import sys; sys.argv[0] = 'jarvice-cli'; from jarvice_cli.agent import main; main()"
+
+# name: (command line, word completed, budget in ms above the interpreter start, None for no budget)
+REQUESTS = {
+    "status -j": (["status", "-j"], "", 50),
+    "tail -n": (["tail", "-n"], "job-1", 50),
+    "apps -n": (["apps", "-n"], "app-", 50),
+    "submit --machine": (["submit", "--machine"], "", 50),
+    "status --j (typer)": (["status"], "--j", None),
+}
+
+
+def wallTime(argv : List[str], env : dict, repeat : int) -> float:
+    """
+    Fastest of repeat runs, in ms
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        runs.append(time.perf_counter() - start)
+    return min(runs) * 1000
+
+
+def completionEnv(words : List[str], incomplete : str) -> dict:
+    line = " ".join(["jarvice-cli", "--url", URL, "-u", USERNAME] + words + [incomplete])
+    return dict(os.environ, _JARVICE_CLI_COMPLETE="complete_bash", COMP_WORDS=line,
+                COMP_CWORD=str(len(words) + 5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="runs per request, the fastest is kept")
+    parser.add_argument("--jobs", type=int, default=1000, help="jobs in the index")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every budget, for slow machines")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="jarvice-bench-")
+    os.environ["JARVICE_CLI_CACHE_DIR"] = work
+    failures = []
+    try:
+        index = CompletionIndex(URL, USERNAME)
+        index.updateJobs({str(n): f"job-{n}" for n in range(1, args.jobs + 1)})
+        index.updateNames("apps", (f"app-{n}" for n in range(500)))
+        index.updateNames("machines", (f"n{n}" for n in range(50)))
+        index.save()
+        baseline = wallTime([sys.executable, "-c", "pass"], dict(os.environ), args.repeat)
+        print(f"interpreter start: {baseline:.1f} ms")
+        print(f"{'request':<20} {'time (ms)':>9} {'added (ms)':>10} {'budget (ms)':>11}  result")
+        for name, (words, incomplete, budget) in REQUESTS.items():
+            elapsed = wallTime([sys.executable, "-c", ENTRY_POINT], completionEnv(words, incomplete), args.repeat)
+            limit : Optional[float] = budget * args.scale if budget is not None else None
+            result = "-"
+            if limit is not None:
+                result = "OK" if elapsed - baseline <= limit else "over budget"
+                if result != "OK":
+                    failures.append(name)
+            print(f"{name:<20} {elapsed:>9.1f} {elapsed - baseline:>10.1f} "
+                  f"{limit if limit is not None else '-':>11}  {result}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if failures:
+        sys.exit(f"Completion regression: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
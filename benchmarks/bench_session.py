@@ -0,0 +1,48 @@
+"""
+Count the TCP (and, against a real endpoint, TLS) handshakes saved by
+sharing one pooled client across jarviceapi calls.
+
+    python -m benchmarks.bench_session [--calls N] [--jobs N]
+"""
+import argparse
+import time
+
+from benchmarks.mockserver import MockJarviceServer
+from jarvice_cli.jarviceapi import jarviceapi
+
+
+def run(server : MockJarviceServer, calls : int, shared : bool):
+    server.reset_counters()
+    start = time.perf_counter()
+    if shared:
+        with jarviceapi("bench", "key", server.url) as api:
+            for i in range(calls):
+                api.status(i % len(server.jobs) + 1)
+    else:
+        for i in range(calls):
+            with jarviceapi("bench", "key", server.url) as api:
+                api.status(i % len(server.jobs) + 1)
+    return server.connections, server.requests, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--jobs", type=int, default=10)
+    args = parser.parse_args()
+
+    server = MockJarviceServer(njobs=args.jobs).start()
+    try:
+        print(f"{'mode':<12} {'requests':>8} {'handshakes':>10} {'time (s)':>9}")
+        results = {}
+        for mode, shared in (("per-call", False), ("shared", True)):
+            connections, requests, elapsed = run(server, args.calls, shared)
+            results[mode] = connections
+            print(f"{mode:<12} {requests:>8} {connections:>10} {elapsed:>9.3f}")
+        print(f"handshakes saved: {results['per-call'] - results['shared']}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Import-time regression check of jarvice-cli commands.
+
+Every command runs in a fresh `python -X importtime -m jarvice_cli`
+process against the local mock server. The check fails if the imports of
+a command take longer than its budget, or if it loads a module it must
+not need (e.g. rich for raw output, the generated client for --help).
+
+    python -m benchmarks.bench_startup [--repeat N] [--scale X]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.mockserver import MockJarviceServer
+
+# name: (arguments, import time budget in ms, modules that must not be imported)
+COMMANDS : Dict[str, Tuple[List[str], float, List[str]]] = {
+    # typer renders help with rich
+    "help": (["--help"], 350, ["jarviceapi_client", "urllib3", "pydantic"]),
+    "shutdown": (["shutdown", "-j", "1"], 350, ["rich"]),
+    "terminate": (["terminate", "-j", "2"], 350, ["rich"]),
+    "wait-for": (["wait-for", "-j", "1", "--no-rich"], 350, ["rich"]),
+    "status": (["status", "-j", "3", "--no-rich"], 350, ["rich"]),
+    "jobs --no-rich": (["jobs", "--no-rich"], 350, ["rich"]),
+    "jobs": (["jobs"], 450, []),
+}
+
+_IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importTime(argv : List[str], url : str) -> Tuple[float, List[str], int, str]:
+    """
+    Runs a command and returns its total import time in ms, the modules it
+    imported, its return code and the last line of its error output
+    """
+    env = dict(os.environ, JARVICE_USER="bench", JARVICE_API_KEY="key", JARVICE_API_URL=url,
+               JARVICE_CACHE_TTL="0")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "jarvice_cli"] + argv,
+                          env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total = 0
+    modules = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            total += int(match.group(1))
+            modules.append(match.group(4))
+        elif line.strip():
+            errors.append(line.strip())
+    return total / 1000, modules, proc.returncode, errors[-1] if errors else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per command, the fastest is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every budget, for slow machines")
+    args = parser.parse_args()
+
+    server = MockJarviceServer().start()
+    failures = []
+    try:
+        print(f"{'command':<16} {'imports (ms)':>12} {'budget (ms)':>11}  result")
+        for name, (argv, budget, forbidden) in COMMANDS.items():
+            runs = [importTime(argv, server.url) for _ in range(args.repeat)]
+            elapsed = min(run[0] for run in runs)
+            modules, returncode = runs[0][1], runs[0][2]
+            errors = []
+            if returncode != 0:
+                errors.append(f"exit code {returncode}: {runs[0][3]}")
+            if elapsed > budget * args.scale:
+                errors.append("over budget")
+            loaded = [module for module in forbidden
+                      if any(m == module or m.startswith(module + ".") for m in modules)]
+            if loaded:
+                errors.append("imported " + ", ".join(loaded))
+            print(f"{name:<16} {elapsed:>12.1f} {budget * args.scale:>11.0f}  {'; '.join(errors) or 'OK'}")
+            if errors:
+                failures.append(name)
+    finally:
+        server.stop()
+    if failures:
+        sys.exit(f"Startup regression: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
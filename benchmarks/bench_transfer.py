@@ -0,0 +1,73 @@
+"""
+Throughput of vault uploads and downloads against the local storage
+server, one chunk at a time and in parallel, then of a run where every
+file is already in sync.
+
+    python -m benchmarks.bench_transfer [--files N] [--size MiB] [--latency S] [--parallel N]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.storageserver import MockStorageServer
+from jarvice_cli.jarviceapi import jarviceapi
+
+
+def makeFiles(directory : Path, files : int, size : int):
+    """
+    files small files and one large file of size bytes
+    """
+    (directory / "small").mkdir(parents=True)
+    for n in range(files):
+        (directory / "small" / f"file{n}.txt").write_bytes(os.urandom(4096))
+    (directory / "large.bin").write_bytes(os.urandom(size))
+
+
+def run(server : MockStorageServer, transfer, max_parallel : int):
+    server.reset_counters()
+    start = time.perf_counter()
+    stats = transfer(max_parallel)
+    elapsed = time.perf_counter() - start
+    if stats.failed:
+        raise RuntimeError(f"{stats.failed} files failed: {stats.errors[0][1]}")
+    return stats, server.requests, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64, help="size of the large file, in MiB")
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--parallel", type=int, default=8)
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="jarvice-bench-"))
+    server = MockStorageServer(str(work / "storage"), args.latency).start()
+    os.environ.setdefault("JARVICE_CLI_CACHE_DIR", str(work / "cache"))
+    try:
+        (work / "storage" / "bench").mkdir(parents=True)
+        makeFiles(work / "local", args.files, args.size * 1024 * 1024)
+        api = jarviceapi("bench", "key", "http://127.0.0.1:1/api/", storage_url=server.url)
+        print(f"{'run':<22} {'files':>6} {'skipped':>7} {'requests':>8} {'time (s)':>9} {'MiB/s':>8}")
+        for label, parallel in (("serial", 1), (f"parallel ({args.parallel})", args.parallel)):
+            shutil.rmtree(work / "storage" / "bench" / "data", ignore_errors=True)
+            shutil.rmtree(work / "download", ignore_errors=True)
+            for direction, transfer in (
+                    ("upload", lambda p: api.upload(str(work / "local"), "/data", "bench", p)),
+                    ("download", lambda p: api.download("/data", str(work / "download"), "bench", p))):
+                stats, requests, elapsed = run(server, transfer, parallel)
+                print(f"{direction + ' ' + label:<22} {stats.transferred:>6} {stats.skipped:>7} {requests:>8} "
+                      f"{elapsed:>9.3f} {stats.bytes / 1024 / 1024 / elapsed:>8.1f}")
+        stats, requests, elapsed = run(server, lambda p: api.upload(str(work / "local"), "/data", "bench", p),
+                                       args.parallel)
+        print(f"{'upload in sync':<22} {stats.transferred:>6} {stats.skipped:>7} {requests:>8} {elapsed:>9.3f} {'':>8}")
+    finally:
+        server.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Local stand-in for the Jarvice XE API, used by the benchmarks.
+
+It speaks HTTP/1.1 with keep-alive and counts both the requests it serves
+and the TCP connections it accepts, so benchmarks can tell how many
+handshakes a client paid for. Latency and payload sizes (number of jobs,
+size of the apps catalog, length of job outputs) are configurable.
+
+The server can run in its own process (MockServerProcess, or
+`python -m benchmarks.mockserver`), so that its memory doesn't add to the
+peak RSS of the processes measured. It is then controlled through the
+/_mock/ endpoints, which are not counted as requests.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+TERMINAL_STATUSES = ("COMPLETED", "COMPLETED WITH ERROR", "TERMINATED", "CANCELED")
+
+
+def makeJobEntry(number : int, status : str = "PROCESSING STARTING") -> Dict:
+    now = int(time.time())
+    return {
+        "job_number": number,
+        "job_name": f"jarvice-cli-{number}",
+        "job_label": "",
+        "job_status": status,
+        "job_substatus": "",
+        "job_application": "jarvice-cli",
+        "job_command": "shell",
+        "job_owner_username": "bench",
+        "job_project": "",
+        "job_submit_time": now - 120,
+        "job_start_time": now - 60,
+        "job_end_time": 0,
+        "job_walltime": "01:00:00",
+        "job_api_submission": {"machine": {"type": "n0", "nodes": 1}},
+        "job_stats": {"queue_time": 60, "compute_time": 60},
+    }
+
+
+def makeApp(number : int) -> Dict:
+    return {
+        "id": f"app-{number}",
+        "data": {
+            "name": f"Application {number}",
+            "author": "bench",
+            "description": "Benchmark application " + "x" * 200,
+            "commands": {
+                f"cmd{c}": {"path": "/bin/true", "name": f"Command {c}", "description": "Benchmark command " + "y" * 100}
+                for c in range(5)
+            },
+        },
+    }
+
+
+def makeMachine(number : int) -> Dict:
+    return {
+        "mc_description": f"Machine {number}",
+        "mc_arch": "x86_64",
+        "mc_cores": 16,
+        "mc_ram": 64,
+        "mc_gpus": 0,
+        "mc_scale_min": 1,
+        "mc_scale_max": 16,
+        "mc_price": 1.0,
+    }
+
+
+class MockJarviceServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the mock Jarvice state
+
+    Jobs stay in PROCESSING STARTING until their end time, if any, then
+    COMPLETED. Like Jarvice, `jobs` only lists the jobs that have not ended.
+    """
+    daemon_threads = True
+
+    def __init__(self, njobs : int = 10, napps : int = 10, nmachines : int = 10,
+                 output_lines : int = 100, latency : float = 0.0):
+        super().__init__(("127.0.0.1", 0), MockJarviceHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.configure(njobs, napps, nmachines, output_lines, latency)
+
+    def configure(self, njobs : int = 10, napps : int = 10, nmachines : int = 10,
+                  output_lines : int = 100, latency : float = 0.0,
+                  job_duration : Optional[float] = None):
+        """
+        Resets the state of the server
+
+        Args:
+            njobs : number of running jobs
+            napps : size of the apps catalog
+            nmachines : number of machine types
+            output_lines : length of job outputs
+            latency : delay added to every response, in seconds
+            job_duration : jobs end within this time, in seconds, spread evenly (never if None)
+        """
+        now = time.time()
+        with self.lock:
+            self.latency = latency
+            self.output_lines = output_lines
+            self.jobs = {str(n): makeJobEntry(n) for n in range(1, njobs + 1)}
+            self.end_times = {}
+            if job_duration is not None:
+                self.end_times = {str(n): now + job_duration * n / max(1, njobs) for n in range(1, njobs + 1)}
+            self.next_number = njobs + 1
+            self.apps = {f"app-{n}": makeApp(n) for n in range(napps)}
+            self.machines = {f"n{n}": makeMachine(n) for n in range(nmachines)}
+            self._jobs_payload = None
+            self._apps_payload = json.dumps(self.apps).encode()
+            self._machines_payload = json.dumps(self.machines).encode()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}/api"
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def job(self, query : Dict) -> Optional[Dict]:
+        if "number" in query:
+            job = self.jobs.get(query["number"][0])
+        else:
+            name = query.get("name", [None])[0]
+            job = next((job for job in self.jobs.values() if job["job_name"] == name), None)
+        if job is not None:
+            self._update(job)
+        return job
+
+    def _update(self, job : Dict):
+        end = self.end_times.get(str(job["job_number"]))
+        if end is not None and job["job_status"] not in TERMINAL_STATUSES and time.time() >= end:
+            job["job_status"] = "COMPLETED"
+            job["job_end_time"] = int(end)
+            self._jobs_payload = None
+
+    def jobsPayload(self) -> bytes:
+        with self.lock:
+            if self.end_times:
+                for job in self.jobs.values():
+                    self._update(job)
+            if self._jobs_payload is None:
+                self._jobs_payload = json.dumps({k: v for k,v in self.jobs.items()
+                                                 if v["job_status"] not in TERMINAL_STATUSES}).encode()
+            return self._jobs_payload
+
+    def submit(self, submission : Dict) -> Dict:
+        with self.lock:
+            number = self.next_number
+            self.next_number += 1
+            job = makeJobEntry(number, "SUBMITTED")
+            if submission.get("name"):
+                job["job_name"] = submission["name"]
+            self.jobs[str(number)] = job
+            self._jobs_payload = None
+        return {"name": job["job_name"], "number": number}
+
+    def setStatus(self, job : Dict, status : str):
+        with self.lock:
+            job["job_status"] = status
+            self._jobs_payload = None
+
+
+class MockJarviceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoid Nagle/delayed ACK stalls on keep-alive
+    disable_nagle_algorithm = True
+    server : MockJarviceServer
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body : bytes, status : int = 200, contentType : str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, payload, status : int = 200):
+        self._send(json.dumps(payload).encode(), status)
+
+    def _control(self, endpoint : str, body : bytes):
+        if endpoint == "configure":
+            self.server.configure(**json.loads(body or b"{}"))
+        elif endpoint == "reset":
+            self.server.reset_counters()
+        self._reply({"connections": self.server.connections, "requests": self.server.requests})
+
+    def _begin(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        return url.path.rsplit("/", 1)[-1], parse_qs(url.query)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/_mock/"):
+            self._control(self.path.rsplit("/", 1)[-1], body)
+            return
+        endpoint, _ = self._begin()
+        if endpoint == "submit":
+            self._reply(self.server.submit(json.loads(body or b"{}")))
+        else:
+            self._reply({"error": f"unknown endpoint {endpoint}"}, 404)
+
+    def do_GET(self):
+        if self.path.startswith("/_mock/"):
+            self._control("counters", b"")
+            return
+        endpoint, query = self._begin()
+
+        if endpoint == "jobs":
+            self._send(self.server.jobsPayload())
+        elif endpoint == "apps":
+            name = query.get("name", [None])[0]
+            if name is None:
+                self._send(self.server._apps_payload)
+            elif name in self.server.apps:
+                self._reply({name: self.server.apps[name]})
+            else:
+                self._reply({"error": "app not found"}, 404)
+        elif endpoint == "machines":
+            self._send(self.server._machines_payload)
+        elif endpoint in ("status", "shutdown", "terminate", "tail", "output", "info", "connect", "action"):
+            job = self.server.job(query)
+            if job is None:
+                self._reply({"error": "job not found"}, 404)
+            elif endpoint == "status":
+                self._reply({str(job["job_number"]): job})
+            elif endpoint in ("tail", "output"):
+                lines = int(query.get("lines", ["0"])[0]) or self.server.output_lines
+                lines = min(lines, self.server.output_lines)
+                text = "".join(f"job {job['job_number']} output line {n}\n"
+                               for n in range(self.server.output_lines - lines, self.server.output_lines))
+                self._send(text.encode(), contentType="text/plain")
+            elif endpoint == "info":
+                self._reply({"address": "127.0.0.1", "password": "bench", "url": "", "about": "", "actions": {}})
+            elif endpoint == "connect":
+                self._reply({"address": "127.0.0.1", "password": "bench"})
+            elif endpoint == "action":
+                self._reply({"status": "action requested"})
+            else:
+                self.server.setStatus(job, "COMPLETED" if endpoint == "shutdown" else "TERMINATED")
+                self._reply({"status": f"{endpoint} requested"})
+        else:
+            self._reply({"error": f"unknown endpoint {endpoint}"}, 404)
+
+
+class MockServerProcess:
+    """
+    MockJarviceServer running in a child process
+    """
+    def __init__(self):
+        self._proc = subprocess.Popen([sys.executable, "-m", "benchmarks.mockserver"],
+                                      stdout=subprocess.PIPE, text=True)
+        self.url = self._proc.stdout.readline().strip()
+        self._control_url = self.url.rsplit("/api", 1)[0] + "/_mock/"
+
+    def _post(self, endpoint : str, payload : Dict = {}) -> Dict:
+        request = urllib.request.Request(self._control_url + endpoint, data=json.dumps(payload).encode(), method="POST")
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def configure(self, **kwargs):
+        """
+        See MockJarviceServer.configure
+        """
+        self._post("configure", kwargs)
+
+    def reset_counters(self):
+        self._post("reset")
+
+    @property
+    def connections(self) -> int:
+        return self._post("counters")["connections"]
+
+    @property
+    def requests(self) -> int:
+        return self._post("counters")["requests"]
+
+    def stop(self):
+        self._proc.terminate()
+        self._proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Jarvice XE API")
+    parser.add_argument("--njobs", type=int, default=10)
+    parser.add_argument("--napps", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockJarviceServer(njobs=args.njobs, napps=args.napps, latency=args.latency)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
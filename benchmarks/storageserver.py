@@ -0,0 +1,276 @@
+"""
+Local stand-in for the storage of Jarvice XE vaults, used by the benchmarks.
+
+It serves a directory over the subset of WebDAV the CLI uses (PROPFIND,
+HEAD, GET with Range, PUT with Content-Range, MKCOL, MOVE, DELETE), with
+the OC-Checksum and X-OC-Mtime extensions. The first directory of the
+served directory is the vault. Like MockJarviceServer it counts requests
+and connections, and can add latency to every response.
+
+Run it with `python -m benchmarks.storageserver [--root DIR]`: it prints
+its url, to be given to --storage-url.
+"""
+import argparse
+import email.utils
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+
+class MockStorageServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server exposing a directory as WebDAV storage
+    """
+    daemon_threads = True
+
+    def __init__(self, root : Optional[str] = None, latency : float = 0.0, ranged_put : bool = True):
+        """
+        Args:
+            root : directory served, a temporary one removed on stop() if None
+            latency : delay added to every response, in seconds
+            ranged_put : accept PUT with Content-Range, else answer 501 like most servers
+        """
+        super().__init__(("127.0.0.1", 0), MockStorageHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.latency = latency
+        self.ranged_put = ranged_put
+        self._temporary = root is None
+        self.root = Path(root if root is not None else tempfile.mkdtemp(prefix="jarvice-storage-")).resolve()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}/dav"
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, url : str) -> Optional[Path]:
+        """
+        File of a url, None if it is outside of the served directory
+        """
+        path = unquote(urlparse(url).path)
+        if not path.startswith("/dav"):
+            return None
+        local = (self.root / path[len("/dav"):].lstrip("/")).resolve()
+        if local != self.root and self.root not in local.parents:
+            return None
+        return local
+
+
+class MockStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server : MockStorageServer
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body : bytes = b"", status : int = 200, headers : Optional[dict] = None,
+              contentType : str = "application/octet-stream", length : Optional[int] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _begin(self) -> Optional[Path]:
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.server.path(self.path)
+        if path is None:
+            self._send(status=403)
+        self._body = body
+        return path
+
+    @staticmethod
+    def _etag(stat : os.stat_result) -> str:
+        return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+    def _propEntry(self, path : Path) -> str:
+        stat = path.stat()
+        href = quote("/dav/" + path.relative_to(self.server.root).as_posix()) if path != self.server.root else "/dav/"
+        if path.is_dir():
+            props = "<d:resourcetype><d:collection/></d:resourcetype>"
+            href = href.rstrip("/") + "/"
+        else:
+            props = f"<d:resourcetype/><d:getcontentlength>{stat.st_size}</d:getcontentlength>" \
+                    f"<d:getetag>{escape(self._etag(stat))}</d:getetag>"
+        props += f"<d:getlastmodified>{email.utils.formatdate(stat.st_mtime, usegmt=True)}</d:getlastmodified>"
+        return f"<d:response><d:href>{escape(href)}</d:href><d:propstat><d:prop>{props}</d:prop>" \
+               f"<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>"
+
+    def do_PROPFIND(self):
+        path = self._begin()
+        if path is None:
+            return
+        if not path.exists():
+            self._send(status=404)
+            return
+        entries = [path]
+        if path.is_dir() and self.headers.get("Depth", "1") != "0":
+            entries += sorted(path.iterdir())
+        body = '<?xml version="1.0" encoding="utf-8"?><d:multistatus xmlns:d="DAV:">' + \
+               "".join(self._propEntry(entry) for entry in entries) + "</d:multistatus>"
+        self._send(body.encode(), 207, contentType="application/xml; charset=utf-8")
+
+    def do_HEAD(self):
+        path = self._begin()
+        if path is None:
+            return
+        if not path.is_file():
+            self._send(status=404)
+            return
+        with open(path, "rb") as file_hd:
+            checksum = hashlib.file_digest(file_hd, "sha256").hexdigest() if hasattr(hashlib, "file_digest") \
+                else hashlib.sha256(file_hd.read()).hexdigest()
+        stat = path.stat()
+        self._send(status=200, length=stat.st_size,
+                   headers={"ETag": self._etag(stat), "OC-Checksum": f"SHA256:{checksum}"})
+
+    def do_GET(self):
+        path = self._begin()
+        if path is None:
+            return
+        if not path.is_file():
+            self._send(status=404)
+            return
+        size = path.stat().st_size
+        start, end = 0, size
+        requested = self.headers.get("Range", "")
+        if requested.startswith("bytes="):
+            first, _, last = requested[len("bytes="):].partition("-")
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+            if start >= size and size:
+                self._send(status=416, headers={"Content-Range": f"bytes */{size}"})
+                return
+        with open(path, "rb") as file_hd:
+            file_hd.seek(start)
+            data = file_hd.read(end - start)
+        if requested:
+            self._send(data, 206, headers={"Content-Range": f"bytes {start}-{end - 1}/{size}"})
+        else:
+            self._send(data, 200, headers={"ETag": self._etag(path.stat())})
+
+    def do_PUT(self):
+        path = self._begin()
+        if path is None:
+            return
+        if not path.parent.is_dir():
+            self._send(status=409)
+            return
+        ranged = self.headers.get("Content-Range")
+        if ranged:
+            if not self.server.ranged_put:
+                self._send(status=501)
+                return
+            span, _, total = ranged[len("bytes "):].partition("/")
+            start = int(span.split("-")[0])
+            # Chunks of a file are written concurrently, nothing is truncated away
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != int(total):
+                    os.ftruncate(fd, int(total))
+                os.pwrite(fd, self._body, start)
+            finally:
+                os.close(fd)
+        else:
+            with open(path, "wb") as file_hd:
+                file_hd.write(self._body)
+        mtime = self.headers.get("X-OC-Mtime")
+        if mtime:
+            os.utime(path, (int(mtime), int(mtime)))
+        self._send(status=201, headers={"ETag": self._etag(path.stat())})
+
+    def do_MKCOL(self):
+        path = self._begin()
+        if path is None:
+            return
+        if path.exists():
+            self._send(status=405)
+        elif not path.parent.is_dir():
+            self._send(status=409)
+        else:
+            path.mkdir()
+            self._send(status=201)
+
+    def do_MOVE(self):
+        path = self._begin()
+        if path is None:
+            return
+        destination = self.server.path(self.headers.get("Destination", ""))
+        if destination is None:
+            self._send(status=403)
+        elif not path.exists():
+            self._send(status=404)
+        else:
+            os.replace(path, destination)
+            self._send(status=201)
+
+    def do_DELETE(self):
+        path = self._begin()
+        if path is None:
+            return
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+        else:
+            self._send(status=404)
+            return
+        self._send(status=204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the storage of Jarvice XE vaults")
+    parser.add_argument("--root", help="directory served, its subdirectories are vaults (temporary if not set)")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--no-ranged-put", action="store_true", help="refuse PUT with Content-Range")
+    args = parser.parse_args()
+
+    server = MockStorageServer(args.root, args.latency, not args.no_ranged_put)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,35 @@
+from time import perf_counter
+# Start of the imports of the CLI, for --timings
+IMPORT_START = perf_counter()
+
 import configparser
 from pathlib import Path
+import re
 import sys
 import typer
 import os
-from typing import Optional, Annotated, Dict
+from typing import Any, Optional, Annotated, Dict, List
 
 #from jarviceapi import *
-import jarviceapi_client
-from jarvice_cli.jarviceapi import jarviceapi
-from jarvice_cli.printer import *
+from jarvice_cli.lazy import lazy_import
+from jarvice_cli.jarviceapi import jarviceapi, DEFAULT_POOL_SIZE, DEFAULT_MIN_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL, DEFAULT_FOLLOW_LINES
+from jarvice_cli.bulk import DEFAULT_MAX_PARALLEL
+from jarvice_cli.cache import DiskCache, DEFAULT_CACHE_TTL, cacheDir
+from jarvice_cli.history import DEFAULT_HISTORY_LIMIT, JobHistory
+from jarvice_cli.names import NameIndex
+from jarvice_cli.completion import CompletionIndex
+from jarvice_cli.policy import CallPolicy
+from jarvice_cli.federation import DEFAULT_CLUSTER_TIMEOUT
+from jarvice_cli import timings as timingsModule
+from jarvice_cli.profiling import DEFAULT_PROFILE_TOP, Profiler, ProfileMode, profilePath
+from jarvice_cli.agent import DEFAULT_AGENT_JOBS_TTL
+from jarvice_cli.jobfilter import JobFilter, SORT_KEYS, STATUS_CODES, TERMINAL_STATUSES, parseDuration, parseTime, sortJobs
+from jarvice_cli.printer import GenPrinter, RichPrinter, RecordPrinter, OutputFormat, parseFields
+
+# Commands only load the modules they need: the generated client is loaded
+# on the first request, rich by RichPrinter, and command specific modules
+# are imported in the commands.
+jarviceapi_client = lazy_import("jarviceapi_client")
 
 jarvice_cli = typer.Typer(help="The JARVICE CLI for interacting with Jarvice XE", pretty_exceptions_enable=False)
 
@@ -20,6 +41,18 @@ def validateJobidJobname(jobid: Optional[int], jobname: Optional[str]):
     if jobid is not None and jobname is not None:
         raise typer.BadParameter("jobid and jobname both specified. Specify only one")
 
+def getPrinter(raw : Optional[bool], output : Optional[OutputFormat] = None, fields : Optional[str] = None):
+    """
+    Printer for --no-rich, --output and --fields
+    """
+    if output is not None:
+        return RecordPrinter(output, parseFields(fields))
+    if fields is not None:
+        raise typer.BadParameter("--fields requires --output")
+    if raw:
+        return GenPrinter()
+    return RichPrinter()
+
 def getEnvValue(argName: str, argValue: Optional[str], envVarName: str):
     """
     If parameter is None, it is not in command.
@@ -37,7 +70,7 @@ def getEnvValue(argName: str, argValue: Optional[str], envVarName: str):
             )
             try:
                 api_values[argName] = CParser.get("auth", argName)
-            except:
+            except (configparser.NoSectionError, configparser.NoOptionError):
                 pass
         else:
             
@@ -49,6 +82,120 @@ def getEnvValue(argName: str, argValue: Optional[str], envVarName: str):
         api_values[argName] = argValue
 
 
+def loadPolicy(overrides : Dict[str, Optional[float]]) -> CallPolicy:
+    """
+    Call policy from the options given, then the [policy] section of
+    ~/.jarvice.cfg, then the defaults
+    """
+    values : Dict[str, object] = {}
+    path = os.path.expanduser("~/.jarvice.cfg")
+    if os.path.exists(path):
+        CParser = configparser.ConfigParser()
+        CParser.read([path])
+        if CParser.has_section("policy"):
+            values.update(CParser.items("policy"))
+    values.update({k: v for k,v in overrides.items() if v is not None})
+    try:
+        return CallPolicy.fromConfig(values)
+    except ValueError as e:
+        raise typer.BadParameter(f"Invalid call policy: {e}")
+
+
+def finishTimings(show : bool, trace : Optional[Path]):
+    """
+    Stops recording spans, prints them with --timings and writes them with --trace
+    """
+    tracer = timingsModule.active()
+    timingsModule.stop()
+    if tracer is None:
+        return
+    if trace is not None:
+        try:
+            tracer.writeChrome(trace)
+        except OSError as e:
+            print(f"Error : {e}", file=sys.stderr)
+    if show:
+        tracer.printSummary()
+
+def finishProfile(profiler : Profiler):
+    try:
+        profiler.stop()
+    except OSError as e:
+        print(f"Error : {e}", file=sys.stderr)
+
+def traceCommand(ctx : typer.Context, setupStart : float):
+    """
+    Records the setup of the session, and the command when it ends
+    """
+    tracer = timingsModule.active()
+    if tracer is None:
+        return
+    commandStart = perf_counter()
+    tracer.add("setup", "setup", setupStart, commandStart)
+    ctx.call_on_close(lambda: tracer.add(ctx.invoked_subcommand or "command", "command", commandStart, perf_counter()))
+
+
+# Set by the agent and the shell: sessions kept between commands, by settings, and the
+# time the job list is reused for
+agent_sessions : Optional[Dict[tuple, tuple]] = None
+agent_jobs_ttl : float = 0
+
+# Settings of the session opened by the callback, reused by the sessions of --cluster
+session_settings : Dict[str, Any] = {}
+
+def openSession(pool_size : int, cache_ttl : int, history : bool, jobs_ttl : float = 0,
+                policy : Optional[CallPolicy] = None, credentials : Optional[Dict[str, str]] = None):
+    """
+    Client, job history and name index of an endpoint and user, those of
+    api_values by default
+    """
+    credentials = credentials if credentials is not None else api_values
+    cache = None
+    if cache_ttl > 0:
+        cache = DiskCache(credentials["url"], credentials["username"], cache_ttl)
+    job_history = None
+    if history:
+        job_history = JobHistory.forEndpoint(credentials["url"], credentials["username"])
+    name_index = NameIndex(credentials["url"], credentials["username"])
+    completions = CompletionIndex(credentials["url"], credentials["username"])
+    api = jarviceapi(credentials["username"], credentials["apikey"], credentials["url"], pool_size, cache,
+                     job_history, name_index, jobs_ttl, policy, credentials.get("storage_url"), completions)
+    return api, job_history, name_index
+
+def openFederation(cluster : Optional[str], all_clusters : Optional[bool]):
+    """
+    Federation of the clusters given by --cluster or --all-clusters, None if neither is given
+    """
+    if cluster is None and not all_clusters:
+        return None
+    from jarvice_cli.federation import Federation, readClusters, selectClusters
+
+    try:
+        clusters = selectClusters(readClusters(api_values), cluster, bool(all_clusters))
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    timeout = session_settings["cluster_timeout"]
+
+    def openCluster(c):
+        api, _, _ = openSession(session_settings["pool_size"], session_settings["cache_ttl"],
+                                session_settings["history"], policy=session_settings["policy"].bounded(timeout),
+                                credentials={"url": c.url, "username": c.username, "apikey": c.apikey})
+        return api
+    return Federation(clusters, openCluster, timeout)
+
+def runFederated(federation, printer, call, show):
+    """
+    Runs call on every cluster of the federation and shows each result as it
+    comes in, under the name of its cluster
+    """
+    with federation:
+        for name, result, error in federation.run(call):
+            if error is not None:
+                printer.printClusterError(name, error)
+            else:
+                printer.printClusterHeader(name)
+                show(result)
+
 @jarvice_cli.callback()
 def getCredentials(
     ctx: typer.Context,
@@ -61,46 +208,256 @@ def getCredentials(
     apikey: Annotated[
         Optional[str], typer.Option("--apikey", "-k", help="API key in Jarvice XE")
     ] = None,
+    storage_url: Annotated[
+        Optional[str], typer.Option("--storage-url", help="URL of the WebDAV storage of the vaults, for download and upload")
+    ] = None,
+    pool_size: Annotated[
+        int, typer.Option("--pool-size", help="Maximum number of keep-alive connections to Jarvice XE", min=1)
+    ] = DEFAULT_POOL_SIZE,
+    cache_ttl: Annotated[
+        int, typer.Option("--cache-ttl", envvar="JARVICE_CACHE_TTL", help="Time apps and machines stay cached, in seconds (0 to disable)", min=0)
+    ] = DEFAULT_CACHE_TTL,
+    record: Annotated[
+        Optional[Path], typer.Option("--record", help="Record every HTTP exchange to this cassette (credentials redacted, .gz to compress)", dir_okay=False)
+    ] = None,
+    replay: Annotated[
+        Optional[Path], typer.Option("--replay", help="Serve HTTP exchanges from this cassette instead of Jarvice XE", exists=True, dir_okay=False)
+    ] = None,
+    replay_scale: Annotated[
+        float, typer.Option("--replay-scale", help="Multiplies the recorded latency when replaying (0 for none)", min=0)
+    ] = 1.0,
+    history: Annotated[
+        bool, typer.Option("--history/--no-history", envvar="JARVICE_CLI_HISTORY", help="Keep every job listed in the local history")
+    ] = True,
+    retries: Annotated[
+        Optional[int], typer.Option("--retries", help="Retries of an idempotent request after a 5xx, 429, timeout or connection error [default: 3]", min=0)
+    ] = None,
+    timeout: Annotated[
+        Optional[float], typer.Option("--timeout", help="Timeout of a single request, in seconds (0 for none) [default: 30]", min=0)
+    ] = None,
+    deadline: Annotated[
+        Optional[float], typer.Option("--deadline", help="Longest time a request takes with its retries, in seconds (0 for none) [default: 120]", min=0)
+    ] = None,
+    rate_limit: Annotated[
+        Optional[float], typer.Option("--rate-limit", help="Maximum number of requests per second (0 for no limit) [default: 0]", min=0)
+    ] = None,
+    breaker_threshold: Annotated[
+        Optional[int], typer.Option("--breaker-threshold", help="Consecutive failures after which requests fail fast (0 to disable) [default: 5]", min=0)
+    ] = None,
+    breaker_cooldown: Annotated[
+        Optional[float], typer.Option("--breaker-cooldown", help="Time requests fail fast for once failing, in seconds [default: 30]", min=0)
+    ] = None,
+    show_timings: Annotated[
+        bool, typer.Option("--timings", help="Print on stderr the time spent in imports, each HTTP request, deserialization and rendering")
+    ] = False,
+    trace: Annotated[
+        Optional[Path], typer.Option("--trace", help="Write the timings of the command to this file, in the Chrome trace format", dir_okay=False)
+    ] = None,
+    cluster_timeout: Annotated[
+        float, typer.Option("--cluster-timeout", help="Time each cluster has to answer with --cluster or --all-clusters, in seconds", min=0.1)
+    ] = DEFAULT_CLUSTER_TIMEOUT,
+    profile: Annotated[
+        Optional[ProfileMode], typer.Option("--profile", envvar="JARVICE_CLI_PROFILE", help="Run the command under cProfile (cpu) or tracemalloc (mem)")
+    ] = None,
+    profile_out: Annotated[
+        Optional[Path], typer.Option("--profile-out", envvar="JARVICE_CLI_PROFILE_OUT", help="File the profile is written to [default: <cache>/profiles/<command>-<date>-<pid>.pstats|snapshot]", dir_okay=False)
+    ] = None,
+    profile_top: Annotated[
+        int, typer.Option("--profile-top", envvar="JARVICE_CLI_PROFILE_TOP", help="Number of functions or allocation sites printed on stderr", min=0)
+    ] = DEFAULT_PROFILE_TOP,
 ):
 
+    setupStart = perf_counter()
+    # The agent and the shell run several commands in this process: values
+    # of a previous command must not be used by the next one
+    api_values.clear()
+    if ctx.invoked_subcommand in ("agent", "shell"):
+        # The agent and the shell open a session per command, with the settings of the command
+        return
     if not any([x in sys.argv for x in ctx.help_option_names]):
-        getEnvValue("username", username, "JARVICE_USER")
-        getEnvValue("apikey", apikey, "JARVICE_API_KEY")
-        getEnvValue("url", url, "JARVICE_API_URL")
-        global jarvice_api
-        jarvice_api = jarviceapi(api_values["username"], api_values["apikey"], api_values["url"])
+        if profile is not None:
+            path = profile_out if profile_out is not None else profilePath(profile, ctx.invoked_subcommand or "command")
+            profiler = Profiler(profile, path, profile_top)
+            profiler.start()
+            # Registered first, so the profile covers the close callbacks too
+            ctx.call_on_close(lambda: finishProfile(profiler))
+        if show_timings or trace is not None:
+            tracer = timingsModule.start()
+            if agent_sessions is None:
+                # In the agent, the CLI was imported by an earlier command
+                tracer.add("imports", "import", IMPORT_START, setupStart)
+            # Runs after the close callbacks of the session
+            ctx.call_on_close(lambda: finishTimings(show_timings, trace))
+        if record is not None and replay is not None:
+            raise typer.BadParameter("--record and --replay both specified. Specify only one")
+        for argName, argValue, envVarName in (("username", username, "JARVICE_USER"),
+                                              ("apikey", apikey, "JARVICE_API_KEY"),
+                                              ("url", url, "JARVICE_API_URL")):
+            try:
+                getEnvValue(argName, argValue, envVarName)
+            except typer.BadParameter:
+                if replay is None:
+                    raise
+            if replay is not None:
+                # Credentials are redacted from cassettes, any value matches
+                api_values.setdefault(argName, "http://replay/api/" if argName == "url" else "replay")
+        try:
+            getEnvValue("storage_url", storage_url, "JARVICE_STORAGE_URL")
+        except typer.BadParameter:
+            # Only needed by download and upload
+            pass
+        policy = loadPolicy({"retries": retries, "request_timeout": timeout, "deadline": deadline,
+                             "rate": rate_limit, "breaker_threshold": breaker_threshold,
+                             "breaker_cooldown": breaker_cooldown})
+        session_settings.update(pool_size=pool_size, cache_ttl=cache_ttl, history=history, policy=policy,
+                                cluster_timeout=cluster_timeout)
+        global jarvice_api, job_history, name_index
+        if agent_sessions is not None and record is None and replay is None:
+            # Running in the agent: the session of these settings outlives the command
+            key = (api_values["url"], api_values["username"], api_values["apikey"], api_values.get("storage_url"),
+                   pool_size, cache_ttl, history, str(cacheDir()), policy.key())
+            if key not in agent_sessions:
+                agent_sessions[key] = openSession(pool_size, cache_ttl, history, agent_jobs_ttl, policy)
+            jarvice_api, job_history, name_index = agent_sessions[key]
+            ctx.call_on_close(name_index.save)
+            traceCommand(ctx, setupStart)
+            return
+        jarvice_api, job_history, name_index = openSession(pool_size, cache_ttl, history, policy=policy)
+        if job_history is not None:
+            ctx.call_on_close(job_history.close)
+        if record is not None or replay is not None:
+            from jarvice_cli.transport import Player, Recorder
+
+            cassette = Recorder(record) if record is not None else Player(replay, replay_scale)
+            jarvice_api.addTransport(cassette.wrap)
+            ctx.call_on_close(cassette.close)
+        ctx.call_on_close(jarvice_api.close)
+        traceCommand(ctx, setupStart)
+
+@jarvice_cli.command()
+def agent(
+    stop: Annotated[Optional[bool], typer.Option("--stop",help="Stop the running agent")] = False,
+    status: Annotated[Optional[bool], typer.Option("--status",help="Show whether the agent is running")] = False,
+    detach: Annotated[Optional[bool], typer.Option("-d", "--detach",help="Run in the background")] = False,
+    idle_timeout: Annotated[float, typer.Option("--idle-timeout",help="Exit after this many seconds without commands (0 to never exit)", min=0)] = 0,
+    jobs_ttl: Annotated[float, typer.Option("--jobs-ttl",help="Time the job list is reused for between commands, in seconds", min=0)] = DEFAULT_AGENT_JOBS_TTL,
+):
+    """
+    Run the agent that jarvice-cli commands are forwarded to\n
+    The agent keeps sessions, connections and caches between commands. Commands
+    run without it when it is not running.
+    """
+    from jarvice_cli import agent as agentModule
+
+    path = agentModule.socketPath()
+    if stop or status:
+        reply = agentModule.control("stop" if stop else "status", path)
+        if reply is None:
+            print(f"No agent listening on {path}")
+            raise typer.Exit(code=1)
+        for k,v in reply.items():
+            print(f"{k}: {v}")
+        return
+    try:
+        agentModule.Agent(path, idle_timeout, jobs_ttl).serve(detach=bool(detach))
+    except OSError as e:
+        print(f"Error : {e}")
+        raise typer.Exit(code=1)
+
+@jarvice_cli.command()
+def shell(
+    jobs_ttl: Annotated[float, typer.Option("--jobs-ttl",help="Time the job list is reused for between commands, in seconds", min=0)] = DEFAULT_AGENT_JOBS_TTL,
+):
+    """
+    Run commands interactively in one session\n
+    The global options given before shell apply to every command. Connections,
+    caches and the job list are kept between commands, and Tab completes
+    commands, options, job numbers and job names.
+    """
+    global agent_sessions, agent_jobs_ttl
+    from jarvice_cli.shell import Shell, shellPrefix
+
+    agent_sessions = {}
+    agent_jobs_ttl = jobs_ttl
+    command = typer.main.get_command(jarvice_cli)
+    try:
+        code = Shell(command, shellPrefix(sys.argv[1:]), lambda: list((agent_sessions or {}).values())).run()
+    finally:
+        for api, job_history, names in agent_sessions.values():
+            api.close()
+            if job_history is not None:
+                job_history.close()
+        agent_sessions = None
+    raise typer.Exit(code=code)
 
 ## Interacting with jobs ##
 
 @jarvice_cli.command()
 def submit(
     job_json: Annotated[
-        Path,
+        List[str],
         typer.Argument(
-            help="json file with job submission",
-            exists=True,
-            readable=True,
-            dir_okay=False,
-            file_okay=True,
-            resolve_path=True,
+            help="json file with job submission, or JSONL file, directory, glob pattern or - (JSONL from stdin) for a batch",
         ),
     ],
+    param: Annotated[Optional[List[str]], typer.Option("-P", "--param",help="Sweep parameter NAME=v1,v2,... substituted for ${NAME}, repeatable")] = None,
+    journal: Annotated[Optional[Path], typer.Option("--journal",help="Journal of submitted jobs, to resume an interrupted batch", dir_okay=False, resolve_path=True)] = None,
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of submissions in flight", min=1)] = DEFAULT_MAX_PARALLEL,
+    rate: Annotated[Optional[float], typer.Option("--rate",help="Maximum number of submissions per second", min=0.001)] = None,
+    machine: Annotated[Optional[str], typer.Option("--machine",help="Machine type of every submission, instead of the one of the json")] = None,
     raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
-    Submit a job
+    Submit a job, or a batch of jobs
     """
+    if raw:
+        printer = GenPrinter()
+    else:
+        printer = RichPrinter()
+    single = len(job_json) == 1 and Path(job_json[0]).is_file() and Path(job_json[0]).suffix != ".jsonl"
+    if single and not param and journal is None:
+        try:
+            if machine is not None:
+                import json
+                from jarvice_cli.batch import withMachine
+
+                with open(job_json[0]) as job_json_hd:
+                    retDict = jarvice_api.submitDict(withMachine(json.load(job_json_hd), machine))
+            else:
+                retDict = jarvice_api.submitJsonFile(Path(job_json[0]).resolve())
+            printer.newField("ID", str(retDict['number']))
+            printer.newField("Name", str(retDict['name']))
+            printer.flushField("Submitted")
+        except jarviceapi_client.OpenApiException as e:
+            print(f"Error : {e}")
+        return
+
+    from jarvice_cli.batch import BatchJournal, expandTemplates, iterSources, parseParams, setMachine, submitBatch
+
     try:
-        retDict = jarvice_api.submitJsonFile(job_json)
-        if raw:
-            printer = GenPrinter()
-        else:
-            printer = RichPrinter()
-        printer.newField("ID", str(retDict['number']))
-        printer.newField("Name", str(retDict['name']))
-        printer.flushField("Submitted")
-    except jarviceapi_client.OpenApiException as e:
+        grid = parseParams(param or [])
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    submitted = skipped = failed = 0
+    batchJournal = BatchJournal(journal) if journal is not None else None
+    try:
+        submissions = expandTemplates(iterSources(job_json), grid)
+        if machine is not None:
+            submissions = setMachine(submissions, machine)
+        for result in submitBatch(jarvice_api, submissions, batchJournal, max_parallel, rate):
+            printer.printSubmitResult(result)
+            if result.error is not None:
+                failed += 1
+            elif result.skipped:
+                skipped += 1
+            else:
+                submitted += 1
+    except (OSError, UnicodeDecodeError) as e:
         print(f"Error : {e}")
+    finally:
+        if batchJournal is not None:
+            batchJournal.close()
+    printer.printBatchSummary(submitted, skipped, failed)
 
 @jarvice_cli.command()
 def tail(
@@ -108,7 +465,10 @@ def tail(
     jobname: Annotated[Optional[str], typer.Option("-n", "--jobname",help="Name of the job [required or --jobid required]")] = None,
     lines: Annotated[
         Optional[int], typer.Option("-l", "--lines",  help="Number of lines to display")
-    ] = 0
+    ] = 0,
+    follow: Annotated[
+        Optional[bool], typer.Option("-f", "--follow",  help="Keep printing new output until the job ends")
+    ] = False
 ):
     """
     See the output/error of a currently running job
@@ -118,7 +478,13 @@ def tail(
     try:
         if lines is None:
             lines = 0
-        if jobid is not None:
+        if follow:
+            try:
+                for line in jarvice_api.follow(jobid if jobid is not None else jobname, lines or DEFAULT_FOLLOW_LINES):
+                    print(line, flush=True)
+            except KeyboardInterrupt:
+                pass
+        elif jobid is not None:
             print(jarvice_api.tail(jobid, lines))
         elif jobname is not None:
             print(jarvice_api.tail(jobname, lines))
@@ -238,12 +604,23 @@ def info(
 def status(
     jobid: Annotated[Optional[int], typer.Option("-j", "--jobid",help="ID of the job [required or --jobname required]")] = None,
     jobname: Annotated[Optional[str], typer.Option("-n", "--jobname",help="Name of the job [required or --jobid required]")] = None,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output, dotted for nested fields (e.g. job_api_submission.machine.type)")] = None,
+    cluster: Annotated[Optional[str], typer.Option("--cluster",help="Query these clusters of ~/.jarvice.cfg concurrently (comma separated section names)")] = None,
+    all_clusters: Annotated[Optional[bool], typer.Option("--all-clusters",help="Query every cluster of ~/.jarvice.cfg concurrently")] = False,
     raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
     Get status of a job
     """
     validateJobidJobname(jobid, jobname)
+    printer = getPrinter(raw, output, fields)
+    federation = openFederation(cluster, all_clusters)
+    if federation is not None:
+        job = jobid if jobid is not None else jobname
+        runFederated(federation, printer, lambda api: api.status(job),
+                     lambda entry: [printer.printSchedStatusEntry(int(k), v) for k,v in entry.items()])
+        return
     try:
         if jobid is not None:
             entry = jarvice_api.status(jobid)
@@ -251,11 +628,7 @@ def status(
             entry = jarvice_api.status(jobname)
         else:
             return
-        if raw:
-            printer = GenPrinter()
-        else:
-            printer = RichPrinter()
-        
+
         for k,v in entry.items():
             printer.printSchedStatusEntry(int(k),v)
 
@@ -291,6 +664,20 @@ def action(
 @jarvice_cli.command()
 def jobs(
     verbose: Annotated[Optional[bool], typer.Option("-v", "--verbose",help="Full JSON payload")] = False,
+    status: Annotated[Optional[List[str]], typer.Option("-s", "--status",help="Only jobs with this status or short status (R, PD...), repeatable")] = None,
+    app: Annotated[Optional[str], typer.Option("-a", "--app",help="Only jobs of this app")] = None,
+    name: Annotated[Optional[str], typer.Option("--name",help="Only jobs whose name matches this regex")] = None,
+    user: Annotated[Optional[str], typer.Option("--user",help="Only jobs owned by this user")] = None,
+    machine: Annotated[Optional[str], typer.Option("-m", "--machine",help="Only jobs submitted to this machine type")] = None,
+    since: Annotated[Optional[str], typer.Option("--since",help="Only jobs submitted since this time (e.g. 2h, 1d, 2024-05-01)")] = None,
+    until: Annotated[Optional[str], typer.Option("--until",help="Only jobs submitted before this time (e.g. 2h, 1d, 2024-05-01)")] = None,
+    sort: Annotated[Optional[str], typer.Option("--sort",help=f"Sort jobs by {', '.join(SORT_KEYS)}")] = None,
+    reverse: Annotated[Optional[bool], typer.Option("-r", "--reverse",help="Sort in descending order")] = False,
+    limit: Annotated[Optional[int], typer.Option("-l", "--limit",help="Print at most this number of jobs", min=0)] = None,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output, dotted for nested fields (e.g. job_api_submission.machine.type)")] = None,
+    cluster: Annotated[Optional[str], typer.Option("--cluster",help="Query these clusters of ~/.jarvice.cfg concurrently (comma separated section names)")] = None,
+    all_clusters: Annotated[Optional[bool], typer.Option("--all-clusters",help="Query every cluster of ~/.jarvice.cfg concurrently")] = False,
     raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
     ):
     """
@@ -304,101 +691,311 @@ def jobs(
     ST 	A running job has been canceled or terminated.\n
     UN 	Unknown status.
     """
+    jobFilter = None
+    if any(x is not None for x in (status, app, name, user, machine, since, until)):
+        jobFilter = buildJobFilter(status, app, name, user, None, machine, since, until)
+    if sort is not None and sort not in SORT_KEYS:
+        raise typer.BadParameter(f"Invalid sort key '{sort}' (expected one of {', '.join(SORT_KEYS)})")
+    printer = getPrinter(raw, output, fields)
+    federation = openFederation(cluster, all_clusters)
+    if federation is not None:
+        runFederated(federation, printer, lambda api: sortJobs(api.jobs(jobFilter), sort, bool(reverse), limit),
+                     lambda joblist: printer.printJobEntry(joblist, bool(verbose)))
+        return
     try:
         if verbose is None:
             verbose = False
-        if raw:
-            printer = GenPrinter()
-        else:
-            printer = RichPrinter()
 
-        joblist = jarvice_api.jobs()
+        # Filtered, sorted and truncated before the printers format anything
+        joblist = sortJobs(jarvice_api.jobs(jobFilter), sort, bool(reverse), limit)
         printer.printJobEntry(joblist, verbose)
     except jarviceapi_client.OpenApiException as e:
         print(f"Error : {e}")
 
 @jarvice_cli.command()
-def shutdown_all():
+def top(
+    interval: Annotated[float, typer.Option("-i", "--interval",help="Time between two polls, in seconds", min=0.5)] = 2.0,
+    status: Annotated[Optional[str], typer.Option("-s", "--status",help="Only show jobs with this short status (R, PD, CD, F, ST, CG)")] = None,
+    sort: Annotated[str, typer.Option("--sort",help=f"Sort jobs by {', '.join(SORT_KEYS)}")] = "number",
+    reverse: Annotated[Optional[bool], typer.Option("-r", "--reverse",help="Sort in descending order")] = False,
+):
+    """
+    Live view of the jobs, updated as they change\n
+    Keys: q quit, s sort, r reverse, f status filter, / name regex, c clear filters.
+    """
+    if sort not in SORT_KEYS:
+        raise typer.BadParameter(f"Invalid sort key '{sort}' (expected one of {', '.join(SORT_KEYS)})")
+    if status is not None:
+        status = status.strip().upper()
+        if status not in STATUS_CODES:
+            raise typer.BadParameter(f"Invalid status '{status}' (expected one of {', '.join(STATUS_CODES)})")
+    from jarvice_cli.top import JobsTop
+
+    JobsTop(jarvice_api, interval, sort, bool(reverse), status).run()
+
+@jarvice_cli.command()
+def history(
+    status: Annotated[Optional[List[str]], typer.Option("-s", "--status",help="Only jobs with this status or short status (R, PD...), repeatable")] = None,
+    app: Annotated[Optional[str], typer.Option("-a", "--app",help="Only jobs of this app")] = None,
+    name: Annotated[Optional[str], typer.Option("--name",help="Only jobs whose name matches this regex (e.g. '^train-')")] = None,
+    user: Annotated[Optional[str], typer.Option("--user",help="Only jobs owned by this user")] = None,
+    machine: Annotated[Optional[str], typer.Option("-m", "--machine",help="Only jobs submitted to this machine type")] = None,
+    since: Annotated[Optional[str], typer.Option("--since",help="Only jobs submitted since this time (e.g. 2h, 1d, 2024-05-01)")] = None,
+    until: Annotated[Optional[str], typer.Option("--until",help="Only jobs submitted before this time (e.g. 2h, 1d, 2024-05-01)")] = None,
+    sort: Annotated[Optional[str], typer.Option("--sort",help="Sort jobs by number, name, app, user, status, submitted, machine, queue or compute (newest first by default)")] = None,
+    reverse: Annotated[Optional[bool], typer.Option("-r", "--reverse",help="Sort in descending order")] = False,
+    limit: Annotated[int, typer.Option("-l", "--limit",help="Print at most this number of jobs (0 for all)", min=0)] = DEFAULT_HISTORY_LIMIT,
+    offset: Annotated[int, typer.Option("--offset",help="Skip this number of jobs, to page through the history", min=0)] = 0,
+    summary: Annotated[Optional[str], typer.Option("--summary",help="Number of jobs, queue and compute time per status, app, user, machine or day")] = None,
+    verbose: Annotated[Optional[bool], typer.Option("-v", "--verbose",help="Full JSON payload")] = False,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output, dotted for nested fields (e.g. job_api_submission.machine.type)")] = None,
+    sync: Annotated[Optional[bool], typer.Option("--sync",help="First list the jobs and request the final status of the jobs that left the list")] = False,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
+):
+    """
+    Query the local history of jobs, without contacting Jarvice XE unless --sync\n
+    Every job listed by jobs (and by the commands that list jobs) is kept in it.
+    """
+    from jarvice_cli.history import HISTORY_GROUPS, HISTORY_SORT_KEYS
+    import sqlite3
+
+    if sort is not None and sort not in HISTORY_SORT_KEYS:
+        raise typer.BadParameter(f"Invalid sort key '{sort}' (expected one of {', '.join(HISTORY_SORT_KEYS)})")
+    if summary is not None and summary not in HISTORY_GROUPS:
+        raise typer.BadParameter(f"Invalid summary '{summary}' (expected one of {', '.join(HISTORY_GROUPS)})")
+    try:
+        if name is not None:
+            re.compile(name)
+        filters = dict(status=status, app=app, name=name, user=user, machine=machine,
+                       since=parseTime(since) if since is not None else None,
+                       until=parseTime(until) if until is not None else None)
+    except (ValueError, re.error) as e:
+        raise typer.BadParameter(str(e))
+    printer = getPrinter(raw, output, fields)
+    if sync:
+        if job_history is None:
+            raise typer.BadParameter("--sync requires the history, remove --no-history")
+        try:
+            jarvice_api.syncHistory()
+        except (jarviceapi_client.OpenApiException, OSError, sqlite3.Error) as e:
+            print(f"Error : {e}")
+            return
+    store = job_history
+    if store is None:
+        store = JobHistory.forEndpoint(api_values["url"], api_values["username"])
+    try:
+        if summary is not None:
+            printer.printHistorySummary(summary, store.summary(summary, **filters))
+        else:
+            joblist = dict(store.query(sort, bool(reverse), limit or None, offset, **filters))
+            printer.printJobEntry(joblist, bool(verbose))
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error : {e}")
+    finally:
+        if store is not job_history:
+            store.close()
+
+@jarvice_cli.command()
+def names(
+    jobname: Annotated[Optional[str], typer.Option("-n", "--jobname",help="Only this job name")] = None,
+    clear: Annotated[Optional[bool], typer.Option("--clear",help="Remove the name (or every name) from the index")] = False,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
+):
+    """
+    Show or clear the local index of job names\n
+    Job names given to other commands are looked up in it to call Jarvice XE by job number.
+    It is filled in by submit, jobs and status.
+    """
+    if clear:
+        name_index.clear(jobname)
+        return
+    items = name_index.items()
+    if jobname is not None:
+        items = [(name, number) for name, number in items if name == jobname]
+    if raw:
+        printer = GenPrinter()
+    else:
+        printer = RichPrinter()
+    printer.printNames(items)
+
+def buildJobFilter(status : Optional[List[str]], app : Optional[str], name : Optional[str],
+                   user : Optional[str], older_than : Optional[str], machine : Optional[str] = None,
+                   since : Optional[str] = None, until : Optional[str] = None):
+    try:
+        return JobFilter(status=status, app=app, name=name, user=user,
+                         older_than=parseDuration(older_than) if older_than is not None else None,
+                         machine=machine,
+                         since=parseTime(since) if since is not None else None,
+                         until=parseTime(until) if until is not None else None)
+    except (ValueError, re.error) as e:
+        raise typer.BadParameter(str(e))
+
+@jarvice_cli.command()
+def shutdown_all(
+    status: Annotated[Optional[List[str]], typer.Option("-s", "--status",help="Only jobs with this status or short status (R, PD...), repeatable")] = None,
+    app: Annotated[Optional[str], typer.Option("-a", "--app",help="Only jobs of this app")] = None,
+    name: Annotated[Optional[str], typer.Option("--name",help="Only jobs whose name matches this regex")] = None,
+    user: Annotated[Optional[str], typer.Option("--user",help="Only jobs owned by this user")] = None,
+    older_than: Annotated[Optional[str], typer.Option("--older-than",help="Only jobs submitted at least this long ago (e.g. 30m, 2h, 1d)")] = None,
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of requests in flight", min=1)] = DEFAULT_MAX_PARALLEL,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
+):
     """
     Cleanly shutdown all currently running jobs
     """
+    jobFilter = buildJobFilter(status, app, name, user, older_than)
     try:
-        jarvice_api.shutdown_all()
+        results = jarvice_api.shutdown_all(jobFilter, max_parallel)
+        if raw:
+            printer = GenPrinter()
+        else:
+            printer = RichPrinter()
+        printer.printBulkResults("Shutdown", results)
     except jarviceapi_client.OpenApiException as e:
         print(f"Error : {e}")
 
 @jarvice_cli.command()
-def terminate_all():
+def terminate_all(
+    status: Annotated[Optional[List[str]], typer.Option("-s", "--status",help="Only jobs with this status or short status (R, PD...), repeatable")] = None,
+    app: Annotated[Optional[str], typer.Option("-a", "--app",help="Only jobs of this app")] = None,
+    name: Annotated[Optional[str], typer.Option("--name",help="Only jobs whose name matches this regex")] = None,
+    user: Annotated[Optional[str], typer.Option("--user",help="Only jobs owned by this user")] = None,
+    older_than: Annotated[Optional[str], typer.Option("--older-than",help="Only jobs submitted at least this long ago (e.g. 30m, 2h, 1d)")] = None,
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of requests in flight", min=1)] = DEFAULT_MAX_PARALLEL,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
+):
     """
     Force termination of all jobs (like kill -9)
     """
+    jobFilter = buildJobFilter(status, app, name, user, older_than)
     try:
-        jarvice_api.terminate_all()
+        results = jarvice_api.terminate_all(jobFilter, max_parallel)
+        if raw:
+            printer = GenPrinter()
+        else:
+            printer = RichPrinter()
+        printer.printBulkResults("Terminate", results)
     except jarviceapi_client.OpenApiException as e:
         print(f"Error : {e}")
 
 @jarvice_cli.command()
 def wait_for(
-    jobid: Annotated[Optional[int], typer.Option("-j", "--jobid",help="ID of the job [required or --jobname required]")] = None,
-    jobname: Annotated[Optional[str], typer.Option("-n", "--jobname",help="Name of the job [required or --jobid required]")] = None,
+    jobid: Annotated[Optional[List[int]], typer.Option("-j", "--jobid",help="ID of a job, repeatable [required or --jobname or a selector required]")] = None,
+    jobname: Annotated[Optional[List[str]], typer.Option("-n", "--jobname",help="Name of a job, repeatable [required or --jobid or a selector required]")] = None,
+    status: Annotated[Optional[List[str]], typer.Option("-s", "--status",help="Select current jobs with this status or short status (R, PD...), repeatable")] = None,
+    app: Annotated[Optional[str], typer.Option("-a", "--app",help="Select current jobs of this app")] = None,
+    name_regex: Annotated[Optional[str], typer.Option("--name-regex",help="Select current jobs whose name matches this regex")] = None,
+    user: Annotated[Optional[str], typer.Option("--user",help="Select current jobs owned by this user")] = None,
+    wait_all: Annotated[bool, typer.Option("--all/--any",help="Wait for all jobs to end, or for the first one")] = True,
+    min_interval: Annotated[float, typer.Option("--min-interval",help="Shortest time between polls, in seconds", min=0.1)] = DEFAULT_MIN_POLL_INTERVAL,
+    max_interval: Annotated[float, typer.Option("--max-interval",help="Longest time between polls, in seconds", min=0.1)] = DEFAULT_MAX_POLL_INTERVAL,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
-    Wait for a job to end
+    Wait for jobs to end\n
+    Prints the status of every job and exits with code 1 if one of them ended without completing.
     """
-    validateJobidJobname(jobid, jobname)
-    try:        
-        if jobid is not None:
-            jarvice_api.wait_for(jobid)
-        elif jobname is not None:
-            jarvice_api.wait_for(jobname)
+    jobFilter = None
+    if any(x is not None for x in (status, app, name_regex, user)):
+        jobFilter = buildJobFilter(status, app, name_regex, user, None)
+    elif not jobid and not jobname:
+        raise typer.BadParameter("Define jobid, jobname or a selector (--status, --app, --name-regex, --user)")
+    try:
+        entries = jarvice_api.wait_for(list(jobid or []) + list(jobname or []), jobFilter, wait_all,
+                                       min_interval, max(min_interval, max_interval))
+        if raw:
+            printer = GenPrinter()
+        else:
+            printer = RichPrinter()
+        printer.printJobStatuses(entries)
+        if any(v.job_status in TERMINAL_STATUSES and v.job_status != "COMPLETED" for v in entries.values()):
+            raise typer.Exit(code=1)
     except jarviceapi_client.OpenApiException as e:
         print(f"Error : {e}")
 
 
 ## Data Management ##
 
-#@jarvice_cli.command()
+def runTransfer(action : str, transfer, raw : Optional[bool]):
+    """
+    Runs an upload or a download, showing its progress and summary
+    """
+    from jarvice_cli.vault import VaultError
+
+    printer = getPrinter(raw)
+    try:
+        stats = transfer(printer.printTransferProgress)
+    except (ValueError, OSError, VaultError, jarviceapi_client.OpenApiException) as e:
+        print(f"Error : {e}")
+        raise typer.Exit(code=1)
+    printer.printTransferSummary(action, stats)
+    if stats.failed:
+        raise typer.Exit(code=1)
+
+@jarvice_cli.command()
 def download(
     source: Annotated[str, typer.Argument(help="File/directory to download")],
     destination: Annotated[str, typer.Argument(help="File/directory destination")],
     storage : Annotated[str, typer.Argument(help="vault name")],
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of chunks in flight", min=1)] = DEFAULT_MAX_PARALLEL,
+    chunk_size: Annotated[Optional[int], typer.Option("--chunk-size",help="Size of the chunks large files are split in, in MiB [default: 8]", min=1)] = None,
+    checksum: Annotated[Optional[bool], typer.Option("--checksum",help="Compare files by SHA256 instead of size and time, and verify them")] = False,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
-    Download file or directory 
+    Download file or directory, skipping files already in sync and resuming interrupted downloads
     """
-    try:        
-        jarvice_api.download(source, destination, storage)
-    except Exception as e:
-        print(e)
+    runTransfer("Download", lambda progress: jarvice_api.download(source, destination, storage, max_parallel,
+                                                                  chunk_size and chunk_size * 1024 * 1024, bool(checksum), progress), raw)
 
-#@jarvice_cli.command()
+@jarvice_cli.command()
 def upload(
     source: Annotated[str, typer.Argument(help="File/directory to upload")],
     destination: Annotated[str, typer.Argument(help="File/directory destination")],
     storage : Annotated[str, typer.Argument(help="vault name")],
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of chunks in flight", min=1)] = DEFAULT_MAX_PARALLEL,
+    chunk_size: Annotated[Optional[int], typer.Option("--chunk-size",help="Size of the chunks large files are split in, in MiB [default: 8]", min=1)] = None,
+    checksum: Annotated[Optional[bool], typer.Option("--checksum",help="Compare files by SHA256 instead of size and time, and verify them")] = False,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
-    Upload file or directory 
+    Upload file or directory, skipping files already in sync and resuming interrupted uploads
     """
-    try:        
-        jarvice_api.upload(source, destination, storage)
-    except Exception as e:
-        print(e)
+    runTransfer("Upload", lambda progress: jarvice_api.upload(source, destination, storage, max_parallel,
+                                                              chunk_size and chunk_size * 1024 * 1024, bool(checksum), progress), raw)
 
-#@jarvice_cli.command()
+@jarvice_cli.command()
 def ls(
     storage : Annotated[str, typer.Argument(help="vault name")],
     remote_dir: Annotated[
         Optional[str], typer.Option("-d", help="Remote directory")
     ] = None,
+    recursive: Annotated[Optional[bool], typer.Option("-R", "--recursive",help="List subdirectories too")] = False,
+    long: Annotated[Optional[bool], typer.Option("-l", "--long",help="Type, size and modification time of the files")] = False,
+    max_parallel: Annotated[int, typer.Option("-p", "--max-parallel",help="Maximum number of directories listed at once with -R", min=1)] = DEFAULT_MAX_PARALLEL,
+    cached: Annotated[Optional[bool], typer.Option("--cached",help="Use the listing cached by an earlier ls if still valid (see --cache-ttl)")] = False,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output (path, is_dir, size, mtime, etag)")] = None,
+    raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
     List files
     """
-    try:        
-        jarvice_api.ls(storage, remote_dir)
-    except Exception as e:
-        print(e)
+    from jarvice_cli.vault import VaultError, joinPath
+
+    printer = getPrinter(raw, output, fields)
+    errors = []
+    try:
+        entries = jarvice_api.ls(storage, remote_dir, bool(recursive), max_parallel, bool(cached), errors)
+        printer.printVaultEntries(entries, joinPath(remote_dir or "/"), bool(long))
+    except (ValueError, VaultError, jarviceapi_client.OpenApiException) as e:
+        print(f"Error : {e}")
+        raise typer.Exit(code=1)
+    for directory, error in errors:
+        print(f"{directory}: Error : {printer.errorSummary(error)}", file=sys.stderr)
+    if errors:
+        raise typer.Exit(code=1)
 
 ## Querying JARVICE Options ##
 
@@ -406,24 +1003,36 @@ def ls(
 def apps(
     appname: Annotated[Optional[str], typer.Option("-n", "--name",help="Name of the app to ")] = None,
     verbose: Annotated[Optional[bool], typer.Option("-v", "--verbose",help="Full JSON payload")] = False,
+    refresh: Annotated[Optional[bool], typer.Option("--refresh",help="Download the catalog again instead of using the cache")] = False,
+    offline: Annotated[Optional[bool], typer.Option("--offline",help="Only use the cached catalog, even if expired")] = False,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output, dotted for nested fields (e.g. job_api_submission.machine.type)")] = None,
+    cluster: Annotated[Optional[str], typer.Option("--cluster",help="Query these clusters of ~/.jarvice.cfg concurrently (comma separated section names)")] = None,
+    all_clusters: Annotated[Optional[bool], typer.Option("--all-clusters",help="Query every cluster of ~/.jarvice.cfg concurrently")] = False,
     raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
 ):
     """
     List apps and gives a schema describing AppDef
     """
+    printer = getPrinter(raw, output, fields)
+    federation = openFederation(cluster, all_clusters)
+    if federation is not None:
+        if appname:
+            runFederated(federation, printer, lambda api: api.app(appname, refresh, offline),
+                         lambda app: [printer.printApp(v, bool(verbose)) for v in app.values()])
+        else:
+            runFederated(federation, printer, lambda api: api.apps(refresh, offline),
+                         lambda apps: printer.printApps(apps, bool(verbose)))
+        return
     try:
         if verbose is None:
             verbose = False
-        if raw:
-            printer = GenPrinter()
-        else:
-            printer = RichPrinter()
         if appname:        
-            app = jarvice_api.app(appname)
+            app = jarvice_api.app(appname, refresh, offline)
             for _,v in app.items():
                 printer.printApp(v, verbose)
         else:
-            apps = jarvice_api.apps()
+            apps = jarvice_api.apps(refresh, offline)
             printer.printApps(apps, verbose)
 
     except jarviceapi_client.OpenApiException as e:
@@ -431,17 +1040,24 @@ def apps(
 
 @jarvice_cli.command()
 def machines(
+    refresh: Annotated[Optional[bool], typer.Option("--refresh",help="Download the list again instead of using the cache")] = False,
+    offline: Annotated[Optional[bool], typer.Option("--offline",help="Only use the cached list, even if expired")] = False,
+    output: Annotated[Optional[OutputFormat], typer.Option("-o", "--output",help="One record per line, for scripts")] = None,
+    fields: Annotated[Optional[str], typer.Option("--fields",help="Comma separated fields to print with --output, dotted for nested fields (e.g. job_api_submission.machine.type)")] = None,
+    cluster: Annotated[Optional[str], typer.Option("--cluster",help="Query these clusters of ~/.jarvice.cfg concurrently (comma separated section names)")] = None,
+    all_clusters: Annotated[Optional[bool], typer.Option("--all-clusters",help="Query every cluster of ~/.jarvice.cfg concurrently")] = False,
     raw : Annotated[Optional[bool], typer.Option("--no-rich",help="Without color")] = False
     ):
     """
     List all instances
     """
+    printer = getPrinter(raw, output, fields)
+    federation = openFederation(cluster, all_clusters)
+    if federation is not None:
+        runFederated(federation, printer, lambda api: api.machines(refresh, offline), printer.printMachines)
+        return
     try:
-        if raw:
-            printer = GenPrinter()
-        else:
-            printer = RichPrinter()        
-        printer.printMachines(jarvice_api.machines())
+        printer.printMachines(jarvice_api.machines(refresh, offline))
     except jarviceapi_client.OpenApiException as e:
         print(f"Error : {e}")
 
@@ -0,0 +1,437 @@
+from __future__ import annotations
+import os
+import struct
+import sys
+import time
+
+# This module is the entry point of every command, so it only imports what
+# forwarding a command needs: json, threading and typing load in about as
+# much time as the whole forwarded command takes. socket is imported on
+# connection, shell completion doesn't need it.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import socket
+    from typing import Any, Dict, List, Optional, Tuple
+
+# Commands always run directly: they read the terminal or stdin, or run until stopped
+DIRECT_COMMANDS = ("agent", "shell", "top", "wait-for")
+
+# Environment variables of the command sent to the agent
+FORWARDED_ENV = ("JARVICE_USER", "JARVICE_API_KEY", "JARVICE_API_URL", "JARVICE_CACHE_TTL",
+                 "JARVICE_STORAGE_URL", "JARVICE_CLI_HISTORY", "JARVICE_CLI_CACHE_DIR", "HOME", "XDG_CACHE_HOME",
+                 "COLUMNS", "LINES", "TERM", "COLORTERM", "NO_COLOR", "FORCE_COLOR",
+                 "JARVICE_CLI_PROFILE", "JARVICE_CLI_PROFILE_OUT", "JARVICE_CLI_PROFILE_TOP")
+
+# Set by the shell completion scripts of typer
+COMPLETE_VAR = "_JARVICE_CLI_COMPLETE"
+
+# Time the agent reuses the job list for between commands, in seconds
+DEFAULT_AGENT_JOBS_TTL = 1.0
+
+# Frame types: request, control, stdout, stderr, exit code
+_REQUEST, _CONTROL, _STDOUT, _STDERR, _EXIT = b"r", b"c", b"o", b"e", b"x"
+_HEADER = struct.Struct("!cI")
+
+
+def socketPath() -> str:
+    """
+    Socket of the agent: $JARVICE_CLI_AGENT_SOCKET, else
+    $XDG_RUNTIME_DIR/jarvice-cli/agent.sock, else /tmp/jarvice-cli-<uid>/agent.sock
+    """
+    if os.environ.get("JARVICE_CLI_AGENT_SOCKET"):
+        return os.path.expanduser(os.environ["JARVICE_CLI_AGENT_SOCKET"])
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "jarvice-cli", "agent.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join("/tmp", f"jarvice-cli-{uid}", "agent.sock")
+
+
+def _sendFrame(sock : socket.socket, kind : bytes, payload : bytes):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recvExact(sock : socket.socket, size : int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recvFrame(sock : socket.socket) -> Optional[Tuple[bytes, bytes]]:
+    header = _recvExact(sock, _HEADER.size)
+    if header is None:
+        return None
+    kind, size = _HEADER.unpack(header)
+    payload = _recvExact(sock, size) if size else b""
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def _connect(path : str) -> Optional[socket.socket]:
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forwardable(argv : List[str]) -> bool:
+    """
+    Whether a command can run in the agent. Running directly is always
+    correct, so arguments are matched loosely.
+    """
+    if os.environ.get("JARVICE_CLI_AGENT", "1").lower() in ("0", "false", "no", "off"):
+        return False
+    if any(arg in DIRECT_COMMANDS for arg in argv):
+        return False
+    if "tail" in argv and ("-f" in argv or "--follow" in argv):
+        return False
+    # stdin and cassettes are only available to the process of the command
+    return not any(arg == "-" or arg.startswith(("--record", "--replay")) for arg in argv)
+
+
+def encodeRequest(argv : List[str], env : Dict[str, str], cwd : str, ttyOut : bool, ttyErr : bool) -> bytes:
+    """
+    Encodes a command as NUL separated fields: cwd, tty flags, number of
+    arguments, arguments, then NAME=value environment variables
+    """
+    fields = [cwd, f"{int(ttyOut)}{int(ttyErr)}", str(len(argv))] + list(argv)
+    fields.extend(f"{name}={value}" for name, value in env.items())
+    return "\0".join(fields).encode("utf-8", "surrogateescape")
+
+
+def decodeRequest(payload : bytes) -> Dict[str, Any]:
+    """
+    Decodes a command encoded by encodeRequest
+
+    Raises:
+        ValueError: invalid request
+    """
+    fields = payload.decode("utf-8", "surrogateescape").split("\0")
+    cwd, tty, count = fields[0], fields[1], int(fields[2])
+    argv = fields[3:3 + count]
+    env = dict(field.split("=", 1) for field in fields[3 + count:])
+    return {"argv": argv, "env": env, "cwd": cwd, "tty": [tty[:1] == "1", tty[1:2] == "1"]}
+
+
+def forward(argv : List[str], path : Optional[str] = None) -> Optional[int]:
+    """
+    Runs a command in the agent, writing its output to stdout and stderr
+
+    Returns:
+        code (int) : exit code of the command, None if no agent is running
+    """
+    sock = _connect(path or socketPath())
+    if sock is None:
+        return None
+    env = {name: os.environ[name] for name in FORWARDED_ENV if name in os.environ}
+    if sys.stdout.isatty() and "COLUMNS" not in env:
+        # Shells rarely export the terminal size, rich would measure the terminal of the agent
+        try:
+            size = os.get_terminal_size(sys.stdout.fileno())
+            env["COLUMNS"], env["LINES"] = str(size.columns), str(size.lines)
+        except OSError:
+            pass
+    request = encodeRequest(argv, env, os.getcwd(), sys.stdout.isatty(), sys.stderr.isatty())
+    try:
+        _sendFrame(sock, _REQUEST, request)
+        while True:
+            frame = _recvFrame(sock)
+            if frame is None:
+                # The command may have run, it must not be run again
+                sys.stderr.write("Error : connection to the agent lost\n")
+                return 1
+            kind, payload = frame
+            if kind == _STDOUT:
+                sys.stdout.buffer.write(payload)
+                sys.stdout.buffer.flush()
+            elif kind == _STDERR:
+                sys.stderr.buffer.write(payload)
+                sys.stderr.buffer.flush()
+            elif kind == _EXIT:
+                return int(payload)
+    except BrokenPipeError:
+        return 1
+    except OSError as e:
+        sys.stderr.write(f"Error : connection to the agent lost ({e})\n")
+        return 1
+    finally:
+        sock.close()
+
+
+def control(command : str, path : Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Sends a control command (status, stop) to the agent, None if none is running
+    """
+    sock = _connect(path or socketPath())
+    if sock is None:
+        return None
+    import json
+
+    try:
+        _sendFrame(sock, _CONTROL, command.encode())
+        frame = _recvFrame(sock)
+        return json.loads(frame[1]) if frame is not None else None
+    finally:
+        sock.close()
+
+
+def main():
+    """
+    Entry point of jarvice-cli: forwards the command to the agent if one is
+    running, else runs it in this process. The CLI itself is only imported
+    when the command runs here. Shell completion of job numbers and names,
+    apps and machines is answered from the completion index, without it.
+    """
+    argv = sys.argv[1:]
+    if COMPLETE_VAR in os.environ:
+        from jarvice_cli.completion import complete
+
+        code = complete(os.environ[COMPLETE_VAR])
+        if code is not None:
+            sys.exit(code)
+    elif forwardable(argv):
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+    from jarvice_cli.__main__ import jarvice_cli
+
+    jarvice_cli()
+
+
+class _FrameStream:
+    """
+    Text stream sent to the client as frames, buffered until flush
+    """
+    encoding = "utf-8"
+    errors = "replace"
+
+    def __init__(self, sock : socket.socket, kind : bytes, tty : bool):
+        self._sock = sock
+        self._kind = kind
+        self._tty = tty
+        self._buffer : List[bytes] = []
+        self._size = 0
+        self.buffer = self
+
+    def write(self, data) -> int:
+        size = len(data)
+        if isinstance(data, str):
+            data = data.encode(self.encoding, self.errors)
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= 1 << 16:
+            self.flush()
+        return size
+
+    def flush(self):
+        if self._buffer:
+            payload = b"".join(self._buffer)
+            self._buffer.clear()
+            self._size = 0
+            _sendFrame(self._sock, self._kind, payload)
+
+    def isatty(self) -> bool:
+        return self._tty
+
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return False
+
+    def fileno(self) -> int:
+        import io
+
+        raise io.UnsupportedOperation("fileno")
+
+
+class Agent:
+    """
+    Runs jarvice-cli commands sent over a Unix socket, in one long lived process
+
+    Commands run one at a time in this process, reusing the session (pooled
+    connections, catalogs, job list) opened for their settings by a previous
+    command. Sessions are kept until the agent exits.
+    """
+    def __init__(self, path : str, idle_timeout : float = 0, jobs_ttl : float = DEFAULT_AGENT_JOBS_TTL):
+        """
+        Args:
+            path (str) : socket to listen on
+            idle_timeout (float) : exit after this many seconds without commands, 0 to never exit
+            jobs_ttl (float) : time the job list is reused for between commands, in seconds
+        """
+        self._path = path
+        self._idle_timeout = idle_timeout
+        self._jobs_ttl = jobs_ttl
+        import threading
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._started = time.time()
+        self._last = time.time()
+        self._served = 0
+
+    def _bind(self) -> socket.socket:
+        import socket
+
+        directory = os.path.dirname(self._path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_uid != os.getuid():
+            raise PermissionError(f"{directory} is not owned by the current user")
+        if os.path.exists(self._path):
+            if control("status", self._path) is not None:
+                raise OSError(f"An agent is already listening on {self._path}")
+            # Left by an agent that did not exit cleanly
+            os.unlink(self._path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(self._path)
+        finally:
+            os.umask(umask)
+        server.listen(64)
+        return server
+
+    def serve(self, detach : bool = False):
+        """
+        Serves commands until stopped, idle for idle_timeout, or interrupted
+
+        Raises:
+            OSError: the socket can't be created, or an agent is already running
+        """
+        import socket
+        import jarvice_cli.__main__ as cli
+        import typer.main
+
+        server = self._bind()
+        # Typer builds the click command on every call, build it once
+        self._command = typer.main.get_command(cli.jarvice_cli)
+        if detach:
+            if os.fork() != 0:
+                server.close()
+                print(f"Agent listening on {self._path}")
+                return
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+        else:
+            print(f"Agent listening on {self._path}")
+            sys.stdout.flush()
+        cli.agent_sessions = {}
+        cli.agent_jobs_ttl = self._jobs_ttl
+        server.settimeout(1.0)
+        try:
+            while not self._stopping.is_set():
+                if self._idle_timeout and time.time() - self._last > self._idle_timeout and not self._lock.locked():
+                    break
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                import threading
+
+                threading.Thread(target=self._handle, args=(conn, cli), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+            for api, history, names in cli.agent_sessions.values():
+                api.close()
+                if history is not None:
+                    history.close()
+            cli.agent_sessions = None
+
+    def _handle(self, conn : socket.socket, cli):
+        import json
+
+        try:
+            frame = _recvFrame(conn)
+            if frame is None:
+                return
+            kind, payload = frame
+            if kind == _CONTROL:
+                command = payload.decode()
+                reply = {"pid": os.getpid(), "socket": self._path,
+                         "uptime": round(time.time() - self._started, 1),
+                         "commands": self._served, "sessions": len(cli.agent_sessions or {})}
+                if command == "stop":
+                    self._stopping.set()
+                    reply["stopping"] = True
+                _sendFrame(conn, _EXIT, json.dumps(reply).encode())
+            elif kind == _REQUEST:
+                request = decodeRequest(payload)
+                with self._lock:
+                    code = self._run(conn, cli, request)
+                    self._served += 1
+                    self._last = time.time()
+                _sendFrame(conn, _EXIT, str(code).encode())
+        except (OSError, ValueError, IndexError):
+            # Client gone, or invalid request
+            pass
+        finally:
+            conn.close()
+
+    def _run(self, conn : socket.socket, cli, request : Dict[str, Any]) -> int:
+        """
+        Runs a command as if it had been run by the client, called with the lock held
+        """
+        import traceback
+
+        argv = [str(arg) for arg in request.get("argv", [])]
+        env = request.get("env", {})
+        ttyOut, ttyErr = request.get("tty", [False, False])
+        saved = (sys.argv, sys.stdout, sys.stderr, os.getcwd(),
+                 {name: os.environ.get(name) for name in FORWARDED_ENV + ("JARVICE_CLI_PAGER",)})
+        stdout = _FrameStream(conn, _STDOUT, bool(ttyOut))
+        stderr = _FrameStream(conn, _STDERR, bool(ttyErr))
+        code = 0
+        try:
+            for name in FORWARDED_ENV:
+                if name in env:
+                    os.environ[name] = str(env[name])
+                else:
+                    os.environ.pop(name, None)
+            # The pager would run in the agent, not in the terminal of the client
+            os.environ["JARVICE_CLI_PAGER"] = ""
+            os.chdir(request.get("cwd") or saved[3])
+            sys.argv = ["jarvice-cli"] + argv
+            sys.stdout, sys.stderr = stdout, stderr
+            try:
+                self._command.main(args=argv, prog_name="jarvice-cli")
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    code = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    code = 1
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            stdout.flush()
+            stderr.flush()
+        finally:
+            sys.argv, sys.stdout, sys.stderr = saved[0], saved[1], saved[2]
+            os.chdir(saved[3])
+            for name, value in saved[4].items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        return code
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Iterable, List, Optional
+
+from jarvice_cli.jarviceapi import jarviceapi, DEFAULT_POOL_SIZE
+
+
+class asyncjarviceapi:
+    """
+    Asyncio counterpart of jarviceapi, with the same methods as coroutines,
+    and its generators (follow, ls) as async iterators
+
+    The generated client is synchronous, so requests run on a thread pool
+    as large as the connection pool, all sharing one pooled jarviceapi.
+    Use it as an async context manager:
+
+        async with asyncjarviceapi(username, apikey, url, pool_size=32) as api:
+            statuses = await api.gather(api.status(n) for n in numbers)
+    """
+    _api : jarviceapi
+    _executor : ThreadPoolExecutor
+
+    def __init__(self, username : str, apikey : str, url : str, pool_size : int = DEFAULT_POOL_SIZE,
+                 cache = None, api : Optional[jarviceapi] = None):
+        """
+        Args:
+            username (str) : Jarvice user
+            apikey (str) : API key of the user
+            url (str) : endpoint url, ending with /api/
+            pool_size (int) : maximum number of keep-alive connections and of requests in flight
+            cache (DiskCache) : cache of the apps and machines catalogs, disabled if None
+            api (jarviceapi) : existing client to share, instead of creating one
+        """
+        self._api = api if api is not None else jarviceapi(username, apikey, url, pool_size, cache)
+        self._pool_size = pool_size
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="jarviceapi")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Waits for the requests in flight and closes the pooled connections
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self._api.close()
+
+    @property
+    def api(self) -> jarviceapi:
+        """
+        Underlying synchronous client
+        """
+        return self._api
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def gather(self, aws : Iterable[Awaitable], limit : Optional[int] = None,
+                     return_exceptions : bool = False) -> List[Any]:
+        """
+        Like asyncio.gather, with at most `limit` awaitables running at once
+
+        Args:
+            aws : awaitables, e.g. calls to the methods of this class
+            limit (int) : defaults to the pool size
+            return_exceptions (bool) : return exceptions as results instead of raising the first one
+
+        Returns:
+            results (List[Any]) : in the order of aws
+        """
+        semaphore = asyncio.Semaphore(limit or self._pool_size)
+
+        async def bounded(aw : Awaitable):
+            async with semaphore:
+                return await aw
+
+        return await asyncio.gather(*(bounded(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+def _coroutine(name : str):
+    method = getattr(jarviceapi, name)
+
+    @functools.wraps(method)
+    async def call(self : asyncjarviceapi, *args, **kwargs):
+        return await self._run(getattr(self._api, name), *args, **kwargs)
+    return call
+
+
+def _asyncIterator(name : str):
+    method = getattr(jarviceapi, name)
+
+    @functools.wraps(method)
+    async def iterate(self : asyncjarviceapi, *args, **kwargs):
+        # Each item is read on a worker thread, which a poll of follow holds
+        items = getattr(self._api, name)(*args, **kwargs)
+        done = object()
+        while True:
+            item = await self._run(next, items, done)
+            if item is done:
+                return
+            yield item
+    return iterate
+
+
+# Every public method of jarviceapi, new ones included
+for _name, _method in list(vars(jarviceapi).items()):
+    if _name.startswith("_") or not inspect.isfunction(_method) or hasattr(asyncjarviceapi, _name):
+        continue
+    setattr(asyncjarviceapi, _name,
+            _asyncIterator(_name) if inspect.isgeneratorfunction(_method) else _coroutine(_name))
@@ -0,0 +1,215 @@
+from collections import deque
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from string import Template
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from jarvice_cli.bulk import DEFAULT_MAX_PARALLEL, run_bounded
+from jarvice_cli.ratelimit import TokenBucket
+
+
+class SubmitResult(NamedTuple):
+    key : str
+    number : Optional[int]
+    name : Optional[str]
+    error : Optional[BaseException]
+    skipped : bool = False
+
+
+def parseParams(params : Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Parses NAME=v1,v2,... sweep parameters
+
+    Raises:
+        ValueError: a parameter is not NAME=VALUES
+    """
+    grid : Dict[str, List[str]] = {}
+    for param in params:
+        name, sep, values = param.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid parameter '{param}' (expected NAME=v1,v2,...)")
+        grid.setdefault(name.strip(), []).extend(values.split(","))
+    return grid
+
+
+def expandGrid(grid : Dict[str, List[str]]) -> Iterator[Dict[str, str]]:
+    """
+    Yields every combination of the parameter grid, lazily
+    """
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def _iterFile(path : Path) -> Iterator[Tuple[str, str]]:
+    if path.suffix == ".jsonl":
+        with open(path) as jsonl_hd:
+            for lineno, line in enumerate(jsonl_hd, 1):
+                if line.strip():
+                    yield f"{path}:{lineno}", line
+    else:
+        yield str(path), path.read_text()
+
+
+def iterSources(sources : Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (key, json text) for every submission found in sources, lazily
+
+    A source is a json file, a JSONL file (one submission per line), a
+    directory (its *.json and *.jsonl files), a glob pattern or - to read
+    JSONL from stdin. The key identifies the submission in the journal.
+    """
+    for source in sources:
+        if source == "-":
+            for lineno, line in enumerate(sys.stdin, 1):
+                if line.strip():
+                    yield f"-:{lineno}", line
+            continue
+        path = Path(source).expanduser()
+        if path.is_dir():
+            files = sorted(p for p in path.iterdir() if p.suffix in (".json", ".jsonl") and p.is_file())
+        elif path.exists():
+            files = [path]
+        else:
+            files = [Path(p) for p in sorted(glob.iglob(os.path.expanduser(source), recursive=True))]
+            if not files:
+                raise FileNotFoundError(f"No submission found for '{source}'")
+        for file in files:
+            yield from _iterFile(file.resolve())
+
+
+def expandTemplates(submissions : Iterable[Tuple[str, str]], grid : Dict[str, List[str]]) -> Iterator[Tuple[str, str]]:
+    """
+    Substitutes ${NAME} in every submission for every combination of the grid
+
+    Substitution is made on the json text, so ${NAME} can also stand for a
+    number (e.g. "nodes": ${nodes}). Unknown $ references are left as is.
+    """
+    if not grid:
+        yield from submissions
+        return
+    for key, text in submissions:
+        template = Template(text)
+        for values in expandGrid(grid):
+            params = "&".join(f"{k}={v}" for k,v in values.items())
+            yield f"{key}?{params}", template.safe_substitute(values)
+
+
+def withMachine(submission : Dict, machine : str) -> Dict:
+    """
+    Sets the machine type of a submission, keeping its number of nodes
+    """
+    if not isinstance(submission.get("machine"), dict):
+        submission["machine"] = {}
+    submission["machine"]["type"] = machine
+    return submission
+
+
+def setMachine(submissions : Iterable[Tuple[str, str]], machine : str) -> Iterator[Tuple[str, str]]:
+    """
+    Sets the machine type of every submission. Invalid json is left as is,
+    to fail when submitted.
+    """
+    for key, text in submissions:
+        try:
+            submission = json.loads(text)
+        except ValueError:
+            yield key, text
+            continue
+        if isinstance(submission, dict):
+            text = json.dumps(withMachine(submission, machine))
+        yield f"{key}{'&' if '?' in key else '?'}machine={machine}", text
+
+
+class BatchJournal:
+    """
+    Append-only JSONL record of the submissions of a batch
+
+    Every submitted job is recorded as soon as it is accepted, so an
+    interrupted batch can be resumed without submitting it twice.
+    """
+    def __init__(self, path : Path):
+        self._path = path
+        self._entries : Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path) as journal_hd:
+                for line in journal_hd:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of an interrupted write
+                        continue
+                    self._entries[entry["key"]] = entry
+        self._journal_hd = open(path, "a")
+
+    def get(self, key : str) -> Optional[Dict]:
+        return self._entries.get(key)
+
+    def record(self, key : str, number : int, name : str):
+        entry = {"key": key, "number": number, "name": name, "time": int(time.time())}
+        with self._lock:
+            self._entries[key] = entry
+            self._journal_hd.write(json.dumps(entry) + "\n")
+            self._journal_hd.flush()
+            os.fsync(self._journal_hd.fileno())
+
+    def close(self):
+        self._journal_hd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def submitBatch(api, submissions : Iterable[Tuple[str, str]],
+                journal : Optional[BatchJournal] = None,
+                max_parallel : int = DEFAULT_MAX_PARALLEL,
+                rate : Optional[float] = None) -> Iterator[SubmitResult]:
+    """
+    Submits every (key, json text) with at most max_parallel submissions in
+    flight and at most `rate` submissions per second.
+    Submissions already in the journal are skipped.
+
+    Yields:
+        SubmitResult : one per submission, as they complete
+    """
+    bucket = TokenBucket(rate) if rate else None
+    skipped : Deque[Tuple[str, Dict]] = deque()
+
+    def pending() -> Iterator[Tuple[str, str]]:
+        for key, text in submissions:
+            entry = journal.get(key) if journal is not None else None
+            if entry is not None:
+                skipped.append((key, entry))
+            else:
+                yield key, text
+
+    def submit(submission : Tuple[str, str]):
+        key, text = submission
+        if bucket is not None:
+            bucket.acquire()
+        ret = api.submitDict(json.loads(text))
+        if journal is not None:
+            journal.record(key, ret["number"], ret["name"])
+        return ret
+
+    for (key, _), ret, error in run_bounded(submit, pending(), max_parallel):
+        # Report skipped submissions as the input is consumed
+        while skipped:
+            skippedKey, entry = skipped.popleft()
+            yield SubmitResult(skippedKey, entry["number"], entry["name"], None, True)
+        if error is not None:
+            yield SubmitResult(key, None, None, error)
+        else:
+            yield SubmitResult(key, ret["number"], ret["name"], None)
+    for skippedKey, entry in skipped:
+        yield SubmitResult(skippedKey, entry["number"], entry["name"], None, True)
@@ -0,0 +1,38 @@
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+# Default number of requests in flight for bulk operations
+DEFAULT_MAX_PARALLEL = 8
+
+
+class BulkResult(NamedTuple):
+    number : int
+    name : Optional[str]
+    error : Optional[BaseException]
+
+
+def run_bounded(fn : Callable[[Any], Any], items : Iterable[Any], max_parallel : int = DEFAULT_MAX_PARALLEL
+                ) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """
+    Calls fn on every item with at most max_parallel calls in flight.
+    Items are consumed lazily and results are yielded as they complete.
+    An exception raised by one call is yielded with its item instead of
+    stopping the others.
+
+    Yields:
+        (item, result, error) : result is None when error is set
+    """
+    # Not imported at module level, it is slow to import and only needed by bulk commands
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+        pending = {executor.submit(fn, item): item for item in islice(items, max(1, max_parallel))}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, None if error is not None else future.result(), error
+                for item in islice(items, 1):
+                    pending[executor.submit(fn, item)] = item
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+# Imported by shell completion, which only has a few ms: typing is only
+# needed by type checkers
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Optional, Tuple
+
+# Time a cached catalog stays valid, in seconds
+DEFAULT_CACHE_TTL = 3600
+
+
+def cacheDir() -> Path:
+    """
+    Root directory of jarvice-cli caches:
+    $JARVICE_CLI_CACHE_DIR, else $XDG_CACHE_HOME/jarvice-cli, else ~/.cache/jarvice-cli
+    """
+    if "JARVICE_CLI_CACHE_DIR" in os.environ:
+        return Path(os.environ["JARVICE_CLI_CACHE_DIR"]).expanduser()
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(base) / "jarvice-cli"
+
+
+def endpointDir(url : str, username : str) -> Path:
+    """
+    Cache directory of an endpoint and user
+    """
+    key = hashlib.sha256(f"{url.rstrip('/')}\0{username}".encode()).hexdigest()[:16]
+    return cacheDir() / key
+
+
+def atomicWrite(path : Path, data : str):
+    """
+    Writes a file through a temporary file and a rename, so concurrent
+    readers see either the old or the new content, never a partial one
+    """
+    import tempfile
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as tmp_hd:
+            tmp_hd.write(data)
+            tmp_hd.flush()
+            os.fsync(tmp_hd.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class DiskCache:
+    """
+    JSON documents cached on disk with a TTL, scoped to an endpoint and user
+    """
+    def __init__(self, url : str, username : str, ttl : int = DEFAULT_CACHE_TTL, directory : Optional[Path] = None):
+        """
+        Args:
+            url (str) : endpoint url
+            username (str) : Jarvice user
+            ttl (int) : time a document stays valid, in seconds
+            directory (Path) : cache directory, defaults to endpointDir(url, username)
+        """
+        self._directory = directory if directory is not None else endpointDir(url, username)
+        self._ttl = ttl
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def ttl(self) -> int:
+        return self._ttl
+
+    def _path(self, name : str) -> Path:
+        return self._directory / f"{name}.json"
+
+    def load(self, name : str, stale_ok : bool = False) -> Optional[Any]:
+        """
+        Returns the cached document, or None if missing, unreadable or older than the TTL.
+        With stale_ok, the TTL is ignored.
+        """
+        stamped = self.loadStamped(name, stale_ok)
+        return stamped[1] if stamped is not None else None
+
+    def loadStamped(self, name : str, stale_ok : bool = False) -> Optional[Tuple[float, Any]]:
+        """
+        Same as load, with the time the document was stored
+        """
+        try:
+            with open(self._path(name)) as cache_hd:
+                document = json.load(cache_hd)
+        except (OSError, ValueError):
+            return None
+        stored = document.get("time", 0)
+        if not stale_ok and time.time() - stored > self._ttl:
+            return None
+        return stored, document.get("data")
+
+    def store(self, name : str, data : Any):
+        """
+        Caches a JSON serializable document. Errors are ignored, the cache is only an optimization.
+        """
+        try:
+            atomicWrite(self._path(name), json.dumps({"time": time.time(), "data": data}))
+        except OSError:
+            pass
+
+    def clear(self, name : Optional[str] = None):
+        """
+        Removes a cached document, or all of them
+        """
+        paths = [self._path(name)] if name is not None else self._directory.glob("*.json")
+        for path in paths:
+            try:
+                path.unlink()
+            except OSError:
+                pass
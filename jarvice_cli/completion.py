@@ -0,0 +1,332 @@
+"""
+Shell completion of job numbers, job names, apps and machine types
+
+Values are served from a small index kept next to the other caches of an
+endpoint and user, which `jarviceapi.jobs()`, `apps()` and `machines()`
+update as a side effect. The entry point answers the completion requests
+of these values with complete() before typer is imported, without any
+request: a stale index is refreshed by a command run in the background,
+for the next Tab. Completion of commands and options is left to typer.
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+
+from jarvice_cli.cache import DEFAULT_CACHE_TTL, atomicWrite, endpointDir
+
+# Number of jobs kept in the index, the most recent ones win
+MAX_COMPLETION_JOBS = 1000
+# Age after which values are refreshed in the background, in seconds
+STALE_AFTER = {"jobs": 60, "apps": DEFAULT_CACHE_TTL, "machines": DEFAULT_CACHE_TTL}
+# Shortest time between two background refreshes of the same values, in seconds
+REFRESH_INTERVAL = 30
+# Commands run to refresh the index
+REFRESH_COMMANDS = {"jobs": ["jobs", "--no-rich"], "apps": ["apps", "--no-rich"],
+                    "machines": ["machines", "--no-rich"]}
+# Global options without a value, any other option is followed by its value
+GLOBAL_FLAGS = ("--history", "--no-history", "--timings", "--help", "--install-completion", "--show-completion")
+
+# complete() runs before anything else is imported, typing is only needed by type checkers
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Dict, Iterable, List, Optional
+
+
+class CompletionIndex:
+    """
+    Job numbers and names, app names and machine types of an endpoint and
+    user, with the time each was last updated
+
+    Changes are kept in memory and written by save(). An instance can be
+    shared between threads.
+    """
+    def __init__(self, url : str, username : str, directory : Optional[Path] = None):
+        """
+        Args:
+            url (str) : endpoint url
+            username (str) : Jarvice user
+            directory (Path) : directory of the index, defaults to endpointDir(url, username)
+        """
+        self._path = (directory if directory is not None else endpointDir(url, username)) / "completion.json"
+        self._index : Optional[Dict[str, dict]] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _load(self) -> Dict[str, dict]:
+        # Called with the lock held
+        if self._index is None:
+            try:
+                with open(self._path) as index_hd:
+                    index = json.load(index_hd)
+                self._index = {kind: index[kind] for kind in STALE_AFTER
+                               if isinstance(index.get(kind), dict) and "time" in index[kind]}
+            except (OSError, ValueError, TypeError, AttributeError):
+                self._index = {}
+        return self._index
+
+    def _set(self, kind : str, values):
+        # Called with the lock held
+        index = self._load()
+        previous = index.get(kind)
+        if previous is None or previous.get("values") != values or time.time() - previous["time"] > STALE_AFTER[kind] / 2:
+            self._dirty = True
+        index[kind] = {"time": time.time(), "values": values}
+
+    def updateJobs(self, jobs : Dict[str, Optional[str]]):
+        """
+        Adds the jobs of a job list, by number, without writing them
+        """
+        with self._lock:
+            known = dict(self._load().get("jobs", {}).get("values", {}))
+            known.update({str(number): name or "" for number, name in jobs.items()})
+            if len(known) > MAX_COMPLETION_JOBS:
+                kept = sorted(known, key=int)[-MAX_COMPLETION_JOBS:]
+                known = {number: known[number] for number in kept}
+            self._set("jobs", known)
+
+    def updateNames(self, kind : str, names : Iterable[str]):
+        """
+        Replaces the app names or the machine types, without writing them
+        """
+        with self._lock:
+            self._set(kind, sorted(names))
+
+    def values(self, kind : str) -> List[str]:
+        """
+        Job numbers ("jobs"), job names ("names"), app names ("apps") or
+        machine types ("machines")
+        """
+        with self._lock:
+            index = self._load()
+            if kind == "names":
+                return sorted({name for name in index.get("jobs", {}).get("values", {}).values() if name})
+            values = index.get(kind, {}).get("values", [])
+            return list(values) if kind != "jobs" else sorted(values, key=int)
+
+    def age(self, kind : str) -> Optional[float]:
+        """
+        Time since the values were updated, in seconds, None if never
+        """
+        with self._lock:
+            entry = self._load().get("jobs" if kind == "names" else kind)
+            return time.time() - entry["time"] if entry is not None else None
+
+    def save(self):
+        """
+        Writes the index if it changed. Errors are ignored, the index is only an optimization.
+        """
+        with self._lock:
+            if not self._dirty or self._index is None:
+                return
+            try:
+                atomicWrite(self._path, json.dumps(self._index, separators=(",", ":")))
+                self._dirty = False
+            except OSError:
+                pass
+
+
+def optionKind(command : Optional[str], option : str) -> Optional[str]:
+    """
+    Values completing an option of a command: "jobs", "names", "apps",
+    "machines", or None if they don't come from the index
+    """
+    if option in ("-j", "--jobid"):
+        return "jobs"
+    if command == "apps" and option in ("-n", "--name"):
+        return "apps"
+    # --name of the job filters is a regex, not completed
+    if option in ("-n", "--jobname"):
+        return "names"
+    if command == "submit" and option == "--machine":
+        return "machines"
+    return None
+
+
+def splitArgs(string : str) -> List[str]:
+    """
+    Words of a command line, the last one possibly unterminated (like click)
+    """
+    import shlex
+
+    lexer = shlex.shlex(string, posix=True)
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    words = []
+    try:
+        for word in lexer:
+            words.append(word)
+    except ValueError:
+        words.append(lexer.token)
+    return words
+
+
+def _completionArgs(shell : str):
+    """
+    Words before the one completed and the word completed, read from the
+    environment like the completion classes of typer
+    """
+    if shell == "bash":
+        words = splitArgs(os.environ.get("COMP_WORDS", ""))
+        cword = int(os.environ.get("COMP_CWORD", "0"))
+        return words[1:cword], words[cword] if cword < len(words) else ""
+    line = os.environ.get("_TYPER_COMPLETE_ARGS", "")
+    words = splitArgs(line)
+    if shell in ("powershell", "pwsh"):
+        incomplete = os.environ.get("_TYPER_COMPLETE_WORD_TO_COMPLETE", "")
+        return (words[1:-1] if incomplete else words[1:]), incomplete
+    args = words[1:]
+    if args and not line.endswith(" "):
+        return args[:-1], args[-1]
+    return args, ""
+
+
+def _globalArgs(args : List[str]):
+    """
+    Global options and the command of a command line
+    """
+    for position, arg in enumerate(args):
+        if arg.startswith("-"):
+            continue
+        if position > 0 and args[position - 1].startswith("-") and "=" not in args[position - 1] \
+                and args[position - 1] not in GLOBAL_FLAGS:
+            # Value of a global option
+            continue
+        return args[:position], arg
+    return args, None
+
+
+def _credentials(globalArgs : List[str]) -> Dict[str, str]:
+    """
+    url, username and apikey given as options on a command line
+    """
+    values = {}
+    for position, arg in enumerate(globalArgs):
+        name, _, value = arg.partition("=")
+        if not value and position + 1 < len(globalArgs):
+            value = globalArgs[position + 1]
+        if name == "--url":
+            values["url"] = value
+        elif name in ("-u", "--username"):
+            values["username"] = value
+        elif name in ("-k", "--apikey"):
+            values["apikey"] = value
+    return values
+
+
+def _endpoint(globalArgs : List[str]):
+    """
+    Url and username of a command line, like getEnvValue: options, then
+    environment, then ~/.jarvice.cfg
+    """
+    values = {name: value for name, value in _credentials(globalArgs).items() if name != "apikey"}
+    for name, envVarName in (("url", "JARVICE_API_URL"), ("username", "JARVICE_USER")):
+        if name not in values and envVarName in os.environ:
+            values[name] = os.environ[envVarName]
+    if len(values) < 2 and os.path.exists(os.path.expanduser("~/.jarvice.cfg")):
+        import configparser
+
+        parser = configparser.ConfigParser()
+        parser.read([os.path.expanduser("~/.jarvice.cfg")])
+        for name in ("url", "username"):
+            if name not in values and parser.has_option("auth", name):
+                values[name] = parser.get("auth", name)
+    if len(values) < 2:
+        return None
+    return values["url"], values["username"]
+
+
+def refreshInBackground(index : CompletionIndex, kind : str, globalArgs : List[str]):
+    """
+    Runs the command updating values of the index in a detached process, at
+    most once every REFRESH_INTERVAL
+
+    Only the credentials of the command line are passed on, the API key in
+    the environment so it doesn't show in the process list: options like
+    --record or --profile must not apply to the refresh.
+    """
+    import subprocess
+    import sys
+
+    kind = "jobs" if kind == "names" else kind
+    marker = index.path.parent / f".completion-{kind}.refresh"
+    try:
+        if time.time() - marker.stat().st_mtime < REFRESH_INTERVAL:
+            return
+    except OSError:
+        pass
+    credentials = _credentials(globalArgs)
+    args = []
+    for name, option in (("url", "--url"), ("username", "--username")):
+        if name in credentials:
+            args += [option, credentials[name]]
+    env = {k: v for k, v in os.environ.items()
+           if not (k.startswith("_TYPER_COMPLETE") or k.startswith("COMP_") or k.endswith("_COMPLETE")
+                   or k.startswith("JARVICE_CLI_PROFILE"))}
+    if "apikey" in credentials:
+        env["JARVICE_API_KEY"] = credentials["apikey"]
+    try:
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+        subprocess.Popen([sys.executable, "-m", "jarvice_cli"] + args + REFRESH_COMMANDS[kind],
+                         env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError:
+        pass
+
+
+def _format(shell : str, values : List[str]) -> str:
+    if shell == "zsh":
+        if not values:
+            return "_files"
+        escaped = ('"' + v.replace('"', '""').replace("'", "''").replace("$", "\\$").replace("`", "\\`")
+                   .replace(":", r"\\:") + '"' for v in values)
+        return "_arguments '*: :((" + "\n".join(escaped) + "))'"
+    if shell in ("powershell", "pwsh"):
+        return "\n".join(f"{v}::: " for v in values)
+    return "\n".join(values)
+
+
+def complete(request : str) -> Optional[int]:
+    """
+    Answers a completion request of the typer completion scripts for the
+    values served from the index
+
+    Args:
+        request (str) : value of _JARVICE_CLI_COMPLETE, e.g. complete_bash
+
+    Returns:
+        exit code, None if typer has to answer the request
+    """
+    shell = request[len("complete_"):] if request.startswith("complete_") else None
+    if shell not in ("bash", "zsh", "fish", "powershell", "pwsh"):
+        return None
+    args, incomplete = _completionArgs(shell)
+    globalArgs, command = _globalArgs(args)
+    if command is None or incomplete.startswith("-"):
+        return None
+    kind = optionKind(command, args[-1])
+    if kind is None:
+        return None
+    endpoint = _endpoint(globalArgs)
+    values = []
+    if endpoint is not None:
+        index = CompletionIndex(*endpoint)
+        values = [value for value in index.values(kind) if value.startswith(incomplete)]
+        age = index.age(kind)
+        if age is None or age > STALE_AFTER["jobs" if kind == "names" else kind]:
+            refreshInBackground(index, kind, globalArgs)
+    if shell == "fish":
+        if os.environ.get("_TYPER_COMPLETE_FISH_ACTION") == "is-args":
+            return 0 if values else 1
+        if values:
+            print(_format(shell, values))
+        return 0
+    print(_format(shell, values))
+    return 0
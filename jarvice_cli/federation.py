@@ -0,0 +1,185 @@
+"""
+Read commands run against several Jarvice XE endpoints at once
+
+Clusters are the sections of ~/.jarvice.cfg holding a url, [auth] being
+the default one. A Federation opens a session per cluster and runs a call
+on all of them concurrently, yielding results as they come in. A cluster
+that doesn't answer within the timeout is reported as failed instead of
+holding the others back.
+"""
+from __future__ import annotations
+import configparser
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from jarvice_cli.jarviceapi import jarviceapi
+
+CONFIG_PATH = "~/.jarvice.cfg"
+# Time a cluster has to answer, in seconds
+DEFAULT_CLUSTER_TIMEOUT = 30.0
+
+
+class Cluster(NamedTuple):
+    name : str
+    url : str
+    username : str
+    apikey : str
+
+
+def readClusters(defaults : Optional[Dict[str, str]] = None, path : str = CONFIG_PATH) -> Dict[str, Cluster]:
+    """
+    Clusters of the config file, in file order
+
+    Args:
+        defaults (Dict[str, str]) : username and apikey used by sections without them
+        path (str) : config file
+
+    Raises:
+        ValueError: a section has no username or apikey, and there is no default
+    """
+    defaults = defaults or {}
+    parser = configparser.ConfigParser()
+    parser.read([os.path.expanduser(path)])
+    clusters = {}
+    for name in parser.sections():
+        section = parser[name]
+        if "url" not in section:
+            continue
+        values = {key: section.get(key) or defaults.get(key) for key in ("username", "apikey")}
+        for key, value in values.items():
+            if not value:
+                raise ValueError(f"No {key} for cluster {name} in {path}")
+        clusters[name] = Cluster(name, section["url"], values["username"], values["apikey"])
+    return clusters
+
+
+def selectClusters(clusters : Dict[str, Cluster], names : Optional[str], everything : bool) -> List[Cluster]:
+    """
+    Clusters named in a comma separated list, or all of them
+
+    Raises:
+        ValueError: unknown cluster, or no cluster at all
+    """
+    if everything:
+        if not clusters:
+            raise ValueError(f"No cluster in {CONFIG_PATH}: add sections with a url")
+        return list(clusters.values())
+    selected = []
+    for name in (n.strip() for n in (names or "").split(",")):
+        if not name:
+            continue
+        if name not in clusters:
+            raise ValueError(f"Unknown cluster '{name}' (expected one of {', '.join(clusters) or 'none'})")
+        if clusters[name] not in selected:
+            selected.append(clusters[name])
+    if not selected:
+        raise ValueError("No cluster given")
+    return selected
+
+
+class Federation:
+    """
+    Sessions on several clusters, called concurrently
+
+    Use it as a context manager so that every session is closed at the end:
+
+        with Federation(clusters, openSession) as federation:
+            for cluster, jobs, error in federation.run(lambda api: api.jobs()):
+                ...
+    """
+    _sessions : Dict[str, jarviceapi]
+
+    def __init__(self, clusters : List[Cluster], openSession : Callable[[Cluster], jarviceapi],
+                 timeout : float = DEFAULT_CLUSTER_TIMEOUT):
+        """
+        Args:
+            clusters (List[Cluster]) : clusters to call
+            openSession : opens the session of a cluster. Its requests should
+                end within timeout (see CallPolicy.bounded), so that calls
+                given up on don't outlive the command.
+            timeout (float) : time a cluster has to answer, in seconds
+        """
+        self._clusters = clusters
+        self._openSession = openSession
+        self._timeout = timeout
+        self._sessions = {}
+        # Threads of clusters given up on by run() may still open sessions
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the sessions. Sessions opened later by the threads of clusters
+        that didn't answer in time are closed as they are opened.
+        """
+        with self._lock:
+            self._closed = True
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for api in sessions:
+            api.close()
+
+    def _session(self, cluster : Cluster) -> jarviceapi:
+        """
+        Session of a cluster, opened on first use
+
+        Raises:
+            RuntimeError: the federation is closed
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Federation closed")
+            api = self._sessions.get(cluster.name)
+        if api is not None:
+            return api
+        # Opened without the lock, it may be slow
+        api = self._openSession(cluster)
+        with self._lock:
+            closed = self._closed
+            stored = self._sessions.setdefault(cluster.name, api) if not closed else None
+        if stored is not api:
+            # Closed meanwhile, or opened by a thread of an earlier run()
+            api.close()
+            if closed:
+                raise RuntimeError("Federation closed")
+        return stored
+
+    def run(self, call : Callable[[jarviceapi], Any]) -> Iterator[Tuple[str, Any, Optional[BaseException]]]:
+        """
+        Calls call with the session of every cluster concurrently
+
+        Yields:
+            (cluster, result, error) : as calls complete, result is None when
+                error is set. Clusters that didn't answer within the timeout
+                come last, with a TimeoutError.
+        """
+        # Not imported at module level, it is slow to import and only needed here
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self._clusters)))
+        try:
+            pending = {executor.submit(lambda cluster: call(self._session(cluster)), cluster): cluster
+                       for cluster in self._clusters}
+            end = time.monotonic() + self._timeout
+            while pending:
+                done, _ = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    cluster = pending.pop(future)
+                    error = future.exception()
+                    yield cluster.name, None if error is not None else future.result(), error
+            for cluster in sorted(pending.values(), key=self._clusters.index):
+                yield cluster.name, None, TimeoutError(f"No answer within {self._timeout:g}s")
+        finally:
+            # Calls given up on end by themselves, on their own deadline
+            executor.shutdown(wait=False, cancel_futures=True)
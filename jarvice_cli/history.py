@@ -0,0 +1,366 @@
+from __future__ import annotations
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from jarvice_cli.cache import endpointDir
+from jarvice_cli.jobfilter import TERMINAL_STATUSES, expandStatus
+from jarvice_cli.lazy import lazy_import
+
+# sqlite3 is only loaded when the history is read or written
+sqlite3 = lazy_import("sqlite3")
+
+# Number of jobs `history` prints by default
+DEFAULT_HISTORY_LIMIT = 100
+# Status of a job Jarvice no longer knows, whose final status can't be found
+UNKNOWN_STATUS = "UNKNOWN"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    number INTEGER PRIMARY KEY,
+    name TEXT,
+    app TEXT,
+    command TEXT,
+    user TEXT,
+    status TEXT,
+    submit_time INTEGER,
+    start_time INTEGER,
+    end_time INTEGER,
+    queue_time INTEGER,
+    compute_time INTEGER,
+    machine TEXT,
+    nodes INTEGER,
+    payload TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_app ON jobs (app);
+CREATE INDEX IF NOT EXISTS jobs_submit_time ON jobs (submit_time);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name);
+"""
+
+_COLUMNS = ("number", "name", "app", "command", "user", "status", "submit_time", "start_time",
+            "end_time", "queue_time", "compute_time", "machine", "nodes", "payload", "updated")
+
+# Only rows whose payload changed are rewritten
+_UPSERT = (f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))}) "
+           f"ON CONFLICT (number) DO UPDATE SET "
+           f"{', '.join(f'{column} = excluded.{column}' for column in _COLUMNS[1:])} "
+           f"WHERE jobs.payload != excluded.payload")
+
+# Keys `history --sort` accepts, to columns
+HISTORY_SORT_KEYS = {
+    "number": "number",
+    "name": "name",
+    "app": "app",
+    "user": "user",
+    "status": "status",
+    "submitted": "submit_time",
+    "machine": "machine",
+    "queue": "queue_time",
+    "compute": "compute_time",
+}
+
+# Keys `history --summary` accepts, to the SQL expression jobs are grouped by
+HISTORY_GROUPS = {
+    "status": "status",
+    "app": "app",
+    "user": "user",
+    "machine": "machine",
+    "day": "date(submit_time, 'unixepoch', 'localtime')",
+}
+
+
+def _regexp(pattern : str, value : Optional[str]) -> bool:
+    # SQL `value REGEXP pattern`, searched like the name filter of JobFilter
+    return value is not None and re.search(pattern, value) is not None
+
+
+class HistoryEntry:
+    """
+    Job read back from the history, with the attributes of a JobEntry
+
+    Missing attributes are None and nested objects are HistoryEntry too, so
+    printers handle it like the JobEntry it was stored from, without loading
+    the generated client.
+    """
+    __slots__ = ("_data",)
+
+    def __init__(self, data : Dict[str, Any]):
+        self._data = data
+
+    def __getattr__(self, name : str):
+        value = self._data.get(name)
+        if isinstance(value, dict):
+            return HistoryEntry(value)
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._data
+
+
+class JobHistory:
+    """
+    Jobs seen in `jarviceapi.jobs()`, kept in SQLite after they leave the job list
+
+    Every sync only rewrites the jobs that changed since the previous one.
+    The job list only holds the jobs that have not ended: the final status
+    of the jobs that left it is merged from `jarviceapi.status()`.
+    The database is opened on first use. An instance can be shared between threads.
+    """
+    _path : Path
+    _connection : Optional[sqlite3.Connection]
+
+    def __init__(self, path : Path):
+        """
+        Args:
+            path (Path) : SQLite database, created if missing
+        """
+        self._path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called with the lock held
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self._path), timeout=10, check_same_thread=False)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.executescript(_SCHEMA)
+                connection.create_function("REGEXP", 2, _regexp, deterministic=True)
+            except BaseException:
+                connection.close()
+                raise
+            self._connection = connection
+        return self._connection
+
+    @classmethod
+    def forEndpoint(cls, url : str, username : str) -> "JobHistory":
+        """
+        History of an endpoint and user, next to its cache
+        """
+        return cls(endpointDir(url, username) / "history.sqlite")
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def _row(number : int, jobEntry, now : float) -> Tuple:
+        payload = jobEntry.to_dict()
+        stats = getattr(jobEntry, "job_stats", None)
+        submission = getattr(jobEntry, "job_api_submission", None)
+        machine = submission.machine if submission is not None else None
+        queue_time = stats.queue_time if stats is not None else None
+        compute_time = stats.compute_time if stats is not None else None
+        submit, start, end = jobEntry.job_submit_time, jobEntry.job_start_time, jobEntry.job_end_time
+        # Status entries have no stats, they are found from the times of the job
+        if queue_time is None and submit and start:
+            queue_time = start - submit
+        if compute_time is None and start and end:
+            compute_time = end - start
+        return (number,
+                jobEntry.job_name,
+                jobEntry.job_application,
+                jobEntry.job_command,
+                getattr(jobEntry, "job_owner_username", None),
+                jobEntry.job_status,
+                submit,
+                start,
+                end,
+                queue_time,
+                compute_time,
+                machine.type if machine is not None else None,
+                machine.nodes if machine is not None else None,
+                json.dumps(payload, sort_keys=True, separators=(",", ":")),
+                now)
+
+    def sync(self, jobs : Dict[str, Any]) -> int:
+        """
+        Stores the jobs returned by `jarviceapi.jobs()`
+
+        Returns:
+            changed (int) : number of jobs added or updated
+
+        Raises:
+            OSError
+            sqlite3.Error
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                before = connection.total_changes
+                connection.executemany(_UPSERT, (self._row(int(number), jobEntry, now)
+                                                 for number,jobEntry in jobs.items()))
+                return connection.total_changes - before
+
+    def merge(self, entries : Dict[str, Any]) -> int:
+        """
+        Stores the entries returned by `jarviceapi.status()`. Their fields are
+        merged into the stored jobs, whose other fields are kept.
+
+        Returns:
+            changed (int) : number of jobs added or updated
+
+        Raises:
+            OSError
+            sqlite3.Error
+        """
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                before = connection.total_changes
+                for number, entry in entries.items():
+                    row = connection.execute("SELECT payload FROM jobs WHERE number = ?", (int(number),)).fetchone()
+                    payload = json.loads(row[0]) if row is not None else {}
+                    payload.update(entry.to_dict())
+                    connection.execute(_UPSERT, self._row(int(number), HistoryEntry(payload), now))
+                return connection.total_changes - before
+
+    def markUnknown(self, number : int):
+        """
+        Gives UNKNOWN_STATUS to a job Jarvice no longer knows, so its final
+        status is not looked for again
+
+        Raises:
+            OSError
+            sqlite3.Error
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                row = connection.execute("SELECT payload FROM jobs WHERE number = ?", (number,)).fetchone()
+                if row is None:
+                    return
+                payload = json.loads(row[0])
+                payload["job_status"] = UNKNOWN_STATUS
+                connection.execute("UPDATE jobs SET status = ?, payload = ?, updated = ? WHERE number = ?",
+                                   (UNKNOWN_STATUS, json.dumps(payload, sort_keys=True, separators=(",", ":")),
+                                    time.time(), number))
+
+    def unfinished(self) -> List[int]:
+        """
+        Numbers of the stored jobs that had not ended when last seen, newest first
+
+        Raises:
+            OSError
+            sqlite3.Error
+        """
+        ended = TERMINAL_STATUSES + (UNKNOWN_STATUS,)
+        sql = f"SELECT number FROM jobs WHERE status NOT IN ({', '.join('?' * len(ended))}) ORDER BY number DESC"
+        with self._lock:
+            return [number for number, in self._connect().execute(sql, ended)]
+
+    @staticmethod
+    def _where(status : Optional[Iterable[str]] = None,
+               app : Optional[str] = None,
+               name : Optional[str] = None,
+               user : Optional[str] = None,
+               machine : Optional[str] = None,
+               since : Optional[float] = None,
+               until : Optional[float] = None) -> Tuple[str, List]:
+        clauses = []
+        params : List[Any] = []
+        if status:
+            statuses = expandStatus(status)
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        for column, value in (("app", app), ("user", user), ("machine", machine)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if name is not None:
+            # Same syntax as JobFilter, raises re.error before any query
+            re.compile(name)
+            clauses.append("name REGEXP ?")
+            params.append(name)
+        if since is not None:
+            clauses.append("submit_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("submit_time < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, sort : Optional[str] = None, reverse : bool = False,
+              limit : Optional[int] = DEFAULT_HISTORY_LIMIT, offset : int = 0,
+              **filters) -> Iterator[Tuple[str, HistoryEntry]]:
+        """
+        Jobs of the history, newest first unless sorted
+
+        Args:
+            sort (str) : one of HISTORY_SORT_KEYS
+            reverse (bool) : sort in descending order
+            limit (int) : maximum number of jobs, None for all
+            offset (int) : number of jobs skipped, for pagination
+            filters : status, app, name (regular expression searched in the
+                job name, like JobFilter), user, machine, since
+                and until (submission timestamps)
+
+        Returns:
+            jobs (Iterator[Tuple[str, HistoryEntry]]) : job number and entry,
+                decoded as they are iterated
+
+        Raises:
+            ValueError: unknown sort key
+            re.error: invalid name pattern
+            OSError
+            sqlite3.Error
+        """
+        where, params = self._where(**filters)
+        if sort is None:
+            order = "number DESC"
+        elif sort in HISTORY_SORT_KEYS:
+            order = f"{HISTORY_SORT_KEYS[sort]} {'DESC' if reverse else 'ASC'}, number"
+        else:
+            raise ValueError(f"Invalid sort key '{sort}' (expected one of {', '.join(HISTORY_SORT_KEYS)})")
+        sql = f"SELECT number, payload FROM jobs{where} ORDER BY {order} LIMIT ? OFFSET ?"
+        params.extend((-1 if limit is None else limit, offset))
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        for number, payload in rows:
+            yield str(number), HistoryEntry(json.loads(payload))
+
+    def summary(self, by : str, **filters) -> List[Dict[str, Any]]:
+        """
+        Number of jobs, queue and compute time per group of jobs
+
+        Args:
+            by (str) : one of HISTORY_GROUPS
+            filters : same as query
+
+        Returns:
+            groups (List[Dict]) : group, jobs, total and average queue_time,
+                total compute_time and node_hours, largest group first
+
+        Raises:
+            ValueError: unknown group
+            re.error: invalid name pattern
+            OSError
+            sqlite3.Error
+        """
+        if by not in HISTORY_GROUPS:
+            raise ValueError(f"Invalid summary '{by}' (expected one of {', '.join(HISTORY_GROUPS)})")
+        where, params = self._where(**filters)
+        sql = (f"SELECT {HISTORY_GROUPS[by]} AS grp, COUNT(*), COALESCE(SUM(queue_time), 0), "
+               f"AVG(queue_time), COALESCE(SUM(compute_time), 0), "
+               f"COALESCE(SUM(compute_time * COALESCE(nodes, 1)), 0) / 3600.0 "
+               f"FROM jobs{where} GROUP BY grp ORDER BY COUNT(*) DESC, grp")
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [{by: group, "jobs": count, "queue_time": queue, "avg_queue_time": round(avg or 0, 1),
+                 "compute_time": compute, "node_hours": round(nodeHours, 2)}
+                for group, count, queue, avg, compute, nodeHours in rows]
@@ -1,35 +1,239 @@
-from collections import OrderedDict
+from __future__ import annotations
+from collections import OrderedDict, deque
+from contextlib import ExitStack
 import json
-from time import sleep
-from typing import Optional, Tuple, Union
-import jarviceapi_client
-import jarviceapi_client.exceptions as apiException
+import threading
+from time import sleep, time
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
-
+from jarvice_cli.lazy import lazy_import
+from jarvice_cli.bulk import BulkResult, DEFAULT_MAX_PARALLEL, run_bounded
+from jarvice_cli.jobfilter import JobFilter, STATUS_CODES, TERMINAL_STATUSES, parseWalltime
+from jarvice_cli.policy import CallPolicy
+from jarvice_cli import timings
+
+if TYPE_CHECKING:
+    from jarvice_cli.cache import DiskCache
+    from jarvice_cli.completion import CompletionIndex
+    from jarvice_cli.history import JobHistory
+    from jarvice_cli.names import NameIndex
+
+# The generated client is only loaded when a request is made
+jarviceapi_client = lazy_import("jarviceapi_client")
+
+# Maximum number of keep-alive connections kept open to the endpoint
+DEFAULT_POOL_SIZE = 10
+# Bounds of the poll interval of wait_for, in seconds
+DEFAULT_MIN_POLL_INTERVAL = 1.0
+DEFAULT_MAX_POLL_INTERVAL = 30.0
+# Window polled by follow, in lines, and bounds of its poll interval, in seconds
+DEFAULT_FOLLOW_LINES = 200
+DEFAULT_FOLLOW_MIN_INTERVAL = 0.5
+DEFAULT_FOLLOW_MAX_INTERVAL = 10.0
+# Number of lines follow keeps to find where new output starts
+FOLLOW_ANCHOR_LINES = 20
+# Lines that must match for a partial overlap to be where new output starts
+FOLLOW_MIN_OVERLAP = 3
+# Yielded by follow when the lines printed last scrolled out of the polled window
+FOLLOW_SKIPPED = "… lines skipped …"
 
 
 class jarviceapi:
+    """
+    Client for Jarvice XE API
+
+    A single ApiClient (and its urllib3 connection pool) is shared by every
+    method, so connections are kept alive and reused between calls. Every
+    request goes through a CallPolicy: timeouts, retries of idempotent
+    calls, rate limit and circuit breaker.
+    An instance is thread-safe and can be used as a context manager:
+
+        with jarviceapi(username, apikey, url) as api:
+            api.jobs()
+    """
     _username : str
     _apikey : str
     _configuration : jarviceapi_client.Configuration
-
-    def __init__(self, username : str, apikey : str, url : str):
+    _api_client : Optional[jarviceapi_client.ApiClient]
+    _status_instance : Optional[jarviceapi_client.StatusAndInformationApi]
+    _job_control_instance : Optional[jarviceapi_client.JobControlApi]
+    _cache : Optional[DiskCache]
+    _history : Optional[JobHistory]
+    _names : Optional[NameIndex]
+    _completions : Optional[CompletionIndex]
+    _catalogs : Dict[str, Tuple[float, Dict[str, Any]]]
+    _jobs_ttl : float
+    _jobs_snapshot : Optional[Tuple[float, Dict[str, Any]]]
+    _transports : List[Callable[[Any], Any]]
+    _policy : CallPolicy
+
+    def __init__(self, username : str, apikey : str, url : str, pool_size : int = DEFAULT_POOL_SIZE,
+                 cache : Optional[DiskCache] = None, history : Optional[JobHistory] = None,
+                 names : Optional[NameIndex] = None, jobs_ttl : float = 0,
+                 policy : Optional[CallPolicy] = None, storage_url : Optional[str] = None,
+                 completions : Optional[CompletionIndex] = None):
+        """
+        Args:
+            username (str) : Jarvice user
+            apikey (str) : API key of the user
+            url (str) : endpoint url, ending with /api/
+            pool_size (int) : maximum number of keep-alive connections
+            cache (DiskCache) : cache of the apps and machines catalogs, disabled if None
+            history (JobHistory) : history every job list is synced into, disabled if None
+            names (NameIndex) : index used to call the API by number when given a job name,
+                disabled if None
+            jobs_ttl (float) : time the job list is reused for, in seconds, 0 to request it
+                every time. Meant for long lived clients such as the agent.
+            policy (CallPolicy) : retry, timeout, rate limit and circuit breaker
+                of every request, defaults to CallPolicy()
+            storage_url (str) : url of the storage of the vaults, needed by
+                download() and upload()
+            completions (CompletionIndex) : index of the values completed by the
+                shell, updated by jobs(), apps() and machines(), disabled if None
+        """
         self._username = username
         self._apikey = apikey
+        self._storage_url = storage_url
         self._configuration = jarviceapi_client.Configuration(
             host = url
         )
+        self._configuration.connection_pool_maxsize = pool_size
+        self._api_client = None
+        self._status_instance = None
+        self._job_control_instance = None
+        self._cache = cache
+        self._history = history
+        self._names = names
+        self._completions = completions
+        # Catalogs read or downloaded by this instance, with the time they were stored
+        self._catalogs = {}
+        self._jobs_ttl = jobs_ttl
+        self._jobs_snapshot = None
+        self._policy = policy if policy is not None else CallPolicy()
+        self._transports = [self._policy.wrap]
+        self._exit_stack = ExitStack()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the shared client and every pooled connection, save the name and
+        completion indexes and close the history. The instance can still be used
+        afterwards, a new pool is then created.
+        """
+        if self._names is not None:
+            self._names.save()
+        if self._completions is not None:
+            self._completions.save()
+        if self._history is not None:
+            self._history.close()
+        with self._lock:
+            if self._api_client is not None:
+                self._exit_stack.close()
+                self._api_client.rest_client.pool_manager.clear()
+            self._api_client = None
+            self._status_instance = None
+            self._job_control_instance = None
+
+    def addTransport(self, wrap : Callable[[Any], Any]):
+        """
+        Wraps the urllib3 pool manager every request goes through
 
-    def submitJson(self, jobSubmission : jarviceapi_client.Submission):
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.JobControlApi(api_client)
-            # Inject user
-            if jobSubmission.user is None:
-                jobSubmission.user = jarviceapi_client.SubmitUser()
-            jobSubmission.user.username = self._username
-            jobSubmission.user.apikey = self._apikey
+        Args:
+            wrap : called with the pool manager, returns the one to use instead.
+                It must provide request() and clear().
+        """
+        with self._lock:
+            self._transports.append(wrap)
+            if self._api_client is not None:
+                rest_client = self._api_client.rest_client
+                rest_client.pool_manager = wrap(rest_client.pool_manager)
+
+    def _client(self) -> jarviceapi_client.ApiClient:
+        if self._api_client is None:
+            with self._lock:
+                if self._api_client is None:
+                    api_client = self._exit_stack.enter_context(
+                        jarviceapi_client.ApiClient(self._configuration))
+                    for wrap in self._transports:
+                        api_client.rest_client.pool_manager = wrap(api_client.rest_client.pool_manager)
+                    # Outermost, so --timings also sees replayed requests
+                    api_client.rest_client.pool_manager = timings.wrap(api_client.rest_client.pool_manager)
+                    timings.instrument(api_client)
+                    self._api_client = api_client
+        return self._api_client
+
+    def _status_api(self) -> jarviceapi_client.StatusAndInformationApi:
+        if self._status_instance is None:
+            self._status_instance = jarviceapi_client.StatusAndInformationApi(self._client())
+        return self._status_instance
+
+    def _job_control_api(self) -> jarviceapi_client.JobControlApi:
+        if self._job_control_instance is None:
+            self._job_control_instance = jarviceapi_client.JobControlApi(self._client())
+        return self._job_control_instance
+
+    @property
+    def policy(self) -> CallPolicy:
+        return self._policy
+
+    @property
+    def completions(self) -> Optional[CompletionIndex]:
+        return self._completions
+
+    def _call(self, name : str, call : Callable[[], Any], idempotent : bool = True):
+        """
+        Makes a request through the call policy, retried on transient errors if idempotent
+        """
+        with timings.span(name, "api"):
+            return self._policy.call(call, idempotent)
+
+    def _byJob(self, name : str, job : Union[int, str], call : Callable[..., Any], idempotent : bool = True):
+        """
+        Calls `call` with number=job, or for a job name with the number found
+        in the name index, else with name=job
+
+        If the API rejects a number from the index, the name is dropped from
+        the index and the call is made again by name.
+        """
+        if type(job) is int:
+            return self._call(name, lambda: call(number=job), idempotent)
+        if type(job) is not str:
+            raise jarviceapi_client.ApiException(status=501, http_resp="Invalid parameters")
+        number = self._names.get(job) if self._names is not None else None
+        if number is not None:
+            try:
+                return self._call(name, lambda: call(number=number), idempotent)
+            except jarviceapi_client.ApiException as e:
+                if e.status not in (400, 404):
+                    raise
+                self._names.discard(job)
+        return self._call(name, lambda: call(name=job), idempotent)
 
-            return api_instance.submit_post(jobSubmission)
+    def submitJson(self, jobSubmission : jarviceapi_client.Submission):
+        api_instance = self._job_control_api()
+        # Inject user
+        if jobSubmission.user is None:
+            jobSubmission.user = jarviceapi_client.SubmitUser()
+        jobSubmission.user.username = self._username
+        jobSubmission.user.apikey = self._apikey
+
+        # Not retried: a submission that timed out may have been accepted
+        ret = self._call("submit", lambda: api_instance.submit_post(jobSubmission), idempotent=False)
+        self._jobs_snapshot = None
+        if self._names is not None:
+            try:
+                self._names.update({ret["name"]: int(ret["number"])})
+            except (KeyError, TypeError, ValueError):
+                pass
+        if self._completions is not None and isinstance(ret, dict) and "number" in ret:
+            self._completions.updateJobs({str(ret["number"]): ret.get("name")})
+        return ret
 
 
     def submitJsonFile(self, job_jsonfile : Path):
@@ -40,12 +244,24 @@ class jarviceapi:
             job_jsonfile (Path) : json file containing job launch definition
 
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
         """
         with open(job_jsonfile) as job_jsonfile_hd:
             json_object = json.load(job_jsonfile_hd)
-            jobSubmission = jarviceapi_client.Submission.from_dict(json_object)
-            return self.submitJson(jobSubmission)
+            return self.submitDict(json_object)
+
+    def submitDict(self, json_object : Dict[str, Any]):
+        """
+        Submits a job to Jarvice XE
+
+        Args:
+            json_object (Dict[str, Any]) : job launch definition
+
+        Raises:
+            jarviceapi_client.OpenApiException
+        """
+        jobSubmission = jarviceapi_client.Submission.from_dict(json_object)
+        return self.submitJson(jobSubmission)
 
     def tail(self, job : Union[int, str], lines = 0):
         """
@@ -54,14 +270,92 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            if type(job) is str:
-                return api_instance.tail_get(self._apikey, self._username, name=job, lines=lines)
-            elif type(job) is int:
-                return api_instance.tail_get(self._apikey, self._username, number=job, lines=lines)
+        api_instance = self._status_api()
+        return self._byJob("tail", job, lambda **kwargs: api_instance.tail_get(self._apikey, self._username, lines=lines, **kwargs))
             
     
+    def follow(self, job : Union[int, str], lines : int = DEFAULT_FOLLOW_LINES,
+               min_interval : float = DEFAULT_FOLLOW_MIN_INTERVAL,
+               max_interval : float = DEFAULT_FOLLOW_MAX_INTERVAL) -> Iterator[str]:
+        """
+        Follow the output/error of a currently running job
+
+        The last `lines` lines are polled and only the lines that were not
+        yielded yet are yielded. The poll interval doubles while the output is
+        idle, up to max_interval, and goes back to min_interval on new output.
+        It stops when the job has ended. Only the last lines yielded are kept
+        in memory to find where the new output starts. If they scrolled out of
+        the polled window between two polls, FOLLOW_SKIPPED marks the lines
+        missed before the window is yielded.
+
+        Args:
+            job (Union[int, str]) : job number or job name
+            lines (int) : size of the polled window, in lines
+            min_interval (float) : shortest time between polls, in seconds
+            max_interval (float) : longest time between polls, in seconds
+
+        Yields:
+            line (str) : output line, without its line feed
+
+        Raises:
+            jarviceapi_client.OpenApiException
+        """
+        printed : Deque[str] = deque(maxlen=FOLLOW_ANCHOR_LINES)
+        interval = min_interval
+        ended = False
+        while True:
+            if ended:
+                # The job is gone from tail once ended, read its output instead
+                try:
+                    buffer = self.output(job, lines)
+                except jarviceapi_client.ApiException:
+                    return
+            else:
+                buffer = self.tail(job, lines)
+            bufferLines = (buffer or "").split("\n")
+            # Text after the last line feed may still be written to
+            partial = bufferLines.pop()
+            start = self._followOverlap(list(printed), bufferLines)
+            if start is None:
+                start = 0
+                yield FOLLOW_SKIPPED
+            newLines = bufferLines[start:]
+            for line in newLines:
+                printed.append(line)
+                yield line
+            if ended:
+                if partial:
+                    yield partial
+                return
+
+            if newLines:
+                interval = min_interval
+            else:
+                ended = any(v.job_status in TERMINAL_STATUSES for v in self.status(job).values())
+                if ended:
+                    continue
+                interval = min(max_interval, interval * 2)
+            sleep(interval)
+
+    @staticmethod
+    def _followOverlap(printed : List[str], lines : List[str]) -> Optional[int]:
+        """
+        Index of the first line of `lines` that comes after the lines already
+        printed, None if they are not in `lines` anymore
+
+        The printed lines may have partly scrolled out of `lines`: at least
+        FOLLOW_MIN_OVERLAP of them must match, so that a common line (e.g. an
+        empty one) is not taken for the last one printed.
+        """
+        if not printed or not lines:
+            return 0
+        minimum = min(len(printed), FOLLOW_MIN_OVERLAP)
+        for end in range(len(lines), minimum - 1, -1):
+            size = min(len(printed), end)
+            if lines[end - size:end] == printed[len(printed) - size:]:
+                return end
+        return None
+
     def output(self, job : Union[int, str], lines):
         """
         See the output of a currently running job
@@ -69,12 +363,8 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            if type(job) is str:
-                return api_instance.output_get(self._apikey, self._username, name=job, lines=lines)
-            elif type(job) is int:
-                return api_instance.output_get(self._apikey, self._username, number=job, lines=lines)
+        api_instance = self._status_api()
+        return self._byJob("output", job, lambda **kwargs: api_instance.output_get(self._apikey, self._username, lines=lines, **kwargs))
     
     def connect(self, job : Union[int, str]):
         """
@@ -84,22 +374,16 @@ class jarviceapi:
         """
         address : str = "NONE"
         password : str = "NONE"
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
+        api_instance = self._status_api()
             
-            runtimeConnect : jarviceapi_client.RuntimeConnect
-            if type(job) is str:
-                runtimeConnect = api_instance.connect_get(self._apikey, self._username, name=job)
-            elif type(job) is int:
-                runtimeConnect = api_instance.connect_get(self._apikey, self._username, number=job)
-            else:
-                raise apiException.ApiException(status=501, http_resp="Invalid parameters")
-            if runtimeConnect:
-                if runtimeConnect.address:
-                    address = runtimeConnect.address
-                if runtimeConnect.password:
-                    password = runtimeConnect.password
-            return address,password
+        runtimeConnect : jarviceapi_client.RuntimeConnect
+        runtimeConnect = self._byJob("connect", job, lambda **kwargs: api_instance.connect_get(self._apikey, self._username, **kwargs))
+        if runtimeConnect:
+            if runtimeConnect.address:
+                address = runtimeConnect.address
+            if runtimeConnect.password:
+                password = runtimeConnect.password
+        return address,password
 
     
     def shutdown(self, job : Union[int, str]):
@@ -109,15 +393,9 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.JobControlApi(api_client)
-            
-            if type(job) is str:
-                api_instance.shutdown_get(self._apikey, self._username, name=job)
-            elif type(job) is int:
-                api_instance.shutdown_get(self._apikey, self._username, number=job)
-            else:
-                raise apiException.ApiException(status=501, http_resp="Invalid parameters")
+        api_instance = self._job_control_api()
+        self._byJob("shutdown", job, lambda **kwargs: api_instance.shutdown_get(self._apikey, self._username, **kwargs))
+        self._jobs_snapshot = None
     
     def terminate(self, job : Union[int, str]):
         """
@@ -126,15 +404,9 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.JobControlApi(api_client)
-            
-            if type(job) is str:
-                api_instance.terminate_get(self._apikey, self._username, name=job)
-            elif type(job) is int:
-                api_instance.terminate_get(self._apikey, self._username, number=job)
-            else:
-                raise apiException.ApiException(status=501, http_resp="Invalid parameters")
+        api_instance = self._job_control_api()
+        self._byJob("terminate", job, lambda **kwargs: api_instance.terminate_get(self._apikey, self._username, **kwargs))
+        self._jobs_snapshot = None
 
     def info(self, job : Union[int, str]):
         """
@@ -143,15 +415,8 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            
-            if type(job) is str:
-                return api_instance.info_get(self._apikey, self._username, name=job)
-            elif type(job) is int:
-                return api_instance.info_get(self._apikey, self._username, number=job)
-            else:
-                raise apiException.ApiException(status=501, http_resp="Invalid parameters")
+        api_instance = self._status_api()
+        return self._byJob("info", job, lambda **kwargs: api_instance.info_get(self._apikey, self._username, **kwargs))
 
     def status(self, job : Union[int, str]):
         """
@@ -160,146 +425,488 @@ class jarviceapi:
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            
-            if type(job) is str:
-                return api_instance.status_get(self._apikey, self._username, name=job)
-            elif type(job) is int:
-                return api_instance.status_get(self._apikey, self._username, number=job)
-            else:
-                raise apiException.ApiException(status=501, http_resp="Invalid parameters")
+        api_instance = self._status_api()
+        entries = self._byJob("status", job, lambda **kwargs: api_instance.status_get(self._apikey, self._username, **kwargs))
+        if self._names is not None and type(job) is str:
+            self._names.update({v.job_name: int(k) for k,v in entries.items() if v.job_name})
+        if self._history is not None and entries:
+            import sqlite3
+
+            try:
+                self._history.merge(entries)
+            except (OSError, sqlite3.Error):
+                pass
+        return entries
 
     def action(self, action : str, job : Union[int, str]):
         """
         Perform a configured action on your job
 
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.JobControlApi(api_client)
-            if type(job) is str:
-                return api_instance.action_get(self._apikey, self._username, action, name=job)
-            elif type(job) is int:
-                return api_instance.action_get(self._apikey, self._username, action, number=job)
+        api_instance = self._job_control_api()
+        return self._byJob("action", job, lambda **kwargs: api_instance.action_get(self._apikey, self._username, action, **kwargs),
+                           idempotent=False)
 
 
-    def jobs(self):
+    def jobs(self, jobFilter : Optional[JobFilter] = None):
         """
-        Get a list of currently running jobs
+        Get a list of currently running jobs, synced into the history if any
+
+        Args:
+            jobFilter (JobFilter) : only return the jobs it matches
 
         Returns:
             jobs (Dict[str, JobEntry]) : Job dictionnary
 
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
+        """
+        snapshot = self._jobs_snapshot
+        if snapshot is not None and time() - snapshot[0] < self._jobs_ttl:
+            jobs = snapshot[1]
+            if jobFilter is None:
+                return dict(jobs)
+            return {k: v for k,v in jobs.items() if jobFilter.match(v)}
+        api_instance = self._status_api()
+        jobs = self._call("jobs", lambda: api_instance.jobs_get(self._apikey, self._username))
+        if self._jobs_ttl > 0:
+            self._jobs_snapshot = (time(), jobs)
+        if self._names is not None:
+            self._names.update({v.job_name: int(k) for k,v in jobs.items() if v.job_name})
+            self._names.save()
+        if self._completions is not None:
+            self._completions.updateJobs({k: v.job_name for k,v in jobs.items()})
+            self._completions.save()
+        if self._history is not None:
+            import sqlite3
+
+            try:
+                self._history.sync(jobs)
+            except (OSError, sqlite3.Error):
+                # A locked or unwritable history must not fail the request
+                pass
+        if jobFilter is None:
+            return dict(jobs) if self._jobs_ttl > 0 else jobs
+        return {k: v for k,v in jobs.items() if jobFilter.match(v)}
+
+    def syncHistory(self) -> int:
+        """
+        Syncs the job list into the history, then requests the status of the
+        jobs of the history that left the list without having ended, so that
+        their final status and times are stored. Jobs Jarvice no longer knows
+        are marked unknown. Only run on request (history --sync): jobs()
+        never makes more than one request.
+
+        Returns:
+            number of jobs whose status was requested
+
+        Raises:
+            ValueError: the history is disabled
+            jarviceapi_client.OpenApiException: the job list can't be read
+            OSError
+            sqlite3.Error
+        """
+        if self._history is None:
+            raise ValueError("The history is disabled")
+        jobs = self.jobs()
+        missing = [number for number in self._history.unfinished() if str(number) not in jobs]
+        for number, entries, error in run_bounded(self.status, missing, DEFAULT_MAX_PARALLEL):
+            if error is None and str(number) in entries:
+                continue
+            if error is not None and getattr(error, "status", None) not in (400, 404):
+                # Left for the next sync
+                continue
+            self._history.markUnknown(number)
+        return len(missing)
+
+    def cachedJobs(self) -> Optional[Dict[str, Any]]:
+        """
+        Jobs of the last list kept for reuse, whatever its age, or None.
+        Never makes a request.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            return api_instance.jobs_get(self._apikey, self._username)
+        snapshot = self._jobs_snapshot
+        return dict(snapshot[1]) if snapshot is not None else None
 
-    def shutdown_all(self):
+    def shutdown_all(self, jobFilter : Optional[JobFilter] = None, max_parallel : int = DEFAULT_MAX_PARALLEL) -> List[BulkResult]:
         """
         Cleanly shutdown all currently running jobs
 
+        Args:
+            jobFilter (JobFilter) : only shutdown the jobs it matches
+            max_parallel (int) : maximum number of requests in flight
+
+        Returns:
+            results (List[BulkResult]) : one result per job, with the error
+                raised for this job if any
+
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
         """
-        jobs = self.jobs()
-        for k,_ in jobs.items():
-            self.shutdown(int(k))
+        return self._bulk(self.shutdown, jobFilter, max_parallel)
     
     
-    def terminate_all(self):
+    def terminate_all(self, jobFilter : Optional[JobFilter] = None, max_parallel : int = DEFAULT_MAX_PARALLEL) -> List[BulkResult]:
         """
         Force termination of all jobs (like kill -9)
 
+        Args:
+            jobFilter (JobFilter) : only terminate the jobs it matches
+            max_parallel (int) : maximum number of requests in flight
+
+        Returns:
+            results (List[BulkResult]) : one result per job, with the error
+                raised for this job if any
+
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
         """
-        jobs = self.jobs()
-        for k,_ in jobs.items():
-            self.terminate(int(k))
+        return self._bulk(self.terminate, jobFilter, max_parallel)
 
-    def wait_for(self, job : Union[int, str]):
+    def _bulk(self, action : Callable[[int], None], jobFilter : Optional[JobFilter], max_parallel : int) -> List[BulkResult]:
+        names = {int(k): v.job_name for k,v in self.jobs(jobFilter).items()}
+        return [BulkResult(number, names[number], error)
+                for number,_,error in run_bounded(action, names, max_parallel)]
+
+    def wait_for(self,
+                 jobs : Iterable[Union[int, str]] = (),
+                 jobFilter : Optional[JobFilter] = None,
+                 wait_all : bool = True,
+                 min_interval : float = DEFAULT_MIN_POLL_INTERVAL,
+                 max_interval : float = DEFAULT_MAX_POLL_INTERVAL) -> Dict[int, Any]:
         """
-        Wait for a job to end
+        Wait for jobs to end
+
+        All the jobs are watched with one `jobs()` request per poll. A job
+        missing from it is checked with `status()` to get its final status.
+        The poll interval backs off while nothing changes, up to max_interval,
+        and goes back to min_interval when a job changes state or a running
+        job gets close to its walltime.
+
+        Args:
+            jobs (Iterable[Union[int, str]]) : job numbers and/or job names
+            jobFilter (JobFilter) : also wait for the current jobs it matches
+            wait_all (bool) : wait for every job to end if True, for the first one otherwise
+            min_interval (float) : shortest time between polls, in seconds
+            max_interval (float) : longest time between polls, in seconds
+
+        Returns:
+            entries (Dict[int, Any]) : last job or status entry of every job, by job number
 
         Raises:
-            apiException.OpenApiException
+            jarviceapi_client.OpenApiException
         """
+        numbers = {job for job in jobs if type(job) is int}
+        names = {job for job in jobs if type(job) is str}
+        entries : Dict[int, Any] = {}
+        ended : set = set()
+        interval = min_interval
+        first = True
+
         while True:
-            statusDict = self.status(job)
-            for _,v in statusDict.items():
-                if v.job_status == "COMPLETED WITH ERROR" or v.job_status == "COMPLETED" or v.job_status == "TERMINATED" or v.job_status == "CANCELED":
-                    return
-                else:
-                    sleep(1)
+            changed = False
+            running = {int(k): v for k,v in self.jobs().items()}
+
+            if first and jobFilter is not None:
+                numbers.update(k for k,v in running.items() if jobFilter.match(v))
+            for number,entry in running.items():
+                if entry.job_name in names:
+                    names.discard(entry.job_name)
+                    numbers.add(number)
+            # Jobs not found in running jobs have ended (or are unknown by name)
+            for name in names:
+                for k,v in self.status(name).items():
+                    numbers.add(int(k))
+                    running.setdefault(int(k), v)
+            names.clear()
+
+            for number in numbers - ended:
+                entry = running.get(number)
+                if entry is None:
+                    entry = self.status(number).get(str(number))
+                    if entry is None:
+                        raise jarviceapi_client.ApiException(status=404, reason=f"Job {number} not found")
+                previous = entries.get(number)
+                if not first and (previous is None or previous.job_status != entry.job_status):
+                    changed = True
+                entries[number] = entry
+                if entry.job_status in TERMINAL_STATUSES:
+                    ended.add(number)
+            first = False
+
+            if ended == numbers or (not wait_all and ended):
+                return entries
+            interval = self._nextPollInterval(interval, changed,
+                                              [entries[number] for number in numbers - ended],
+                                              min_interval, max_interval)
+            sleep(interval)
+
+    @staticmethod
+    def _nextPollInterval(interval : float, changed : bool, pending : List[Any],
+                          min_interval : float, max_interval : float) -> float:
+        if changed:
+            return min_interval
+        now = time()
+        queued = True
+        for entry in pending:
+            if entry.job_status in STATUS_CODES["PD"]:
+                continue
+            queued = False
+            walltime = parseWalltime(getattr(entry, "job_walltime", None))
+            start = getattr(entry, "job_start_time", None)
+            # Close to the expected end of the job
+            if walltime and start and now - start >= walltime * 0.9:
+                return min_interval
+        # Queued jobs can stay queued for a long time, back off faster
+        return min(max_interval, interval * (2 if queued else 1.25))
+
+    def _vault(self, storage : str, pool_size : int):
+        from jarvice_cli.vault import VaultStorage
+
+        if not self._storage_url:
+            raise ValueError("No storage url: set --storage-url, JARVICE_STORAGE_URL or storage_url in ~/.jarvice.cfg")
+        return VaultStorage(self._storage_url, storage, self._username, self._apikey,
+                            max(pool_size, self._configuration.connection_pool_maxsize), self._policy)
+
+    def download(self, source: str, destination: str, storage : str, max_parallel : int = DEFAULT_MAX_PARALLEL,
+                 chunk_size : Optional[int] = None, checksum : bool = False,
+                 progress : Optional[Callable[[Any], None]] = None):
+        """
+        Download file or directory
+
+        Files are downloaded in parallel chunks, those already in sync are
+        skipped and interrupted downloads resume (see jarvice_cli.transfer).
+
+        Args:
+            source (str) : file or directory of the vault
+            destination (str) : local file or directory
+            storage (str) : vault name
+            max_parallel (int) : chunks transferred at once
+            chunk_size (int) : size of the chunks, in bytes
+            checksum (bool) : compare and verify files by SHA256
+            progress : called with the TransferStats as chunks complete
+
+        Returns:
+            TransferStats : files transferred, skipped and failed, with their errors
 
-    def download(self, source: str, destination: str, storage : str):
-        """
-        Download file or directory 
-        
         Raises:
-            Exception: Raises an exception.
+            ValueError: no storage url
+            FileNotFoundError: source doesn't exist
+            VaultError: source can't be listed
         """
-        raise Exception("download is not implemented")
+        from jarvice_cli.transfer import DEFAULT_CHUNK_SIZE, Transfer
+
+        vault = self._vault(storage, max_parallel)
+        try:
+            transfer = Transfer(vault, max_parallel, chunk_size or DEFAULT_CHUNK_SIZE, checksum, progress)
+            return transfer.download(source, Path(destination))
+        finally:
+            vault.close()
 
-    def upload(self, source: str, destination: str, storage : str):
+    def upload(self, source: str, destination: str, storage : str, max_parallel : int = DEFAULT_MAX_PARALLEL,
+               chunk_size : Optional[int] = None, checksum : bool = False,
+               progress : Optional[Callable[[Any], None]] = None):
         """
         Upload file or directory
-        
+
+        Files are uploaded in parallel chunks, those already in sync are
+        skipped and interrupted uploads resume (see jarvice_cli.transfer).
+
+        Args:
+            source (str) : local file or directory
+            destination (str) : file or directory of the vault
+            storage (str) : vault name
+            max_parallel (int) : chunks transferred at once
+            chunk_size (int) : size of the chunks, in bytes
+            checksum (bool) : compare and verify files by SHA256
+            progress : called with the TransferStats as chunks complete
+
+        Returns:
+            TransferStats : files transferred, skipped and failed, with their errors
+
         Raises:
-            Exception: Raises an exception.
+            ValueError: no storage url
+            FileNotFoundError: source doesn't exist
+            VaultError: destination can't be listed
         """
-        raise Exception("upload is not implemented")
-    
-    def ls(self, storage : str, remote_dir: Optional[str] = None):
+        from jarvice_cli.transfer import DEFAULT_CHUNK_SIZE, Transfer
+
+        vault = self._vault(storage, max_parallel)
+        try:
+            transfer = Transfer(vault, max_parallel, chunk_size or DEFAULT_CHUNK_SIZE, checksum, progress)
+            return transfer.upload(Path(source), destination)
+        finally:
+            vault.close()
+            listings = self._listings(storage)
+            if listings is not None:
+                # The cached listings may miss the files uploaded
+                listings.clear()
+
+    def _listings(self, storage : str):
         """
-        List files
+        Cache of the listings of a vault, None if the cache is disabled
+        """
+        from jarvice_cli.listing import ListingCache
 
-        Raises:
-            Exception: Raises an exception.
+        if self._cache is None or self._cache.ttl <= 0 or not self._storage_url:
+            return None
+        return ListingCache(self._cache.directory / "listings", self._storage_url, storage, self._cache.ttl)
+
+    def ls(self, storage : str, remote_dir: Optional[str] = None, recursive : bool = False,
+           max_parallel : int = DEFAULT_MAX_PARALLEL, cached : bool = False,
+           errors : Optional[List[Tuple[str, BaseException]]] = None):
         """
-        raise Exception("ls is not implemented")
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            return api_instance.vault_get(self._apikey, self._username)
+        List files
+
+        Entries are yielded as the storage sends them, directories of any
+        size being listed in constant memory. Recursive listings list up to
+        max_parallel directories at once, so entries are not in a set
+        order. Complete listings are stored in the listing cache, if the
+        cache is enabled.
+
+        Args:
+            storage (str) : vault name
+            remote_dir (str) : directory of the vault, its top directory if None
+            recursive (bool) : list subdirectories too
+            max_parallel (int) : directories listed at once
+            cached (bool) : use the cached listing if it is still valid
+            errors (list) : (directory, error) of the subdirectories that can't
+                be listed are appended to it. If None, the first error is raised.
+
+        Yields:
+            RemoteEntry : path in the vault, type, size, modification time and etag
 
-    def apps(self):
+        Raises:
+            ValueError: no storage url
+            VaultError: the directory can't be listed
+        """
+        remote_dir = remote_dir or "/"
+        listings = self._listings(storage)
+        if cached and listings is not None:
+            entries = listings.load(remote_dir, recursive)
+            if entries is not None:
+                yield from entries
+                return
+        failures : List[Tuple[str, BaseException]] = []
+        vault = self._vault(storage, max_parallel)
+        try:
+            if recursive:
+                entries = vault.tree(remote_dir, max_parallel, failures if errors is not None else None)
+            else:
+                entries = vault.iterList(remote_dir)
+            if listings is None:
+                yield from entries
+                return
+            with listings.writer(remote_dir, recursive) as listing:
+                for entry in entries:
+                    listing.write(entry)
+                    yield entry
+                if failures:
+                    listing.discard()
+        finally:
+            vault.close()
+            if errors is not None:
+                errors.extend(failures)
+
+    def apps(self, refresh : bool = False, offline : bool = False):
         """
         List apps
 
+        The catalog is read from the cache if it holds a valid copy.
+
+        Args:
+            refresh (bool) : ignore the cached catalog and download it again
+            offline (bool) : only use the cached catalog, even if expired
+
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            appDefList = api_instance.apps_get(self._apikey, self._username)
-            return appDefList
+        apps = self._cachedCatalog("apps", jarviceapi_client.App, refresh, offline,
+                                   lambda: self._call("apps", lambda: self._status_api().apps_get(self._apikey, self._username)))
+        self._indexCatalog("apps", apps)
+        return apps
 
-    def app(self, name : str):
+    def app(self, name : str, refresh : bool = False, offline : bool = False):
         """
         Gives a schema describing AppDef
 
+        The app is looked up in the cached catalog of apps(), which is
+        downloaded if not cached yet. Apps missing from it are requested.
+
+        Args:
+            refresh (bool) : ignore the cached catalog and download it again
+            offline (bool) : only use the cached catalog, even if expired
+
         Raises:
             Exception: Raises an exception.
         """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
+        if self._cache is not None and not refresh:
+            apps = self._memoryCatalog("apps", offline)
+            if apps is not None and name in apps:
+                return {name: apps[name]}
+            catalog = self._cache.load("apps", stale_ok=offline)
+            if catalog is None and not offline:
+                apps = self.apps(refresh=True)
+                if name in apps:
+                    return {name: apps[name]}
+            elif catalog is not None and name in catalog:
+                return {name: jarviceapi_client.App.from_dict(catalog[name])}
+        if offline:
+            raise jarviceapi_client.ApiException(status=0, reason=f"App {name} is not cached (offline)")
+        api_instance = self._status_api()
             
-            return api_instance.apps_get(self._apikey, self._username, name=name)
+        return self._call("app", lambda: api_instance.apps_get(self._apikey, self._username, name=name))
 
 
-    def machines(self):
+    def machines(self, refresh : bool = False, offline : bool = False):
         """
         List all instances
 
-        Raises:
-            apiException.OpenApiException
-        """
-        with jarviceapi_client.ApiClient(self._configuration) as api_client:
-            api_instance = jarviceapi_client.StatusAndInformationApi(api_client)
-            return api_instance.machines_get(self._apikey, self._username)
+        The list is read from the cache if it holds a valid copy.
 
+        Args:
+            refresh (bool) : ignore the cached list and download it again
+            offline (bool) : only use the cached list, even if expired
+
+        Raises:
+            jarviceapi_client.OpenApiException
+        """
+        machines = self._cachedCatalog("machines", jarviceapi_client.MachineDef, refresh, offline,
+                                       lambda: self._call("machines", lambda: self._status_api().machines_get(self._apikey, self._username)))
+        self._indexCatalog("machines", machines)
+        return machines
+
+    def _indexCatalog(self, name : str, catalog : Dict[str, Any]):
+        if self._completions is not None:
+            self._completions.updateNames(name, catalog.keys())
+            self._completions.save()
+
+    def _memoryCatalog(self, name : str, offline : bool) -> Optional[Dict[str, Any]]:
+        """
+        Catalog already converted to models by this instance, None if absent or expired
+        """
+        entry = self._catalogs.get(name)
+        if entry is None or self._cache is None:
+            return None
+        if not offline and time() - entry[0] > self._cache.ttl:
+            return None
+        return entry[1]
+
+    def _cachedCatalog(self, name : str, model : Any, refresh : bool, offline : bool, fetch : Callable[[], Dict[str, Any]]):
+        if self._cache is not None and not refresh:
+            catalog = self._memoryCatalog(name, offline)
+            if catalog is not None:
+                return catalog
+            stamped = self._cache.loadStamped(name, stale_ok=offline)
+            if stamped is not None:
+                catalog = {k: model.from_dict(v) for k,v in stamped[1].items()}
+                self._catalogs[name] = (stamped[0], catalog)
+                return catalog
+        if offline:
+            raise jarviceapi_client.ApiException(status=0, reason=f"No {name} in cache (offline)")
+        catalog = fetch()
+        if self._cache is not None:
+            self._cache.store(name, {k: v.to_dict() for k,v in catalog.items()})
+            self._catalogs[name] = (time(), catalog)
+        return catalog
@@ -0,0 +1,194 @@
+import datetime
+import heapq
+from itertools import islice
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Jarvice job status grouped by their short code, as displayed by `jobs`
+STATUS_CODES = {
+    "CD": ("COMPLETED",),
+    "CG": ("EXEMPT",),
+    "F": ("COMPLETED WITH ERROR",),
+    "PD": ("SUBMITTED", "SEQUENTIALLY QUEUED"),
+    "R": ("PROCESSING STARTING",),
+    "ST": ("TERMINATED", "CANCELED"),
+}
+
+# Status of a job that has ended
+TERMINAL_STATUSES = ("COMPLETED", "COMPLETED WITH ERROR", "TERMINATED", "CANCELED")
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parseDuration(duration : str) -> int:
+    """
+    Converts a duration such as 90, 30s, 15m, 2h or 1d to seconds
+
+    Raises:
+        ValueError: the duration can't be parsed
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*([smhdw]?)\s*", duration)
+    if match is None:
+        raise ValueError(f"Invalid duration '{duration}' (expected e.g. 90, 30s, 15m, 2h, 1d)")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
+
+
+def parseTime(value : str, now : Optional[float] = None) -> float:
+    """
+    Converts a point in time to a timestamp: either a duration ago (2h, 1d...)
+    or an ISO 8601 date (2024-05-01, 2024-05-01T12:00), in local time unless
+    it has an offset
+
+    Raises:
+        ValueError: the value can't be parsed
+    """
+    try:
+        return (time.time() if now is None else now) - parseDuration(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}' (expected a duration ago such as 2h or 1d, or a date such as 2024-05-01)")
+
+
+def parseWalltime(walltime : Optional[str]) -> Optional[int]:
+    """
+    Converts a Jarvice walltime ([[DD:]HH:]MM:SS) to seconds, None if unset or invalid
+    """
+    if not walltime:
+        return None
+    try:
+        seconds = 0
+        for factor, part in zip((1, 60, 3600, 86400), reversed(walltime.strip().split(":"))):
+            seconds += factor * int(part)
+        return seconds or None
+    except ValueError:
+        return None
+
+
+def expandStatus(statuses : Iterable[str]) -> List[str]:
+    """
+    Converts status names or short codes (R, PD, CD...) to Jarvice status names
+    """
+    expanded = []
+    for status in statuses:
+        status = status.strip().upper()
+        expanded.extend(STATUS_CODES.get(status, (status,)))
+    return expanded
+
+
+class JobFilter:
+    """
+    Selects jobs from `jarviceapi.jobs()` entries
+
+    Every criteria left to None matches all jobs.
+    """
+    _status : Optional[List[str]]
+    _app : Optional[str]
+    _name : Optional[re.Pattern]
+    _user : Optional[str]
+    _older_than : Optional[int]
+    _machine : Optional[str]
+    _since : Optional[float]
+    _until : Optional[float]
+
+    def __init__(self,
+                 status : Optional[Iterable[str]] = None,
+                 app : Optional[str] = None,
+                 name : Optional[str] = None,
+                 user : Optional[str] = None,
+                 older_than : Optional[int] = None,
+                 machine : Optional[str] = None,
+                 since : Optional[float] = None,
+                 until : Optional[float] = None):
+        """
+        Args:
+            status : status names or short codes (R, PD, CD...)
+            app : application name
+            name : regular expression searched in the job name
+            user : owner username
+            older_than : minimum age of the job in seconds, since submission
+            machine : machine type the job was submitted to
+            since : only jobs submitted at or after this timestamp
+            until : only jobs submitted before this timestamp
+        """
+        self._status = expandStatus(status) if status else None
+        self._app = app
+        self._name = re.compile(name) if name is not None else None
+        self._user = user
+        self._older_than = older_than
+        self._machine = machine
+        self._since = since
+        self._until = until
+
+    def match(self, jobEntry) -> bool:
+        if self._status is not None and jobEntry.job_status not in self._status:
+            return False
+        if self._app is not None and jobEntry.job_application != self._app:
+            return False
+        if self._name is not None and (jobEntry.job_name is None or self._name.search(jobEntry.job_name) is None):
+            return False
+        if self._user is not None and jobEntry.job_owner_username != self._user:
+            return False
+        if self._older_than is not None:
+            if not jobEntry.job_submit_time or time.time() - jobEntry.job_submit_time < self._older_than:
+                return False
+        if self._since is not None and (not jobEntry.job_submit_time or jobEntry.job_submit_time < self._since):
+            return False
+        if self._until is not None and (not jobEntry.job_submit_time or jobEntry.job_submit_time >= self._until):
+            return False
+        if self._machine is not None and machineType(jobEntry) != self._machine:
+            return False
+        return True
+
+
+def machineType(jobEntry) -> Optional[str]:
+    """
+    Machine type a job was submitted to, None if unknown
+    """
+    submission = getattr(jobEntry, "job_api_submission", None)
+    if submission is None or submission.machine is None:
+        return None
+    return submission.machine.type
+
+
+# Keys `jobs --sort` accepts, from (job number, entry) to a comparable value
+SORT_KEYS : Dict[str, Callable] = {
+    "number": lambda number, entry: int(number),
+    "name": lambda number, entry: entry.job_name or "",
+    "app": lambda number, entry: entry.job_application or "",
+    "user": lambda number, entry: entry.job_owner_username or "",
+    "status": lambda number, entry: entry.job_status or "",
+    "submitted": lambda number, entry: entry.job_submit_time or 0,
+    "machine": lambda number, entry: machineType(entry) or "",
+}
+
+
+def sortJobs(jobs : Dict, sort : Optional[str] = None, reverse : bool = False, limit : Optional[int] = None) -> Dict:
+    """
+    Sorts and truncates a job dictionnary
+
+    Args:
+        jobs : job number to entry, as returned by jarviceapi.jobs()
+        sort : one of SORT_KEYS, None to keep the order of the API
+        reverse : sort in descending order
+        limit : maximum number of jobs to keep, None for all
+
+    Raises:
+        ValueError: unknown sort key
+    """
+    if sort is None:
+        if limit is None:
+            return jobs
+        return dict(islice(jobs.items(), limit))
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Invalid sort key '{sort}' (expected one of {', '.join(SORT_KEYS)})")
+    key = SORT_KEYS[sort]
+    itemKey = lambda item: key(*item)
+    if limit is None:
+        return dict(sorted(jobs.items(), key=itemKey, reverse=reverse))
+    # Only keeps the first rows instead of sorting all jobs
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return dict(select(limit, jobs.items(), key=itemKey))
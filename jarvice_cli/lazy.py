@@ -0,0 +1,27 @@
+import importlib
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name : str) -> ModuleType:
+    """
+    Imports a top-level module, deferring its execution to the first
+    access to one of its attributes. Keeps heavy dependencies (the
+    generated API client, rich) out of the startup of commands that
+    don't use them.
+
+    Raises:
+        ModuleNotFoundError: the module is not installed
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
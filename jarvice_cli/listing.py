@@ -0,0 +1,167 @@
+"""
+Listings of vault directories cached on disk
+
+A listing is stored as NDJSON, a header line followed by one entry per
+line, so that it is written and read back as a stream whatever the
+number of files. A directory is looked up in its own listing, else in
+the recursive listing of one of its parents.
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from jarvice_cli.vault import RemoteEntry, joinPath
+
+# Shared, json.dumps would build an encoder per entry
+_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+
+class ListingCache:
+    """
+    Listings of the directories of a vault, with a TTL
+    """
+    def __init__(self, directory : Path, storage_url : str, vault : str, ttl : int):
+        """
+        Args:
+            directory (Path) : directory the listings are stored in
+            storage_url (str) : url of the storage of the vault
+            vault (str) : vault name
+            ttl (int) : time a listing stays valid, in seconds
+        """
+        self._directory = directory
+        self._scope = f"{storage_url.rstrip('/')}\0{vault}"
+        self._ttl = ttl
+
+    def _path(self, path : str, recursive : bool) -> Path:
+        key = hashlib.sha256(f"{self._scope}\0{path}\0{int(recursive)}".encode()).hexdigest()[:32]
+        return self._directory / f"{key}.ndjson"
+
+    def _candidates(self, path : str, recursive : bool) -> List[Tuple[str, bool]]:
+        candidates = [(path, recursive)] if recursive else [(path, False), (path, True)]
+        parent = path
+        while parent != "/":
+            parent = parent.rsplit("/", 1)[0] or "/"
+            candidates.append((parent, True))
+        return candidates
+
+    def load(self, path : str, recursive : bool = False) -> Optional[Iterator[RemoteEntry]]:
+        """
+        Entries of a directory, or None if no valid listing holds them
+        """
+        path = joinPath(path)
+        for candidate, candidateRecursive in self._candidates(path, recursive):
+            try:
+                listing_hd = open(self._path(candidate, candidateRecursive))
+            except OSError:
+                continue
+            try:
+                header = json.loads(listing_hd.readline() or "{}")
+            except ValueError:
+                header = {}
+            if time.time() - header.get("time", 0) <= self._ttl:
+                return self._read(listing_hd, path, recursive, candidate != path)
+            listing_hd.close()
+        return None
+
+    @staticmethod
+    def _read(listing_hd, path : str, recursive : bool, filtered : bool) -> Iterator[RemoteEntry]:
+        prefix = path.rstrip("/") + "/"
+        with listing_hd:
+            for line in listing_hd:
+                try:
+                    entry = RemoteEntry(*json.loads(line))
+                except (TypeError, ValueError):
+                    continue
+                if filtered or not recursive:
+                    if not entry.path.startswith(prefix):
+                        continue
+                    if not recursive and "/" in entry.path[len(prefix):]:
+                        continue
+                yield entry
+
+    @contextmanager
+    def writer(self, path : str, recursive : bool = False) -> Iterator["ListingWriter"]:
+        """
+        Yields a writer storing the entries of a directory. The listing
+        replaces the previous one if the block ends without an error and
+        the writer wasn't discarded.
+        """
+        import tempfile
+
+        path = joinPath(path)
+        target = self._path(path, recursive)
+        writer = ListingWriter()
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.")
+            writer.open(os.fdopen(fd, "w"), {"time": time.time(), "path": path, "recursive": recursive})
+        except OSError:
+            writer.discard()
+            yield writer
+            return
+        try:
+            yield writer
+        except BaseException:
+            writer.discard()
+            raise
+        finally:
+            try:
+                if writer.close():
+                    os.replace(tmp, target)
+                else:
+                    os.unlink(tmp)
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Removes every listing of the directory, whatever its vault
+        """
+        for path in self._directory.glob("*.ndjson"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+class ListingWriter:
+    """
+    Entries of a listing being written. Write errors discard the listing,
+    the cache is only an optimization.
+    """
+    def __init__(self):
+        self._listing_hd = None
+        self._discarded = False
+
+    def open(self, listing_hd, header : dict):
+        self._listing_hd = listing_hd
+        listing_hd.write(json.dumps(header) + "\n")
+
+    def write(self, entry : RemoteEntry):
+        if self._discarded:
+            return
+        try:
+            self._listing_hd.write(_ENCODER.encode(entry) + "\n")
+        except OSError:
+            self.discard()
+
+    def discard(self):
+        """
+        Drops the listing, e.g. because it is incomplete
+        """
+        self._discarded = True
+
+    def close(self) -> bool:
+        """
+        Closes the file, returns whether the listing is to be kept
+        """
+        if self._listing_hd is not None:
+            try:
+                self._listing_hd.close()
+            except OSError:
+                self._discarded = True
+        return not self._discarded
@@ -0,0 +1,110 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from jarvice_cli.cache import atomicWrite, endpointDir
+
+# Number of names kept in the index, the most recent jobs win
+MAX_INDEXED_NAMES = 20000
+
+
+class NameIndex:
+    """
+    Job name to job number index, scoped to an endpoint and user
+
+    It is filled in by `jarviceapi.jobs()` and `jarviceapi.submitJson()`, so
+    commands given a job name can call the API by number. Changes are kept in
+    memory and written by save(). An instance can be shared between threads.
+    """
+    _path : Path
+    _names : Optional[Dict[str, int]]
+    _dirty : bool
+
+    def __init__(self, url : str, username : str, directory : Optional[Path] = None):
+        """
+        Args:
+            url (str) : endpoint url
+            username (str) : Jarvice user
+            directory (Path) : directory of the index, defaults to endpointDir(url, username)
+        """
+        self._path = (directory if directory is not None else endpointDir(url, username)) / "names.json"
+        self._names = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _load(self) -> Dict[str, int]:
+        # Called with the lock held
+        if self._names is None:
+            try:
+                with open(self._path) as index_hd:
+                    self._names = {str(k): int(v) for k,v in json.load(index_hd).items()}
+            except (OSError, ValueError, TypeError, AttributeError):
+                self._names = {}
+        return self._names
+
+    def get(self, name : str) -> Optional[int]:
+        """
+        Number of the job with this name, None if unknown
+        """
+        with self._lock:
+            return self._load().get(name)
+
+    def items(self) -> Iterable[Tuple[str, int]]:
+        with self._lock:
+            return sorted(self._load().items(), key=lambda item: item[1])
+
+    def update(self, names : Dict[str, int]):
+        """
+        Adds or updates names, without writing them
+        """
+        with self._lock:
+            index = self._load()
+            for name, number in names.items():
+                if name and index.get(name) != number:
+                    index[name] = number
+                    self._dirty = True
+
+    def discard(self, name : str):
+        """
+        Removes a stale name, without writing the index
+        """
+        with self._lock:
+            if self._load().pop(name, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """
+        Writes the index if it changed. Errors are ignored, the index is only an optimization.
+        """
+        with self._lock:
+            if not self._dirty or self._names is None:
+                return
+            if len(self._names) > MAX_INDEXED_NAMES:
+                kept = sorted(self._names.items(), key=lambda item: item[1])[-MAX_INDEXED_NAMES:]
+                self._names = dict(kept)
+            try:
+                atomicWrite(self._path, json.dumps(self._names, separators=(",", ":")))
+                self._dirty = False
+            except OSError:
+                pass
+
+    def clear(self, name : Optional[str] = None):
+        """
+        Removes a name, or every name, from the index on disk
+        """
+        if name is not None:
+            self.discard(name)
+            self.save()
+            return
+        with self._lock:
+            self._names = {}
+            self._dirty = False
+            try:
+                self._path.unlink()
+            except OSError:
+                pass
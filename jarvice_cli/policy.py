@@ -0,0 +1,302 @@
+"""
+Retry, backoff, timeout, rate limiting and circuit breaking of API calls
+
+Every request jarviceapi makes goes through a CallPolicy. Idempotent calls
+are retried on transient errors (5xx, 429, timeouts, connection errors)
+with exponential backoff and full jitter, within an overall deadline.
+Every request gets a timeout, at most the time left before the deadline.
+A token bucket bounds the request rate and a circuit breaker fails fast
+while the endpoint keeps failing.
+"""
+from __future__ import annotations
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from jarvice_cli.lazy import lazy_import
+from jarvice_cli.ratelimit import TokenBucket
+
+jarviceapi_client = lazy_import("jarviceapi_client")
+urllib3 = lazy_import("urllib3")
+
+T = TypeVar("T")
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 10.0
+DEFAULT_REQUEST_TIMEOUT = 30.0
+DEFAULT_DEADLINE = 120.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+# HTTP status worth retrying: rate limited or the server is failing
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive transient failures
+
+    Once open, calls are refused for `cooldown` seconds, then a single call
+    is let through: its success closes the breaker, its failure opens it
+    again. Thread-safe.
+    """
+    def __init__(self, threshold : int = DEFAULT_BREAKER_THRESHOLD, cooldown : float = DEFAULT_BREAKER_COOLDOWN):
+        """
+        Args:
+            threshold (int) : consecutive failures opening the breaker, 0 to disable it
+            cooldown (float) : time the breaker stays open, in seconds
+        """
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened : Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[float]:
+        """
+        Returns None if a call may be made, else the time left before the
+        breaker lets a call through, in seconds
+        """
+        if self._threshold <= 0:
+            return None
+        with self._lock:
+            if self._opened is None:
+                return None
+            left = self._opened + self._cooldown - time.monotonic()
+            if left > 0:
+                return left
+            if self._probing:
+                # Another call is probing the endpoint
+                return self._cooldown
+            self._probing = True
+            return None
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def release(self):
+        """
+        Ends a probe that got no answer (e.g. interrupted): the breaker stays
+        open and the next call after the cooldown probes again
+        """
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._threshold > 0 and self._failures >= self._threshold):
+                self._opened = time.monotonic()
+            self._probing = False
+
+
+class CallPolicy:
+    """
+    Retry, timeout, rate limiting and circuit breaking of API calls
+
+    An instance is shared by every call of a jarviceapi, and can be shared
+    between threads.
+    """
+    def __init__(self,
+                 retries : int = DEFAULT_RETRIES,
+                 backoff : float = DEFAULT_BACKOFF,
+                 max_backoff : float = DEFAULT_MAX_BACKOFF,
+                 request_timeout : Optional[float] = DEFAULT_REQUEST_TIMEOUT,
+                 deadline : Optional[float] = DEFAULT_DEADLINE,
+                 rate : Optional[float] = None,
+                 burst : Optional[float] = None,
+                 breaker_threshold : int = DEFAULT_BREAKER_THRESHOLD,
+                 breaker_cooldown : float = DEFAULT_BREAKER_COOLDOWN):
+        """
+        Args:
+            retries (int) : retries of an idempotent call after a transient error
+            backoff (float) : first backoff, in seconds, doubled on every retry
+            max_backoff (float) : longest backoff, in seconds
+            request_timeout (float) : timeout of a single request, in seconds, None for none
+            deadline (float) : longest time a call takes with its retries, in seconds, None for none
+            rate (float) : maximum number of requests per second, None for no limit
+            burst (float) : requests allowed at once above the rate, defaults to max(1, rate)
+            breaker_threshold (int) : consecutive failures opening the circuit breaker, 0 to disable it
+            breaker_cooldown (float) : time the circuit breaker stays open, in seconds
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.request_timeout = request_timeout
+        self.deadline = deadline
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        # End of the call made by the current thread, read by the transport
+        self._local = threading.local()
+
+    @classmethod
+    def fromConfig(cls, values : Dict[str, Any]) -> "CallPolicy":
+        """
+        Policy from settings named like the arguments of __init__, missing or
+        None ones keeping their default
+
+        Raises:
+            ValueError: invalid value
+        """
+        kwargs = {}
+        for name, kind in (("retries", int), ("backoff", float), ("max_backoff", float),
+                           ("request_timeout", float), ("deadline", float), ("rate", float),
+                           ("burst", float), ("breaker_threshold", int), ("breaker_cooldown", float)):
+            value = values.get(name)
+            if value is None or value == "":
+                continue
+            value = kind(value)
+            if value < 0:
+                raise ValueError(f"{name} must not be negative")
+            if name in ("request_timeout", "deadline", "rate") and value == 0:
+                # 0 disables these limits
+                value = None
+            kwargs[name] = value
+        return cls(**kwargs)
+
+    def key(self) -> tuple:
+        """
+        Settings of the policy, to tell policies apart
+        """
+        return (self.retries, self.backoff, self.max_backoff, self.request_timeout, self.deadline,
+                self._bucket and (self._bucket._rate, self._bucket._burst),
+                self._breaker._threshold, self._breaker._cooldown)
+
+    def bounded(self, deadline : float) -> "CallPolicy":
+        """
+        Policy with the same settings, calls and requests ending within
+        deadline seconds, and its own rate limit and circuit breaker
+        (e.g. for another endpoint)
+        """
+        return CallPolicy(self.retries, self.backoff, self.max_backoff,
+                          min(self.request_timeout, deadline) if self.request_timeout is not None else deadline,
+                          min(self.deadline, deadline) if self.deadline is not None else deadline,
+                          self._bucket._rate if self._bucket is not None else None,
+                          self._bucket._burst if self._bucket is not None else None,
+                          self._breaker._threshold, self._breaker._cooldown)
+
+    def requestTimeout(self) -> Optional[float]:
+        """
+        Timeout of the next request of the current thread: the request
+        timeout, bounded by the time left before the deadline of its call
+        """
+        end = getattr(self._local, "end", None)
+        if end is None:
+            return self.request_timeout
+        left = max(0.001, end - time.monotonic())
+        return left if self.request_timeout is None else min(self.request_timeout, left)
+
+    @staticmethod
+    def transient(error : BaseException) -> bool:
+        """
+        Whether an error may go away by retrying
+        """
+        if isinstance(error, jarviceapi_client.ApiException):
+            return getattr(error, "status", None) in RETRY_STATUSES
+        return isinstance(error, (urllib3.exceptions.HTTPError, TimeoutError, ConnectionError))
+
+    def _retryAfter(self, error : BaseException) -> Optional[float]:
+        headers = getattr(error, "headers", None)
+        if not headers:
+            return None
+        try:
+            value = headers.get("Retry-After")
+            return float(value) if value is not None else None
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def call(self, fn : Callable[[], T], idempotent : bool = True) -> T:
+        """
+        Calls fn, retrying it on transient errors if idempotent
+
+        Raises:
+            jarviceapi_client.ApiException: the last error of fn, or status 0
+                if the circuit breaker is open, the rate limit can't be met
+                before the deadline or the endpoint can't be reached
+            the last error of fn if it is not transient
+        """
+        start = time.monotonic()
+        end = start + self.deadline if self.deadline is not None else None
+        attempt = 0
+        while True:
+            # The rate limit is waited for first: a probe let through by the
+            # breaker must reach fn
+            if self._bucket is not None:
+                timeout = None if end is None else max(0.0, end - time.monotonic())
+                if not self._bucket.acquire(timeout=timeout):
+                    raise jarviceapi_client.ApiException(status=0, reason="Deadline exceeded waiting for the rate limit")
+            wait = self._breaker.allow()
+            if wait is not None:
+                raise jarviceapi_client.ApiException(status=0, reason=f"Circuit open after repeated failures, retry in {wait:.1f}s")
+            self._local.end = end
+            try:
+                result = fn()
+            except Exception as error:
+                if not self.transient(error):
+                    # The endpoint answered, it is up
+                    self._breaker.success()
+                    raise
+                self._breaker.failure()
+                if not idempotent or attempt >= self.retries:
+                    self._raise(error)
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+                retryAfter = self._retryAfter(error)
+                if retryAfter is not None:
+                    delay = max(delay, min(retryAfter, self.max_backoff))
+                if end is not None and time.monotonic() + delay >= end:
+                    self._raise(error)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Interrupted (KeyboardInterrupt...): a probe must not keep the breaker open forever
+                self._breaker.release()
+                raise
+            finally:
+                self._local.end = None
+            self._breaker.success()
+            return result
+
+    @staticmethod
+    def _raise(error : Exception):
+        """
+        Raises a transient error, as an ApiException if it came from urllib3
+        """
+        if isinstance(error, jarviceapi_client.ApiException):
+            raise error
+        raise jarviceapi_client.ApiException(status=0, reason=str(error)) from error
+
+    def wrap(self, pool_manager):
+        """
+        Wraps the urllib3 pool manager of the client, to give requests their timeout
+        """
+        return TimeoutPoolManager(pool_manager, self)
+
+
+class TimeoutPoolManager:
+    """
+    Pool manager giving every request the timeout of its CallPolicy
+    """
+    def __init__(self, inner, policy : CallPolicy):
+        self._inner = inner
+        self._policy = policy
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def request(self, method : str, url : str, **kwargs):
+        if kwargs.get("timeout") is None:
+            timeout = self._policy.requestTimeout()
+            if timeout is not None:
+                kwargs["timeout"] = urllib3.Timeout(total=timeout)
+        if kwargs.get("retries") is None:
+            # Retries are made by the policy: urllib3 retrying too would
+            # multiply them, and make a request outlive its timeout
+            kwargs["retries"] = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5)
+        return self._inner.request(method, url, **kwargs)
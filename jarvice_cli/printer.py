@@ -1,17 +1,174 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import csv
+from enum import Enum
 import os
+import shlex
+import subprocess
 import sys
-from typing import Dict, List, Union, Tuple
-from pydantic import StrictStr
-import rich
-import rich.table
-import rich.style
-import rich.color
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Union, Tuple
 import json
-import jarviceapi_client as api
 import datetime
+import time
 
 import typer
 
+from jarvice_cli.lazy import lazy_import
+
+if TYPE_CHECKING:
+    from pydantic import StrictStr
+    import jarviceapi_client as api
+    from jarvice_cli.batch import SubmitResult
+    from jarvice_cli.bulk import BulkResult
+    from jarvice_cli.transfer import TransferStats
+    from jarvice_cli.vault import RemoteEntry
+
+# rich is only loaded when RichPrinter is used
+rich = lazy_import("rich")
+
+# Above this number of jobs, RichPrinter streams rows instead of building a rich table
+RICH_TABLE_MAX_ROWS = 500
+# Shortest time between two updates of the transfer progress, in seconds
+PROGRESS_INTERVAL = 0.2
+
+
+class OutputFormat(str, Enum):
+    """
+    Machine readable output formats
+    """
+    ndjson = "ndjson"
+    csv = "csv"
+    tsv = "tsv"
+
+
+def parseFields(fields : Optional[str]) -> Optional[List[str]]:
+    """
+    Splits a comma separated list of fields, None if no field is given
+    """
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    return names or None
+
+
+def fieldValue(record, path : str):
+    """
+    Returns the value of a dotted field (e.g. job_api_submission.machine.type)
+    of a model, None if one of its parts is missing
+    """
+    value = record
+    for part in path.split("."):
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            value = value.get(part)
+        else:
+            value = getattr(value, part, None)
+    return value
+
+
+def plainValue(value):
+    """
+    Converts models nested in a value to plain dicts, for JSON
+    """
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: plainValue(v) for k,v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plainValue(v) for v in value]
+    return value
+
+
+def formatBytes(size : float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+@contextmanager
+def pagedOutput() -> Iterator[TextIO]:
+    """
+    Yields the file to write long output to: a pager if stdout is a TTY,
+    stdout otherwise. The pager is $JARVICE_CLI_PAGER, else $PAGER, else
+    less -FRX (which exits at once if the output fits on one screen).
+    Set JARVICE_CLI_PAGER to cat or to an empty value to disable it.
+    """
+    pager = os.environ.get("JARVICE_CLI_PAGER", os.environ.get("PAGER", "less -FRX"))
+    if not sys.stdout.isatty() or not pager.strip() or pager.strip() == "cat":
+        yield sys.stdout
+        return
+    try:
+        proc = subprocess.Popen(shlex.split(pager), stdin=subprocess.PIPE, text=True)
+    except OSError:
+        yield sys.stdout
+        return
+    try:
+        yield proc.stdin
+        proc.stdin.close()
+    except BrokenPipeError:
+        # The pager was quit before the end of the output
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+
+
+class StreamTable:
+    """
+    Fixed-width table written row by row, with a single header
+
+    Column widths are worked out from a sample of the first rows, bounded
+    by the maximum width of each column, so only the sample is held in
+    memory whatever the number of rows.
+    """
+    def __init__(self, columns : Sequence[Tuple[str, int]], out : TextIO, sample : int = 200):
+        """
+        Args:
+            columns : title and maximum width of each column
+            out : file rows are written to
+            sample : number of rows used to work out column widths
+        """
+        self._columns = columns
+        self._out = out
+        self._sample = sample
+
+    @staticmethod
+    def fit(value : str, width : int) -> str:
+        if len(value) > width:
+            return value[:width - 3] + "..." if width > 3 else value[:width]
+        return value.ljust(width)
+
+    def writeRows(self, rows : Iterable[Tuple[Sequence[str], Optional[str]]]):
+        """
+        Args:
+            rows : cells of each row, with the ANSI escape sequence styling the row or None
+        """
+        rows = iter(rows)
+        sample = list(islice(rows, self._sample))
+        widths = []
+        for index, (title, maxWidth) in enumerate(self._columns):
+            width = max([len(title)] + [len(cells[index]) for cells,_ in sample])
+            widths.append(min(maxWidth, width))
+
+        fit = self.fit
+        write = self._out.write
+        write(" ".join(fit(title, width) for (title,_), width in zip(self._columns, widths)).rstrip() + "\n")
+        for cells, style in chain(sample, rows):
+            line = " ".join(fit(cell, width) for cell, width in zip(cells, widths)).rstrip()
+            if style:
+                write(f"{style}{line}\x1b[0m\n")
+            else:
+                write(line + "\n")
+        self._out.flush()
+
+
 #TODO Richify a lot
 class GenPrinter:
 
@@ -65,30 +222,37 @@ class GenPrinter:
 
     def printJobEntry(self, jobEntryList : Dict[str, api.JobEntry], verbose=False):
         if verbose:
-            new_dict = {}
-            for id,jobEntry in jobEntryList.items():
-                new_dict[id] = json.loads(jobEntry.to_json())
-            print(json.dumps(new_dict, indent= 2))
+            # to_dict() once per job, to_json() would serialize it only to parse it back
+            print(json.dumps({id: jobEntry.to_dict() for id,jobEntry in jobEntryList.items()}, indent= 2))
         else:
-            for id,jobEntry in jobEntryList.items():
-                deltaTime, nbNodes, machineType = self.extractFromJobEntry(jobEntry)
-                print("ID  ",
-                      "Name"+ 16*" ",
-                      "App"+ 17*" ",
-                      "User"+ 11*" ",
-                      "St",
-                      "Time"+ 6*" ",
-                      "#N  ",
-                      "Machine type", sep=" ")
-                print(f"{self.formatSize(id,4)}",
-                      f"{self.formatSize(jobEntry.job_name, 20)}",
-                      f"{self.formatSize(f'{jobEntry.job_application}/{jobEntry.job_command}',20)}",
-                      f"{self.formatSize(jobEntry.job_owner_username,15)}",
-                      f"{self.shortStatus(jobEntry.job_status)}",
-                      f"{self.formatSize(deltaTime,10)}",
-                      f"{self.formatSize(str(nbNodes), 4)}",
-                      f"{self.formatSize(machineType,18)}",
-                      sep=" ")
+            self.streamJobEntry(jobEntryList)
+
+    # Title and maximum width of the columns of the job list
+    JOB_COLUMNS = (("ID", 10), ("Name", 20), ("App", 20), ("User", 15), ("St", 2),
+                   ("Time", 10), ("#N", 4), ("Machine type", 18))
+
+    def jobRow(self, id : str, jobEntry : api.JobEntry) -> Tuple[str, ...]:
+        deltaTime, nbNodes, machineType = self.extractFromJobEntry(jobEntry)
+        return (id,
+                jobEntry.job_name or "",
+                f"{jobEntry.job_application}/{jobEntry.job_command}",
+                jobEntry.job_owner_username or "",
+                self.shortStatus(jobEntry.job_status),
+                deltaTime,
+                str(nbNodes),
+                str(machineType))
+
+    def statusAnsi(self, status : Union[StrictStr,None]) -> Optional[str]:
+        return None
+
+    def streamJobEntry(self, jobEntryList : Dict[str, api.JobEntry]):
+        """
+        Writes the job list row by row as a fixed-width table, through a pager on a TTY
+        """
+        rows = ((self.jobRow(id, jobEntry), self.statusAnsi(jobEntry.job_status))
+                for id,jobEntry in jobEntryList.items())
+        with pagedOutput() as out:
+            StreamTable(self.JOB_COLUMNS, out).writeRows(rows)
  
     def shortStatus(self, string : Union[StrictStr,None]):
         # Setting color from status
@@ -152,6 +316,119 @@ class GenPrinter:
         if entry.job_walltime:
               print(f"Walltime: {entry.job_walltime}")
     
+    def errorSummary(self, error : BaseException):
+        if getattr(error, "reason", None):
+            return f"({getattr(error, 'status', '')}) {error.reason}"
+        return str(error).splitlines()[0] if str(error) else type(error).__name__
+
+    def printJobStatuses(self, entries : Dict[int, Union[api.JobEntry, api.SchedJobStatusEntry]]):
+        for number,entry in sorted(entries.items()):
+            print(f"{self.formatSize(str(number), 6)}",
+                  f"{self.formatSize(entry.job_name, 20)}",
+                  f"{self.shortStatus(entry.job_status)}",
+                  f"{entry.job_status}",
+                  sep=" ")
+
+    def printBulkResults(self, action : str, results : List[BulkResult]):
+        failed = 0
+        for result in sorted(results, key=lambda result: result.number):
+            if result.error is None:
+                outcome = "OK"
+            else:
+                failed += 1
+                outcome = f"Error : {self.errorSummary(result.error)}"
+            print(f"{self.formatSize(str(result.number), 6)}",
+                  f"{self.formatSize(result.name, 20)}",
+                  outcome,
+                  sep=" ")
+        print(f"{action}: {len(results) - failed} succeeded, {failed} failed")
+
+    def printSubmitResult(self, result : SubmitResult):
+        if result.error is not None:
+            print(f"{result.key}: Error : {self.errorSummary(result.error)}")
+        elif result.skipped:
+            print(f"{result.key}: {result.number} {result.name} (already submitted)")
+        else:
+            print(f"{result.key}: {result.number} {result.name}")
+
+    def printBatchSummary(self, submitted : int, skipped : int, failed : int):
+        print(f"Submitted: {submitted}, already submitted: {skipped}, failed: {failed}")
+
+    def printNames(self, names : Iterable[Tuple[str, int]]):
+        for name, number in names:
+            print(f"{self.formatSize(str(number), 10)} {name}")
+
+    def printClusterHeader(self, cluster : str):
+        print(f"== {cluster} ==")
+
+    def printClusterError(self, cluster : str, error : BaseException):
+        print(f"{cluster}: Error : {self.errorSummary(error)}")
+
+    def printTransferProgress(self, stats : TransferStats):
+        """
+        Progress line on stderr, updated in place, if stderr is a terminal
+        """
+        now = time.monotonic()
+        if not sys.stderr.isatty() or now - getattr(self, "_progressTime", 0.0) < PROGRESS_INTERVAL:
+            return
+        self._progressTime = now
+        done = stats.transferred + stats.skipped + stats.failed
+        sys.stderr.write(f"\r{done}/{stats.files} files  {formatBytes(stats.bytes)}/{formatBytes(stats.total_bytes)}"
+                         f"  {formatBytes(stats.throughput)}/s\033[K")
+        sys.stderr.flush()
+
+    def vaultEntryAnsi(self, entry : RemoteEntry) -> Optional[str]:
+        return None
+
+    def printVaultEntries(self, entries : Iterable[RemoteEntry], root : str, long : bool = False):
+        """
+        Writes entries as they come, with their path relative to root, through a pager on a TTY
+
+        Args:
+            entries : entries to print
+            root : directory listed
+            long : add the type, size and modification time of entries
+        """
+        prefix = root.rstrip("/") + "/"
+        with pagedOutput() as out:
+            write = out.write
+            for entry in entries:
+                name = entry.path[len(prefix):] if entry.path.startswith(prefix) else entry.path
+                if entry.is_dir:
+                    name += "/"
+                style = self.vaultEntryAnsi(entry)
+                if style:
+                    name = f"{style}{name}\x1b[0m"
+                if long:
+                    mtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.mtime)) if entry.mtime else "-"
+                    write(f"{'d' if entry.is_dir else '-'} {entry.size:>14} {mtime:<16} {name}\n")
+                else:
+                    write(name + "\n")
+            out.flush()
+
+    def clearTransferProgress(self):
+        if getattr(self, "_progressTime", None) is not None:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+            self._progressTime = None
+
+    def printTransferSummary(self, action : str, stats : TransferStats):
+        self.clearTransferProgress()
+        for path, error in stats.errors:
+            print(f"{path}: Error : {self.errorSummary(error)}")
+        print(f"{action}: {stats.transferred} transferred, {stats.skipped} already in sync, {stats.failed} failed,",
+              f"{formatBytes(stats.bytes)} in {stats.elapsed:.1f}s ({formatBytes(stats.throughput)}/s)")
+
+    def printHistorySummary(self, by : str, groups : List[Dict]):
+        print(f"{self.formatSize(by.capitalize(), 24)} {'Jobs':>7} {'Avg queue':>10} {'Compute':>12} {'Node hours':>11}")
+        for group in groups:
+            print(f"{self.formatSize(str(group[by]), 24)}",
+                  f"{group['jobs']:>7}",
+                  f"{str(datetime.timedelta(seconds=int(group['avg_queue_time']))):>10}",
+                  f"{str(datetime.timedelta(seconds=group['compute_time'])):>12}",
+                  f"{group['node_hours']:>11}",
+                  sep=" ")
+
     def printApps(self, apps : Dict[str, api.App], verbose = False):
         if verbose:
             print(apps)
@@ -188,12 +465,45 @@ class RichPrinter(GenPrinter):
 
     def __init__(self):
         super().__init__()
+        import rich.console
+        import rich.style
+        import rich.table
+
+    def statusStyle(self, status : Union[StrictStr,None]):
+        # Setting color from status
+        if status == "COMPLETED":
+            return rich.style.Style(color="gray50")
+        elif status == "COMPLETED WITH ERROR" or status =="TERMINATED" or status == "CANCELED":
+            return rich.style.Style(color="dark_red")
+        elif status == "SUBMITTED" or status =="SEQUENTIALLY QUEUED" or status =="EXEMPT":
+            return rich.style.Style(color="yellow")
+        elif status == "PROCESSING STARTING":
+            return rich.style.Style(color="green")
+        else:
+            return rich.style.Style()
+
+    def statusAnsi(self, status : Union[StrictStr,None]) -> Optional[str]:
+        # Same colors as statusStyle, for streamed rows
+        if not sys.stdout.isatty():
+            return None
+        if status == "COMPLETED":
+            return "\x1b[90m"
+        elif status == "COMPLETED WITH ERROR" or status =="TERMINATED" or status == "CANCELED":
+            return "\x1b[31m"
+        elif status == "SUBMITTED" or status =="SEQUENTIALLY QUEUED" or status =="EXEMPT":
+            return "\x1b[33m"
+        elif status == "PROCESSING STARTING":
+            return "\x1b[32m"
+        return None
 
     ##TODO : (TOFIX) jobEntry.job_stats.compute_time is always 0
     def printJobEntry(self, jobEntryList : Dict[str,api.JobEntry], verbose = False):
         if verbose:
             for _,jobEntry in jobEntryList.items():
                 rich.inspect(jobEntry)
+        elif len(jobEntryList) > RICH_TABLE_MAX_ROWS:
+            # A rich table holds and measures every row before printing anything
+            self.streamJobEntry(jobEntryList)
         else:
             """
             Default format : 
@@ -210,17 +520,7 @@ class RichPrinter(GenPrinter):
             table.add_column("Machine type")
 
             for number,jobEntry in jobEntryList.items():
-                # Setting color from status
-                if jobEntry.job_status == "COMPLETED":
-                    rowStyle = rich.style.Style(color="gray")
-                elif jobEntry.job_status == "COMPLETED WITH ERROR" or jobEntry.job_status =="TERMINATED" or jobEntry.job_status == "CANCELED":
-                    rowStyle = rich.style.Style(color="dark_red")
-                elif jobEntry.job_status == "SUBMITTED" or jobEntry.job_status =="SEQUENTIALLY QUEUED" or jobEntry.job_status =="EXEMPT":
-                    rowStyle = rich.style.Style(color="yellow")
-                elif jobEntry.job_status == "PROCESSING STARTING":
-                    rowStyle = rich.style.Style(color="green")
-                else:
-                    rowStyle = rich.style.Style()
+                rowStyle = self.statusStyle(jobEntry.job_status)
                 
                 # Compute time depending on status
                 deltaTime, nbNodes, machineType = self.extractFromJobEntry(jobEntry)
@@ -238,6 +538,100 @@ class RichPrinter(GenPrinter):
             console = rich.console.Console()
             console.print(table)
    
+    def printJobStatuses(self, entries : Dict[int, Union[api.JobEntry, api.SchedJobStatusEntry]]):
+        table = rich.table.Table(style="on black")
+        table.add_column("ID")
+        table.add_column("Name")
+        table.add_column("St")
+        table.add_column("Status")
+        for number,entry in sorted(entries.items()):
+            table.add_row(str(number), entry.job_name, self.shortStatus(entry.job_status), entry.job_status,
+                          style=self.statusStyle(entry.job_status))
+        console = rich.console.Console()
+        console.print(table)
+
+    def printBulkResults(self, action : str, results : List[BulkResult]):
+        failed = sum(1 for result in results if result.error is not None)
+        table = rich.table.Table(title=f"{action}: {len(results) - failed} succeeded, {failed} failed", style="on black")
+        table.add_column("ID")
+        table.add_column("Name")
+        table.add_column("Result")
+        for result in sorted(results, key=lambda result: result.number):
+            if result.error is None:
+                table.add_row(str(result.number), result.name, "OK", style=rich.style.Style(color="green"))
+            else:
+                table.add_row(str(result.number), result.name, self.errorSummary(result.error),
+                              style=rich.style.Style(color="dark_red"))
+        console = rich.console.Console()
+        console.print(table)
+
+    def printSubmitResult(self, result : SubmitResult):
+        console = rich.console.Console()
+        if result.error is not None:
+            console.print(f"{result.key}: Error : {self.errorSummary(result.error)}", style="dark_red", highlight=False)
+        elif result.skipped:
+            console.print(f"{result.key}: {result.number} {result.name} (already submitted)", style="gray50", highlight=False)
+        else:
+            console.print(f"{result.key}: {result.number} {result.name}", style="green", highlight=False)
+
+    def printBatchSummary(self, submitted : int, skipped : int, failed : int):
+        self.newField("Submitted", str(submitted))
+        self.newField("Already submitted", str(skipped))
+        self.newField("Failed", str(failed))
+        self.flushField("Batch")
+
+    def printNames(self, names : Iterable[Tuple[str, int]]):
+        table = rich.table.Table(style="on black")
+        table.add_column("ID")
+        table.add_column("Name")
+        for name, number in names:
+            table.add_row(str(number), name)
+        console = rich.console.Console()
+        console.print(table)
+
+    def printClusterHeader(self, cluster : str):
+        console = rich.console.Console()
+        console.rule(f"[bold]{cluster}", align="left")
+
+    def printClusterError(self, cluster : str, error : BaseException):
+        console = rich.console.Console()
+        console.print(f"{cluster}: Error : {self.errorSummary(error)}", style="red", highlight=False)
+
+    def vaultEntryAnsi(self, entry : RemoteEntry) -> Optional[str]:
+        # Only directories are colored, to keep large listings fast
+        if entry.is_dir and sys.stdout.isatty():
+            return "\x1b[1;34m"
+        return None
+
+    def printTransferSummary(self, action : str, stats : TransferStats):
+        self.clearTransferProgress()
+        console = rich.console.Console()
+        for path, error in stats.errors:
+            console.print(f"{path}: Error : {self.errorSummary(error)}", style="dark_red", highlight=False)
+        self.newField("Transferred", str(stats.transferred))
+        self.newField("Already in sync", str(stats.skipped))
+        self.newField("Failed", str(stats.failed))
+        self.newField("Size", formatBytes(stats.bytes))
+        self.newField("Time", f"{stats.elapsed:.1f}s")
+        self.newField("Throughput", f"{formatBytes(stats.throughput)}/s")
+        self.flushField(action)
+
+    def printHistorySummary(self, by : str, groups : List[Dict]):
+        table = rich.table.Table(style="on black")
+        table.add_column(by.capitalize())
+        table.add_column("Jobs", justify="right")
+        table.add_column("Avg queue", justify="right")
+        table.add_column("Compute", justify="right")
+        table.add_column("Node hours", justify="right")
+        for group in groups:
+            table.add_row(str(group[by]), str(group["jobs"]),
+                          str(datetime.timedelta(seconds=int(group["avg_queue_time"]))),
+                          str(datetime.timedelta(seconds=group["compute_time"])),
+                          str(group["node_hours"]),
+                          style=self.statusStyle(group[by]) if by == "status" else None)
+        console = rich.console.Console()
+        console.print(table)
+
     def printApps(self, apps : Dict[str, api.App], verbose = False):
         if verbose:
             for k,v in apps.items():
@@ -282,4 +676,127 @@ class RichPrinter(GenPrinter):
                 for cmd, data in app.data.commands.items():
                     table.add_row(cmd, data.description)
             console = rich.console.Console()
-            console.print(table)
\ No newline at end of file
+            console.print(table)
+
+class RecordPrinter(GenPrinter):
+    """
+    Prints one record per line, as NDJSON, CSV or TSV
+
+    Records are written as they are converted, without building the whole
+    output first. With fields, only those fields are read from each model;
+    without, NDJSON gets the full record and CSV/TSV a default set of columns.
+    """
+
+    # Default CSV/TSV columns, the first one is the key of the record
+    JOB_FIELDS = ("number", "job_name", "job_application", "job_command", "job_owner_username",
+                  "job_status", "job_submit_time", "job_stats.compute_time",
+                  "job_api_submission.machine.type", "job_api_submission.machine.nodes")
+    STATUS_FIELDS = ("number", "job_name", "job_project", "job_application", "job_command",
+                     "job_status", "job_substatus", "job_submit_time", "job_start_time",
+                     "job_end_time", "job_walltime")
+    MACHINE_FIELDS = ("name", "mc_description", "mc_arch", "mc_cores", "mc_ram", "mc_gpus",
+                      "mc_scale_min", "mc_scale_max", "mc_price")
+    APP_FIELDS = ("id", "data.name", "data.author")
+    VAULT_FIELDS = ("path", "is_dir", "size", "mtime", "etag")
+
+    def __init__(self, output : OutputFormat, fields : Optional[Sequence[str]] = None, out : Optional[TextIO] = None):
+        """
+        Args:
+            output : output format
+            fields : dotted names of the fields to print, all fields if None
+            out : file records are written to, stdout if None
+        """
+        super().__init__()
+        self._output = OutputFormat(output)
+        self._projection = list(fields) if fields else None
+        self._out = out if out is not None else sys.stdout
+        self._columns : Optional[List[str]] = None
+        self._cluster : Optional[str] = None
+        self._writer = None
+        if self._output is not OutputFormat.ndjson:
+            self._writer = csv.writer(self._out, delimiter="\t" if self._output is OutputFormat.tsv else ",",
+                                      lineterminator="\n")
+
+    @staticmethod
+    def cell(value) -> str:
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list, tuple)) or hasattr(value, "to_dict"):
+            return json.dumps(plainValue(value), separators=(",", ":"))
+        return str(value)
+
+    def writeRecord(self, keyName : str, key, record, defaults : Sequence[str]):
+        """
+        Writes a record, the header first for CSV/TSV
+
+        Args:
+            keyName : name of the key of the record (job number, machine name...)
+            key : key of the record
+            record : model to print
+            defaults : CSV/TSV columns used when no field is given
+        """
+        if self._columns is None:
+            # Copied: the cluster column must not be added to the fields given
+            self._columns = list(self._projection or defaults)
+            if self._cluster is not None and "cluster" not in self._columns:
+                self._columns.insert(0, "cluster")
+            if self._writer is not None:
+                self._writer.writerow(self._columns)
+
+        def value(path : str):
+            if path == "cluster" and self._cluster is not None:
+                return self._cluster
+            return key if path == keyName else fieldValue(record, path)
+
+        if self._writer is not None:
+            self._writer.writerow([self.cell(value(path)) for path in self._columns])
+        elif self._projection is None:
+            line = {"cluster": self._cluster} if self._cluster is not None else {}
+            line[keyName] = key
+            line.update(record.to_dict() if hasattr(record, "to_dict") else record)
+            self._out.write(json.dumps(line, separators=(",", ":")) + "\n")
+        else:
+            line = {path: plainValue(value(path)) for path in self._columns}
+            self._out.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+    def printJobEntry(self, jobEntryList : Dict[str, api.JobEntry], verbose=False):
+        for number,jobEntry in jobEntryList.items():
+            self.writeRecord("number", int(number), jobEntry, self.JOB_FIELDS)
+        self._out.flush()
+
+    def printSchedStatusEntry(self, id : int, entry : api.SchedJobStatusEntry):
+        self.writeRecord("number", id, entry, self.STATUS_FIELDS)
+        self._out.flush()
+
+    def printMachines(self, machineList : Dict[str,api.MachineDef]):
+        for name,mc in machineList.items():
+            self.writeRecord("name", name, mc, self.MACHINE_FIELDS)
+        self._out.flush()
+
+    def printApps(self, apps : Dict[str, api.App], verbose = False):
+        for name,app in apps.items():
+            self.writeRecord("id", name, app, self.APP_FIELDS)
+        self._out.flush()
+
+    def printApp(self, app : api.App, verbose = False):
+        self.writeRecord("id", app.id, app, self.APP_FIELDS)
+        self._out.flush()
+
+    def printClusterHeader(self, cluster : str):
+        # Records of every cluster form one stream, tagged with a cluster field
+        self._cluster = cluster
+
+    def printVaultEntries(self, entries : Iterable[RemoteEntry], root : str, long : bool = False):
+        for entry in entries:
+            self.writeRecord("path", entry.path, entry._asdict(), self.VAULT_FIELDS)
+        self._out.flush()
+
+    def printClusterError(self, cluster : str, error : BaseException):
+        # Kept off stdout, which only holds records
+        print(f"{cluster}: Error : {self.errorSummary(error)}", file=sys.stderr)
+
+    def printHistorySummary(self, by : str, groups : List[Dict]):
+        defaults = (by, "jobs", "queue_time", "avg_queue_time", "compute_time", "node_hours")
+        for group in groups:
+            self.writeRecord(by, group[by], group, defaults)
+        self._out.flush()
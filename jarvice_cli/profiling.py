@@ -0,0 +1,114 @@
+"""
+CPU and memory profiling of a command
+
+--profile cpu runs the command under cProfile and --profile mem under
+tracemalloc. The profile is written to a file (pstats, or a tracemalloc
+snapshot) and its top entries are printed on stderr. JARVICE_CLI_PROFILE
+turns it on without changing the command line.
+"""
+import os
+import sys
+import time
+from enum import Enum
+from pathlib import Path
+
+from jarvice_cli.cache import cacheDir
+
+# Entries printed by default: functions by cumulative time, or allocation sites by size
+DEFAULT_PROFILE_TOP = 20
+# Frames kept per allocation by tracemalloc
+MEM_PROFILE_FRAMES = 25
+
+
+class ProfileMode(str, Enum):
+    """
+    What --profile measures
+    """
+    cpu = "cpu"
+    mem = "mem"
+
+
+def profilePath(mode : ProfileMode, command : str) -> Path:
+    """
+    Default profile file: <cache>/profiles/<command>-<date>-<pid>.pstats (or .snapshot)
+    """
+    suffix = "pstats" if mode == ProfileMode.cpu else "snapshot"
+    return cacheDir() / "profiles" / f"{command}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{suffix}"
+
+
+class Profiler:
+    """
+    Profiles the code run between start() and stop()
+
+    The CPU profile only covers the thread that called start(): the worker
+    threads of bulk commands are not profiled. The memory profile covers
+    every thread.
+    """
+    def __init__(self, mode : ProfileMode, path : Path, top : int = DEFAULT_PROFILE_TOP):
+        """
+        Args:
+            mode (ProfileMode) : cpu for cProfile, mem for tracemalloc
+            path (Path) : file the profile is written to
+            top (int) : number of entries printed, 0 to print none
+        """
+        self._mode = mode
+        self._path = path
+        self._top = top
+        self._profile = None
+
+    def start(self):
+        if self._mode == ProfileMode.cpu:
+            import cProfile
+
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            import tracemalloc
+
+            tracemalloc.start(MEM_PROFILE_FRAMES)
+
+    def stop(self, out = None):
+        """
+        Stops profiling, writes the profile and prints its top entries
+
+        Raises:
+            OSError: the profile can't be written
+        """
+        out = out if out is not None else sys.stderr
+        if self._mode == ProfileMode.cpu:
+            self._stopCpu(out)
+        else:
+            self._stopMem(out)
+
+    def _stopCpu(self, out):
+        import pstats
+
+        self._profile.disable()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._profile.dump_stats(self._path)
+        out.write(f"CPU profile written to {self._path}\n")
+        if self._top > 0:
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self._top)
+        out.flush()
+
+    def _stopMem(self, out):
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        snapshot.dump(str(self._path))
+        out.write(f"Memory profile written to {self._path}\n"
+                  f"Allocated at exit {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n")
+        for stat in snapshot.statistics("lineno")[:self._top]:
+            frame = stat.traceback[0]
+            out.write(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}\n")
+        out.flush()
+
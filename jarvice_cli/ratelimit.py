@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+
+    Tokens are added at `rate` per second, up to `burst` tokens.
+    """
+    def __init__(self, rate : float, burst : Optional[float] = None):
+        """
+        Args:
+            rate (float) : tokens added per second
+            burst (float) : maximum number of tokens, defaults to max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._rate = rate
+        self._burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self._burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now : float):
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def try_acquire(self, tokens : float = 1.0) -> bool:
+        """
+        Takes tokens if available, without waiting
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens : float = 1.0, timeout : Optional[float] = None) -> bool:
+        """
+        Waits until tokens are available and takes them
+
+        Args:
+            tokens (float) : number of tokens to take
+            timeout (float) : longest wait in seconds, None to wait as long as needed
+
+        Returns:
+            acquired (bool) : False if the tokens were not available within timeout
+        """
+        end = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self._rate
+            if end is not None:
+                if now + wait > end:
+                    return False
+            time.sleep(wait)
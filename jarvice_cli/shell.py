@@ -0,0 +1,232 @@
+"""
+Interactive shell running jarvice-cli commands in one process
+
+Commands typed in the shell run like in the agent: the session opened for
+their settings by a previous command is reused, with its pooled
+connections, catalogs and job list. The global options given before
+`shell` apply to every command. Lines are kept in a history file, and Tab
+completes command names, options, and job numbers and names, apps and
+machine types from the job lists already received and the completion
+index (no request is made to complete).
+"""
+from __future__ import annotations
+import shlex
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Optional
+
+from jarvice_cli.cache import cacheDir
+from jarvice_cli.completion import optionKind
+
+if TYPE_CHECKING:
+    import click
+
+# Lines kept in the history file
+HISTORY_LENGTH = 1000
+PROMPT = "jarvice> "
+# Commands the shell runs itself
+BUILTINS = ("exit", "quit", "help")
+# Commands that can't run in the shell
+EXCLUDED_COMMANDS = ("shell", "agent")
+
+
+def historyPath() -> Path:
+    return cacheDir() / "shell_history"
+
+
+class Shell:
+    """
+    Prompt loop running jarvice-cli commands
+    """
+    def __init__(self, command : click.Group, prefix : List[str], sessions : Callable[[], Iterable[tuple]],
+                 history : Optional[Path] = None):
+        """
+        Args:
+            command (click.Group) : jarvice-cli command group
+            prefix (List[str]) : global options put before every command
+            sessions : returns the (jarviceapi, JobHistory, NameIndex) sessions
+                opened so far, for completion
+            history (Path) : history file, historyPath() if None
+        """
+        self._command = command
+        self._prefix = prefix
+        self._sessions = sessions
+        self._history = history if history is not None else historyPath()
+        self._matches : List[str] = []
+
+    # Completion
+
+    def _values(self, kind : str) -> List[str]:
+        values = set()
+        for api, _, names in self._sessions():
+            if api.completions is not None:
+                values.update(api.completions.values(kind))
+            jobs = api.cachedJobs() if kind in ("jobs", "names") else None
+            if kind == "jobs":
+                values.update(str(number) for number in jobs or ())
+                if names is not None:
+                    values.update(str(number) for _, number in names.items())
+            elif kind == "names":
+                values.update(job.job_name for job in (jobs or {}).values() if getattr(job, "job_name", None))
+                if names is not None:
+                    values.update(name for name, _ in names.items())
+        return sorted(values, key=int) if kind == "jobs" else sorted(values)
+
+    def _subcommand(self, words : List[str]) -> Optional[Any]:
+        for word in words:
+            if word in self._command.commands:
+                return self._command.commands[word]
+        return None
+
+    @staticmethod
+    def _options(command) -> List[str]:
+        options = ["--help"]
+        for param in command.params:
+            options.extend(getattr(param, "opts", []))
+            options.extend(getattr(param, "secondary_opts", []))
+        return sorted(set(options))
+
+    def values(self, commandName : Optional[str], option : str) -> List[str]:
+        """
+        Values completing an option of a command
+        """
+        kind = optionKind(commandName, option)
+        return self._values(kind) if kind is not None else []
+
+    def candidates(self, line : str, text : str) -> List[str]:
+        """
+        Completions of text, the word being typed at the end of line
+        """
+        try:
+            words = shlex.split(line[:len(line) - len(text)])
+        except ValueError:
+            return []
+        subcommand = self._subcommand(words)
+        if subcommand is None and not text.startswith("-") and not any(w in self._command.commands for w in words):
+            names = [name for name, command in self._command.commands.items()
+                     if not getattr(command, "hidden", False) and name not in EXCLUDED_COMMANDS]
+            return sorted(name for name in list(names) + list(BUILTINS) if name.startswith(text))
+        if words and words[-1].startswith("-"):
+            values = self.values(subcommand.name if subcommand is not None else None, words[-1])
+            if values:
+                return [value for value in values if value.startswith(text)]
+        if text.startswith("-"):
+            return [option for option in self._options(subcommand or self._command) if option.startswith(text)]
+        return []
+
+    def complete(self, text : str, state : int) -> Optional[str]:
+        """
+        readline completer
+        """
+        if state == 0:
+            import readline
+
+            try:
+                self._matches = self.candidates(readline.get_line_buffer()[:readline.get_endidx()], text)
+            except Exception:
+                # An error would be swallowed by readline, and completion lost
+                self._matches = []
+        return self._matches[state] if state < len(self._matches) else None
+
+    # Loop
+
+    def _setupReadline(self) -> bool:
+        try:
+            import readline
+        except ImportError:
+            return False
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(" \t\n\"'=")
+        if "libedit" in (getattr(readline, "__doc__", "") or ""):
+            readline.parse_and_bind("bind ^I rl_complete")
+        else:
+            readline.parse_and_bind("tab: complete")
+        readline.set_history_length(HISTORY_LENGTH)
+        try:
+            readline.read_history_file(self._history)
+        except OSError:
+            pass
+        return True
+
+    def _saveHistory(self):
+        import readline
+
+        try:
+            self._history.parent.mkdir(parents=True, exist_ok=True)
+            readline.write_history_file(self._history)
+        except OSError:
+            pass
+
+    def runCommand(self, args : List[str]) -> int:
+        """
+        Runs a command line, returns its exit code
+        """
+        import traceback
+
+        try:
+            self._command.main(args=self._prefix + args, prog_name="jarvice-cli")
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                return e.code
+            if e.code is not None:
+                print(e.code, file=sys.stderr)
+                return 1
+        except KeyboardInterrupt:
+            print("Interrupted", file=sys.stderr)
+            return 130
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    def run(self) -> int:
+        """
+        Reads and runs commands until exit, quit or end of input
+
+        Returns:
+            exit code of the last command
+        """
+        readline = self._setupReadline()
+        interactive = sys.stdin.isatty()
+        code = 0
+        try:
+            while True:
+                try:
+                    line = input(PROMPT if interactive else "")
+                except EOFError:
+                    if interactive:
+                        print()
+                    break
+                except KeyboardInterrupt:
+                    print()
+                    continue
+                try:
+                    args = shlex.split(line, comments=True)
+                except ValueError as e:
+                    print(f"Error : {e}")
+                    code = 1
+                    continue
+                if not args:
+                    continue
+                if args[0] in ("exit", "quit"):
+                    break
+                if args[0] == "help":
+                    args = args[1:] + ["--help"]
+                if args[0] in EXCLUDED_COMMANDS:
+                    print(f"Error : {args[0]} can't be run in the shell")
+                    code = 1
+                    continue
+                code = self.runCommand(args)
+                sys.stdout.flush()
+        finally:
+            if readline:
+                self._saveHistory()
+        return code
+
+
+def shellPrefix(argv : List[str]) -> List[str]:
+    """
+    Global options given before `shell` on the command line
+    """
+    return argv[:argv.index("shell")] if "shell" in argv else []
+
@@ -0,0 +1,258 @@
+"""
+Timings of a command: imports, HTTP requests, deserialization and rendering
+
+While a Tracer is started, jarviceapi records a span for every API call,
+every HTTP request and every model deserialization. The spans can be
+summed up on stderr (--timings) or written in the Chrome trace format
+(--trace FILE), which trace viewers such as Perfetto or chrome://tracing load.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Tracer of the running command, None when not tracing
+_active : Optional["Tracer"] = None
+
+
+class Span:
+    __slots__ = ("name", "cat", "start", "end", "tid", "args")
+
+    def __init__(self, name : str, cat : str, start : float, end : float, tid : int, args : Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.end = end
+        self.tid = tid
+        self.args = args
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Tracer:
+    """
+    Spans recorded during a command, by any thread
+    """
+    _spans : List[Span]
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @property
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def add(self, name : str, cat : str, start : float, end : float, **args):
+        """
+        Records a span, start and end being time.perf_counter() values
+        """
+        span = Span(name, cat, start, end, threading.get_ident(), args)
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name : str, cat : str, **args) -> Iterator[Dict[str, Any]]:
+        """
+        Records the time spent in the block. The yielded dict is stored as
+        the arguments of the span and can be filled in by the block, or
+        after it (e.g. the size of a streamed body).
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            span = Span(name, cat, start, time.perf_counter(), threading.get_ident(), args)
+            with self._lock:
+                self._spans.append(span)
+
+    def writeChrome(self, path : Path):
+        """
+        Writes the spans in the Chrome trace format
+        """
+        spans = self.spans
+        origin = min((s.start for s in spans), default=0.0)
+        pid = os.getpid()
+        events = [{"name": s.name, "cat": s.cat, "ph": "X", "pid": pid, "tid": s.tid,
+                   "ts": round((s.start - origin) * 1e6, 1), "dur": round(s.duration * 1e6, 1),
+                   "args": s.args}
+                  for s in sorted(spans, key=lambda s: s.start)]
+        with open(path, "w") as trace_hd:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_hd)
+
+    def summary(self) -> List[Tuple[str, float]]:
+        """
+        Breakdown of the command, as (label, milliseconds) rows
+
+        Rendering is the time of the command outside of API calls, and client
+        overhead the time of API calls outside of requests and deserialization.
+        """
+        spans = self.spans
+        rows : List[Tuple[str, float]] = []
+        for cat in ("import", "setup"):
+            rows.extend((s.name, s.duration * 1000) for s in spans if s.cat == cat)
+        requests = [s for s in spans if s.cat == "http"]
+        # Identical requests (bulk commands, polls) are summed up on one row
+        groups : Dict[Tuple, List[Span]] = {}
+        for s in sorted(requests, key=lambda s: s.start):
+            groups.setdefault((s.args.get("method"), s.args.get("endpoint"), s.args.get("status", "error")), []).append(s)
+        for (method, endpoint, status), group in groups.items():
+            count = f" x{len(group)}" if len(group) > 1 else ""
+            size = sum(s.args.get("bytes", 0) for s in group)
+            rows.append((f"{method} {endpoint} {status}{count} {size} B", sum(s.duration for s in group) * 1000))
+        calls = [s for s in spans if s.cat == "api"]
+        http = _covered(requests)
+        deserialize = _covered([s for s in spans if s.cat == "deserialize"])
+        api = _covered(calls)
+        rows.append((f"http ({len(requests)} requests)", http * 1000))
+        rows.append(("deserialization", deserialize * 1000))
+        rows.append(("client overhead", max(0.0, api - http - deserialize) * 1000))
+        for s in spans:
+            if s.cat == "command":
+                rows.append(("rendering and other", max(0.0, s.duration - api) * 1000))
+                rows.append((s.name, s.duration * 1000))
+        return rows
+
+    def printSummary(self, out = None):
+        out = out if out is not None else sys.stderr
+        rows = self.summary()
+        width = max((len(label) for label,_ in rows), default=0)
+        out.write("Timings (ms)\n")
+        for label, ms in rows:
+            out.write(f"  {label:<{width}} {ms:>9.1f}\n")
+        out.flush()
+
+
+def _covered(spans : List[Span]) -> float:
+    """
+    Wall time covered by spans, overlapping spans (other threads, nested calls) counted once
+    """
+    total = 0.0
+    end = None
+    for s in sorted(spans, key=lambda s: s.start):
+        if end is None or s.start > end:
+            total += s.duration
+            end = s.end
+        elif s.end > end:
+            total += s.end - end
+            end = s.end
+    return total
+
+
+def start() -> Tracer:
+    """
+    Starts recording spans, for the whole process
+    """
+    global _active
+    _active = Tracer()
+    return _active
+
+
+def stop():
+    global _active
+    _active = None
+
+
+def active() -> Optional[Tracer]:
+    return _active
+
+
+@contextmanager
+def span(name : str, cat : str, **args) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Records the block in the active tracer, if any
+    """
+    tracer = _active
+    if tracer is None:
+        yield None
+        return
+    with tracer.span(name, cat, **args) as spanArgs:
+        yield spanArgs
+
+
+def wrap(pool_manager):
+    """
+    Wraps the urllib3 pool manager of the client, to time requests while tracing
+    """
+    return TracingPoolManager(pool_manager)
+
+
+def instrument(api_client):
+    """
+    Times the deserialization of the responses of a generated ApiClient while tracing
+    """
+    deserialize = getattr(api_client, "deserialize", None)
+    if deserialize is None:
+        return
+
+    def tracedDeserialize(*args, **kwargs):
+        tracer = _active
+        if tracer is None:
+            return deserialize(*args, **kwargs)
+        with tracer.span("deserialize", "deserialize"):
+            return deserialize(*args, **kwargs)
+    api_client.deserialize = tracedDeserialize
+
+
+class TracingPoolManager:
+    """
+    Pool manager recording a span per request while a tracer is active
+    """
+    def __init__(self, inner):
+        self._inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def request(self, method : str, url : str, **kwargs):
+        tracer = _active
+        if tracer is None:
+            return self._inner.request(method, url, **kwargs)
+        from jarvice_cli.transport import _response
+        from urllib.parse import urlsplit
+
+        preload_content = kwargs.pop("preload_content", True)
+        endpoint = urlsplit(url).path
+        with tracer.span(f"{method} {endpoint}", "http", method=method, endpoint=endpoint) as args:
+            response = self._inner.request(method, url, preload_content=preload_content, **kwargs)
+            args["status"] = response.status
+            if not preload_content:
+                # Streamed: the span ends with the headers (time to first
+                # byte), the bytes are counted as the caller reads them
+                args["bytes"] = 0
+                return _CountingResponse(response, args)
+            # The body is read here, so the span includes its transfer
+            data = response.data or b""
+            args["bytes"] = len(data)
+        # The body is handed over decoded
+        headers = {k: v for k,v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")}
+        return _response(response.status, response.reason, headers, data, preload_content)
+
+
+class _CountingResponse:
+    """
+    Streamed response adding the size of what is read to the args of its span
+    """
+    def __init__(self, inner, args : Dict[str, Any]):
+        self._inner = inner
+        self._args = args
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def read(self, *args, **kwargs) -> bytes:
+        data = self._inner.read(*args, **kwargs)
+        self._args["bytes"] += len(data)
+        return data
+
+    def stream(self, *args, **kwargs) -> Iterator[bytes]:
+        for data in self._inner.stream(*args, **kwargs):
+            self._args["bytes"] += len(data)
+            yield data
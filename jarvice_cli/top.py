@@ -0,0 +1,274 @@
+from __future__ import annotations
+from collections import Counter
+from contextlib import contextmanager
+import datetime
+import os
+import re
+import sys
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+import rich.console
+import rich.live
+import rich.table
+import rich.text
+
+from jarvice_cli.jobfilter import SORT_KEYS, STATUS_CODES, expandStatus, sortJobs
+from jarvice_cli.printer import RichPrinter
+
+if TYPE_CHECKING:
+    from jarvice_cli.jarviceapi import jarviceapi
+
+# Time between two polls of the job list, in seconds
+DEFAULT_TOP_INTERVAL = 2.0
+
+# Status filters cycled through with the f key
+_STATUS_FILTERS = (None,) + tuple(STATUS_CODES)
+
+# Lines used by the header and the footer around the job table
+_CHROME_LINES = 8
+
+HELP = "q quit  s sort  r reverse  f status  / name regex  c clear filters"
+
+
+@contextmanager
+def cbreak() -> Iterator[Optional[int]]:
+    """
+    Puts the terminal in cbreak mode, so keys are read as they are pressed
+
+    Yields the file descriptor of stdin, or None if keys can't be read
+    (stdin is not a terminal, or no termios).
+    """
+    if not sys.stdin.isatty():
+        yield None
+        return
+    try:
+        import termios
+        import tty
+    except ImportError:
+        yield None
+        return
+    fd = sys.stdin.fileno()
+    attributes = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        yield fd
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+
+
+def readKey(fd : Optional[int], timeout : float) -> Optional[str]:
+    """
+    Waits at most timeout seconds for a key, None if none was pressed
+    """
+    if fd is None:
+        time.sleep(timeout)
+        return None
+    import select
+
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return None
+    return os.read(fd, 32).decode(errors="ignore")
+
+
+class JobsTop:
+    """
+    Live view of the job list
+
+    The job list is polled once per interval and compared with the previous
+    one: only the rows of new or changed jobs are formatted again, and the
+    screen is only redrawn when a job changed or a key was pressed.
+    """
+    _rows : Dict[str, Tuple[Tuple, Tuple[str, ...], rich.style.Style]]
+    _jobs : Dict[str, object]
+
+    def __init__(self, api : jarviceapi, interval : float = DEFAULT_TOP_INTERVAL, sort : str = "number",
+                 reverse : bool = False, status : Optional[str] = None):
+        """
+        Args:
+            api (jarviceapi) : client the job list is polled with
+            interval (float) : time between two polls, in seconds
+            sort (str) : one of SORT_KEYS
+            reverse (bool) : sort in descending order
+            status (str) : only show jobs with this short status (R, PD...)
+        """
+        self._api = api
+        self._interval = interval
+        self._sort = sort
+        self._reverse = reverse
+        self._status = status
+        self._name : Optional[re.Pattern] = None
+        self._typing : Optional[str] = None
+        self._printer = RichPrinter()
+        self._console = rich.console.Console()
+        self._rows = {}
+        self._jobs = {}
+        self._changes = (0, 0, 0)
+        self._error : Optional[str] = None
+        self._polled : Optional[float] = None
+        self._updated : Optional[float] = None
+
+    @staticmethod
+    def _signature(jobEntry) -> Tuple:
+        stats = jobEntry.job_stats
+        submission = jobEntry.job_api_submission
+        return (jobEntry.job_name, jobEntry.job_status, jobEntry.job_application, jobEntry.job_command,
+                jobEntry.job_owner_username,
+                stats.queue_time if stats is not None else None,
+                stats.compute_time if stats is not None else None,
+                submission.machine if submission is not None else None)
+
+    def poll(self) -> bool:
+        """
+        Polls the job list and updates the rows of the jobs that changed
+
+        Returns:
+            changed (bool) : whether the screen must be redrawn
+        """
+        try:
+            jobs = self._api.jobs()
+        except Exception as e:
+            error = self._printer.errorSummary(e)
+            changed = error != self._error
+            self._error = error
+            return changed
+        first = self._polled is None
+        self._error = None
+        self._polled = time.time()
+        added = changed = 0
+        rows = {}
+        for number,jobEntry in jobs.items():
+            signature = self._signature(jobEntry)
+            previous = self._rows.get(number)
+            if previous is not None and previous[0] == signature:
+                rows[number] = previous
+                continue
+            if previous is None:
+                added += 1
+            else:
+                changed += 1
+            rows[number] = (signature, self._printer.jobRow(number, jobEntry),
+                            self._printer.statusStyle(jobEntry.job_status))
+        removed = len(self._rows.keys() - rows.keys())
+        self._rows = rows
+        self._jobs = jobs
+        if first or added or changed or removed:
+            self._changes = (added, changed, removed)
+            self._updated = self._polled
+            return True
+        return False
+
+    def handleKey(self, key : str) -> bool:
+        """
+        Applies a key press
+
+        Returns:
+            running (bool) : False to quit
+        """
+        if self._typing is not None:
+            # Typing a name regex, applied on Enter, Escape cancels
+            for char in key:
+                if char in ("\n", "\r"):
+                    try:
+                        self._name = re.compile(self._typing) if self._typing else None
+                        self._error = None
+                    except re.error as e:
+                        self._error = f"Invalid regex: {e}"
+                    self._typing = None
+                    return True
+                if char == "\x1b":
+                    self._typing = None
+                    return True
+                if char in ("\x7f", "\b"):
+                    self._typing = self._typing[:-1]
+                elif char.isprintable():
+                    self._typing += char
+            return True
+        if key in ("q", "Q", "\x03"):
+            return False
+        if key == "s":
+            keys = list(SORT_KEYS)
+            self._sort = keys[(keys.index(self._sort) + 1) % len(keys)]
+        elif key == "r":
+            self._reverse = not self._reverse
+        elif key == "f":
+            self._status = _STATUS_FILTERS[(_STATUS_FILTERS.index(self._status) + 1) % len(_STATUS_FILTERS)]
+        elif key == "/":
+            self._typing = ""
+        elif key == "c":
+            self._status = None
+            self._name = None
+        return True
+
+    def _visible(self) -> Dict[str, object]:
+        jobs = self._jobs
+        if self._status is not None:
+            statuses = expandStatus([self._status])
+            jobs = {k: v for k,v in jobs.items() if v.job_status in statuses}
+        if self._name is not None:
+            jobs = {k: v for k,v in jobs.items() if v.job_name and self._name.search(v.job_name)}
+        limit = max(1, self._console.size.height - _CHROME_LINES)
+        return sortJobs(jobs, self._sort, self._reverse, limit)
+
+    def render(self) -> rich.console.Group:
+        counts = Counter(self._printer.shortStatus(v.job_status).strip() for v in self._jobs.values())
+        queue = compute = 0
+        for jobEntry in self._jobs.values():
+            if jobEntry.job_stats is not None:
+                queue += jobEntry.job_stats.queue_time or 0
+                compute += jobEntry.job_stats.compute_time or 0
+        header = rich.text.Text()
+        header.append(f"{len(self._jobs)} jobs  ", style="bold")
+        header.append("  ".join(f"{code} {counts[code]}" for code in STATUS_CODES if counts[code]))
+        header.append(f"\nQueue time {datetime.timedelta(seconds=queue)}  Compute time {datetime.timedelta(seconds=compute)}")
+
+        table = rich.table.Table(style="on black", expand=True)
+        for title, _ in self._printer.JOB_COLUMNS:
+            table.add_column(title, no_wrap=True)
+        visible = self._visible()
+        for number in visible:
+            _, cells, style = self._rows[number]
+            table.add_row(*cells, style=style)
+
+        filters = []
+        if self._status is not None:
+            filters.append(f"status {self._status}")
+        if self._name is not None:
+            filters.append(f"name /{self._name.pattern}/")
+        added, changed, removed = self._changes
+        footer = rich.text.Text()
+        updated = datetime.datetime.fromtimestamp(self._updated).strftime("%H:%M:%S") if self._updated else "-"
+        footer.append(f"changed {updated}  +{added} ~{changed} -{removed}  sort {self._sort}{' desc' if self._reverse else ''}"
+                      f"  {', '.join(filters) or 'no filter'}  {len(visible)} shown\n")
+        if self._typing is not None:
+            footer.append(f"/{self._typing}", style="bold")
+        elif self._error is not None:
+            footer.append(self._error, style="red")
+        else:
+            footer.append(HELP, style="gray50")
+        return rich.console.Group(header, table, footer)
+
+    def run(self):
+        """
+        Runs until q or Ctrl-C is pressed
+        """
+        with cbreak() as fd, rich.live.Live(console=self._console, auto_refresh=False, screen=True) as live:
+            nextPoll = time.monotonic()
+            try:
+                while True:
+                    redraw = False
+                    if time.monotonic() >= nextPoll:
+                        redraw = self.poll()
+                        nextPoll = time.monotonic() + self._interval
+                    key = None
+                    if not redraw:
+                        key = readKey(fd, max(0.0, nextPoll - time.monotonic()))
+                        if key:
+                            if not self.handleKey(key):
+                                return
+                            redraw = True
+                    if redraw:
+                        live.update(self.render(), refresh=True)
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,467 @@
+"""
+Parallel, chunked and resumable transfers between local files and a vault
+
+Files are split in chunks of chunk_size bytes and the chunks of every
+file are transferred by a pool of max_parallel workers, so that many small
+files and a few large ones both keep the connections busy. Files already
+in sync (same size and a destination not older than the source, or the
+same SHA256 with checksum) are skipped.
+
+Files are written under a temporary name and renamed once complete. The
+chunks done so far are recorded, so an interrupted transfer run again
+only sends the missing chunks:
+- downloads write <file>.jarvice-part next to the destination, and the
+  chunks done in <file>.jarvice-part.json,
+- uploads write <file>.jarvice-part in the vault, and the chunks done in
+  the transfers directory of the cache.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from jarvice_cli.bulk import DEFAULT_MAX_PARALLEL, run_bounded
+from jarvice_cli.cache import atomicWrite, cacheDir
+from jarvice_cli.vault import RemoteEntry, VaultError, VaultStorage, joinPath
+
+# Size of the chunks files are split in
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Suffix of files being transferred
+PART_SUFFIX = ".jarvice-part"
+# Status of servers refusing ranged PUT, which get whole files instead
+_NO_RANGED_PUT = (400, 405, 416, 501)
+
+
+class TransferStats:
+    """
+    Progress of a transfer, updated as chunks complete
+    """
+    def __init__(self):
+        self.files = 0
+        self.transferred = 0
+        self.skipped = 0
+        self.failed = 0
+        self.total_bytes = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.errors : List[Tuple[str, BaseException]] = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    @property
+    def throughput(self) -> float:
+        """
+        Bytes transferred per second
+        """
+        return self.bytes / max(self.elapsed, 1e-6)
+
+
+class _File:
+    """
+    File being transferred, with the chunks left
+    """
+    def __init__(self, local : Path, remote : str, size : int, mtime : float, etag : Optional[str] = None):
+        self.local = local
+        self.remote = remote
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.chunks = 0
+        self.done : Set[int] = set()
+        self.pending = 0
+        self.fd : Optional[int] = None
+        self.state : Optional[Path] = None
+        self.whole = False
+        self.error : Optional[BaseException] = None
+
+
+class _Chunk(NamedTuple):
+    file : _File
+    index : int
+
+
+class _Requeue:
+    """
+    Iterator over chunks, serving chunks put back with push() first
+    """
+    def __init__(self, chunks : Iterator[_Chunk]):
+        self._chunks = chunks
+        self._pushed : Deque[_Chunk] = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> _Chunk:
+        if self._pushed:
+            return self._pushed.popleft()
+        return next(self._chunks)
+
+    def push(self, chunk : _Chunk):
+        self._pushed.append(chunk)
+
+
+def sha256File(path : Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_hd:
+        for block in iter(lambda: file_hd.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Transfer:
+    """
+    Downloads and uploads between local files and a vault
+    """
+    def __init__(self, storage : VaultStorage, max_parallel : int = DEFAULT_MAX_PARALLEL,
+                 chunk_size : int = DEFAULT_CHUNK_SIZE, checksum : bool = False,
+                 progress : Optional[Callable[[TransferStats], None]] = None):
+        """
+        Args:
+            storage (VaultStorage) : storage of the vault
+            max_parallel (int) : chunks transferred at once
+            chunk_size (int) : size of the chunks, in bytes
+            checksum (bool) : compare files by SHA256 instead of size and
+                modification time, and verify transferred files
+            progress : called with the stats as chunks complete
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self._storage = storage
+        self._max_parallel = max(1, max_parallel)
+        self._chunk_size = chunk_size
+        self._checksum = checksum
+        self._progress = progress
+        self._ranged_put = True
+        self._lock = threading.Lock()
+
+    def _chunkCount(self, size : int) -> int:
+        return max(1, -(-size // self._chunk_size))
+
+    def _bounds(self, file : _File, index : int) -> Tuple[int, int]:
+        start = index * self._chunk_size
+        return start, min(file.size, start + self._chunk_size)
+
+    def _run(self, files : List[_File], stats : TransferStats, prepare : Callable[[_File], None],
+             transfer : Callable[[_Chunk], int], finish : Callable[[_File], None],
+             cleanup : Callable[[_File], None]):
+        """
+        Transfers the chunks of files, prepare being called before the first
+        chunk of a file and finish after its last one, from this thread
+        """
+        def chunks() -> Iterator[_Chunk]:
+            for file in files:
+                try:
+                    prepare(file)
+                except Exception as error:
+                    self._fail(file, error, stats, cleanup)
+                    continue
+                if file.whole:
+                    file.pending = 1
+                    yield _Chunk(file, -1)
+                    continue
+                todo = [index for index in range(file.chunks) if index not in file.done]
+                if not todo:
+                    # Every chunk was sent before the interruption
+                    self._complete(file, stats, finish, cleanup)
+                    continue
+                file.pending = len(todo)
+                for index in todo:
+                    if file.error is not None or file.whole:
+                        break
+                    yield _Chunk(file, index)
+
+        requeue = _Requeue(chunks())
+        for chunk, size, error in run_bounded(transfer, requeue, self._max_parallel):
+            file = chunk.file
+            if file.error is not None or (file.whole and chunk.index >= 0):
+                # Failed file, or ranged chunk of a file now sent whole
+                continue
+            if error is not None:
+                if isinstance(error, VaultError) and error.status in _NO_RANGED_PUT and not file.whole \
+                        and file.chunks > 1 and not self._ranged_put:
+                    # The server refused ranged PUT: send the file in one request
+                    file.whole = True
+                    file.done.clear()
+                    file.pending = 1
+                    requeue.push(_Chunk(file, -1))
+                    continue
+                self._fail(file, error, stats, cleanup)
+                continue
+            stats.bytes += size
+            if chunk.index >= 0:
+                file.done.add(chunk.index)
+                self._saveState(file)
+            file.pending -= 1
+            if file.pending == 0 or chunk.index < 0:
+                self._complete(file, stats, finish, cleanup)
+            if self._progress is not None:
+                self._progress(stats)
+
+    def _complete(self, file : _File, stats : TransferStats, finish : Callable[[_File], None],
+                  cleanup : Callable[[_File], None]):
+        try:
+            finish(file)
+        except Exception as error:
+            self._fail(file, error, stats, cleanup)
+            return
+        stats.transferred += 1
+        if file.state is not None:
+            try:
+                os.unlink(file.state)
+            except FileNotFoundError:
+                pass
+
+    def _fail(self, file : _File, error : BaseException, stats : TransferStats, cleanup : Callable[[_File], None]):
+        file.error = error
+        stats.failed += 1
+        stats.errors.append((file.remote, error))
+        cleanup(file)
+
+    def _saveState(self, file : _File):
+        if file.state is None or file.whole:
+            return
+        atomicWrite(file.state, json.dumps({"size": file.size, "mtime": file.mtime, "etag": file.etag,
+                                            "chunk_size": self._chunk_size, "done": sorted(file.done)}))
+
+    def _loadState(self, file : _File, state : Path) -> Set[int]:
+        """
+        Chunks done by an interrupted transfer of the same version of file
+        """
+        try:
+            saved = json.loads(state.read_text())
+        except (OSError, ValueError):
+            return set()
+        if (saved.get("size"), saved.get("mtime"), saved.get("etag"), saved.get("chunk_size")) != \
+                (file.size, file.mtime, file.etag, self._chunk_size):
+            return set()
+        return {index for index in saved.get("done", []) if 0 <= index < file.chunks}
+
+    # Downloads
+
+    def download(self, source : str, destination : Path) -> TransferStats:
+        """
+        Downloads a file or a directory of the vault. The files of a
+        directory are written in destination, a file is written to
+        destination, or in it if it is a directory.
+
+        Raises:
+            VaultError: source can't be listed
+            FileNotFoundError: source doesn't exist
+        """
+        stats = TransferStats()
+        entry = self._storage.stat(source)
+        if entry is None:
+            raise FileNotFoundError(f"No such file or directory in the vault: {source}")
+        if entry.is_dir:
+            pairs = [(e, destination / posixpath.relpath(e.path, entry.path))
+                     for e in self._storage.walk(entry.path, self._max_parallel)]
+        elif destination.is_dir() or str(destination).endswith(os.sep):
+            pairs = [(entry, destination / entry.path.rsplit("/", 1)[-1])]
+        else:
+            pairs = [(entry, destination)]
+        files = []
+        for remote, local in pairs:
+            stats.files += 1
+            file = _File(local, remote.path, remote.size, remote.mtime, remote.etag)
+            file.chunks = self._chunkCount(file.size)
+            try:
+                if self._downloadInSync(file):
+                    stats.skipped += 1
+                    continue
+            except (OSError, VaultError) as error:
+                self._fail(file, error, stats, self._downloadCleanup)
+                continue
+            stats.total_bytes += file.size
+            files.append(file)
+        self._run(files, stats, self._downloadPrepare, self._downloadChunk, self._downloadFinish,
+                  self._downloadCleanup)
+        return stats
+
+    def _downloadInSync(self, file : _File) -> bool:
+        try:
+            local = file.local.stat()
+        except FileNotFoundError:
+            return False
+        if local.st_size != file.size:
+            return False
+        if self._checksum:
+            remote = self._storage.checksum(file.remote)
+            if remote is not None:
+                return remote == sha256File(file.local)
+        return local.st_mtime >= int(file.mtime)
+
+    def _partPath(self, file : _File) -> Path:
+        return file.local.with_name(file.local.name + PART_SUFFIX)
+
+    def _downloadPrepare(self, file : _File):
+        part = self._partPath(file)
+        part.parent.mkdir(parents=True, exist_ok=True)
+        if file.chunks > 1:
+            file.state = part.with_name(part.name + ".json")
+            if part.exists():
+                file.done = self._loadState(file, file.state)
+        file.fd = os.open(part, os.O_WRONLY | os.O_CREAT | (0 if file.done else os.O_TRUNC), 0o644)
+
+    def _downloadChunk(self, chunk : _Chunk) -> int:
+        file = chunk.file
+        if file.chunks == 1:
+            data = self._storage.read(file.remote)
+        else:
+            start, end = self._bounds(file, chunk.index)
+            data = self._storage.read(file.remote, start, end)
+            if len(data) != end - start:
+                raise VaultError(0, f"{file.remote} changed during the transfer")
+        os.pwrite(file.fd, data, self._bounds(file, chunk.index)[0])
+        return len(data)
+
+    def _downloadFinish(self, file : _File):
+        os.ftruncate(file.fd, file.size)
+        os.close(file.fd)
+        file.fd = None
+        part = self._partPath(file)
+        if self._checksum:
+            remote = self._storage.checksum(file.remote)
+            if remote is not None and remote != sha256File(part):
+                part.unlink()
+                raise VaultError(0, f"{file.remote}: checksum mismatch")
+        os.replace(part, file.local)
+        if file.mtime:
+            os.utime(file.local, (file.mtime, file.mtime))
+
+    def _downloadCleanup(self, file : _File):
+        # The part file and its state are kept, to resume later
+        if file.fd is not None:
+            os.close(file.fd)
+            file.fd = None
+
+    # Uploads
+
+    def upload(self, source : Path, destination : str) -> TransferStats:
+        """
+        Uploads a file or a directory to the vault. The files of a
+        directory are written in destination, a file is written to
+        destination, or in it if it is a directory or ends with /.
+
+        Raises:
+            VaultError: destination can't be listed
+            FileNotFoundError: source doesn't exist
+        """
+        stats = TransferStats()
+        if source.is_dir():
+            root = joinPath(destination)
+            remote = {e.path: e for e in self._walkIfExists(root)}
+            pairs = []
+            for directory, _, names in os.walk(source):
+                for name in sorted(names):
+                    local = Path(directory) / name
+                    pairs.append((local, joinPath(root, local.relative_to(source).as_posix())))
+        elif source.exists():
+            entry = self._storage.stat(destination)
+            if destination.endswith("/") or (entry is not None and entry.is_dir):
+                path = joinPath(destination, source.name)
+                entry = self._storage.stat(path)
+            else:
+                path = joinPath(destination)
+            remote = {path: entry} if entry is not None else {}
+            pairs = [(source, path)]
+        else:
+            raise FileNotFoundError(f"No such file or directory: {source}")
+        files = []
+        directories : Set[str] = set()
+        for local, path in pairs:
+            stats.files += 1
+            try:
+                info = local.stat()
+                file = _File(local, path, info.st_size, info.st_mtime)
+                file.chunks = self._chunkCount(file.size)
+                if self._uploadInSync(file, remote.get(path)):
+                    stats.skipped += 1
+                    continue
+                parent = path.rsplit("/", 1)[0]
+                if parent and parent not in directories:
+                    self._storage.mkdir(parent)
+                    directories.add(parent)
+            except (OSError, VaultError) as error:
+                self._fail(_File(local, path, 0, 0), error, stats, self._uploadCleanup)
+                continue
+            stats.total_bytes += file.size
+            files.append(file)
+        self._run(files, stats, self._uploadPrepare, self._uploadChunk, self._uploadFinish, self._uploadCleanup)
+        return stats
+
+    def _walkIfExists(self, path : str) -> Iterator[RemoteEntry]:
+        try:
+            yield from self._storage.walk(path, self._max_parallel)
+        except VaultError as error:
+            if error.status != 404:
+                raise
+
+    def _uploadInSync(self, file : _File, remote : Optional[RemoteEntry]) -> bool:
+        if remote is None or remote.is_dir or remote.size != file.size:
+            return False
+        if self._checksum:
+            checksum = self._storage.checksum(file.remote)
+            if checksum is not None:
+                return checksum == sha256File(file.local)
+        return remote.mtime >= int(file.mtime)
+
+    def _uploadPrepare(self, file : _File):
+        file.fd = os.open(file.local, os.O_RDONLY)
+        if file.chunks == 1 or not self._ranged_put:
+            file.whole = not self._ranged_put and file.chunks > 1
+            return
+        key = hashlib.sha256(f"{self._storage.url(file.remote)}\0{file.local.resolve()}".encode()).hexdigest()[:32]
+        file.state = cacheDir() / "transfers" / f"{key}.json"
+        done = self._loadState(file, file.state)
+        if done:
+            part = self._storage.stat(file.remote + PART_SUFFIX)
+            if part is not None and part.size == file.size:
+                file.done = done
+
+    def _uploadChunk(self, chunk : _Chunk) -> int:
+        file = chunk.file
+        if file.whole and chunk.index >= 0:
+            # Queued before the server refused ranged PUT, the file is sent whole instead
+            return 0
+        if chunk.index < 0:
+            # Without ranged PUT a large file is streamed, not read in memory
+            with open(file.local, "rb") as file_hd:
+                self._storage.writeFile(file.remote, file_hd, mtime=file.mtime)
+            return file.size
+        if file.chunks == 1:
+            data = os.pread(file.fd, file.size, 0)
+            self._storage.write(file.remote, data, mtime=file.mtime)
+            return len(data)
+        start, end = self._bounds(file, chunk.index)
+        data = os.pread(file.fd, end - start, start)
+        try:
+            self._storage.write(file.remote + PART_SUFFIX, data, start, file.size, mtime=file.mtime)
+        except VaultError as error:
+            if error.status in _NO_RANGED_PUT:
+                with self._lock:
+                    self._ranged_put = False
+            raise
+        return len(data)
+
+    def _uploadFinish(self, file : _File):
+        os.close(file.fd)
+        file.fd = None
+        if file.chunks > 1 and not file.whole:
+            self._storage.move(file.remote + PART_SUFFIX, file.remote)
+        if self._checksum:
+            remote = self._storage.checksum(file.remote)
+            if remote is not None and remote != sha256File(file.local):
+                raise VaultError(0, f"{file.remote}: checksum mismatch")
+
+    def _uploadCleanup(self, file : _File):
+        if file.fd is not None:
+            os.close(file.fd)
+            file.fd = None
@@ -0,0 +1,212 @@
+"""
+Record and replay of the HTTP exchanges made by jarviceapi
+
+Both wrap the urllib3 pool manager of the generated client, so every
+request made through jarviceapi goes through them. A cassette is a JSONL
+file (gzip compressed if its name ends with .gz) with one exchange per
+line. Credentials are redacted before being written, in requests and in
+responses (e.g. the password of connect).
+"""
+import base64
+import gzip
+import io
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+REDACTED = "REDACTED"
+# Query parameters and JSON fields removed from cassettes
+SECRET_FIELDS = ("apikey", "username", "password")
+
+
+def _open(path : Path, mode : str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def redactUrl(url : str) -> str:
+    """
+    Path and sorted query of an url, without host and credentials
+    """
+    parts = urlsplit(url)
+    path = re.sub(r"/{2,}", "/", parts.path)
+    query = sorted((k, REDACTED if k in SECRET_FIELDS else v) for k,v in parse_qsl(parts.query, keep_blank_values=True))
+    return path + ("?" + urlencode(query) if query else "")
+
+
+def redact(value : Any) -> Any:
+    """
+    JSON document with the values of the secret fields replaced, at any depth
+    """
+    if isinstance(value, dict):
+        return {k: REDACTED if k in SECRET_FIELDS else redact(v) for k,v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def redactBody(body : Any) -> Optional[str]:
+    if body is None or not isinstance(body, (bytes, str)):
+        # Streamed bodies (files) are not recorded
+        return None
+    if isinstance(body, bytes):
+        body = body.decode(errors="replace")
+    try:
+        document = json.loads(body)
+    except ValueError:
+        return body
+    return json.dumps(redact(document), separators=(",", ":"))
+
+
+def redactResponse(data : bytes) -> bytes:
+    """
+    Response body with the secret fields of a JSON document redacted, other
+    bodies unchanged
+    """
+    try:
+        document = json.loads(data)
+    except ValueError:
+        return data
+    return json.dumps(redact(document), separators=(",", ":")).encode()
+
+
+def _encode(data : bytes) -> Dict[str, str]:
+    try:
+        return {"text": data.decode()}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(data).decode()}
+
+
+def _decode(exchange : Dict) -> bytes:
+    if "base64" in exchange:
+        return base64.b64decode(exchange["base64"])
+    return exchange.get("text", "").encode()
+
+
+def _response(status : int, reason : str, headers : Dict[str, str], data : bytes, preload_content : bool = True):
+    import urllib3
+
+    return urllib3.HTTPResponse(body=io.BytesIO(data), headers=headers, status=status, reason=reason,
+                                preload_content=preload_content, decode_content=False)
+
+
+class Recorder:
+    """
+    Writes the exchanges made through the pool managers it wraps to a cassette
+    """
+    def __init__(self, path : Path):
+        self._cassette = _open(path, "w")
+        self._lock = threading.Lock()
+
+    def wrap(self, inner):
+        return RecordingPoolManager(inner, self)
+
+    def record(self, exchange : Dict):
+        with self._lock:
+            self._cassette.write(json.dumps(exchange, separators=(",", ":")) + "\n")
+            self._cassette.flush()
+
+    def close(self):
+        with self._lock:
+            self._cassette.close()
+
+
+class RecordingPoolManager:
+    """
+    Pool manager recording every exchange made through the wrapped one
+    """
+    def __init__(self, inner, recorder : Recorder):
+        self._inner = inner
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def request(self, method : str, url : str, body = None, fields = None, headers = None, **kwargs):
+        preload_content = kwargs.pop("preload_content", True)
+        start = time.perf_counter()
+        response = self._inner.request(method, url, body=body, fields=fields, headers=headers,
+                                       preload_content=True, **kwargs)
+        elapsed = time.perf_counter() - start
+        data = response.data or b""
+        responseHeaders = {k: v for k,v in response.headers.items() if k.lower() == "content-type"}
+        self._recorder.record({
+            "method": method,
+            "url": redactUrl(url),
+            "body": redactBody(body),
+            "status": response.status,
+            "reason": response.reason,
+            "headers": responseHeaders,
+            "elapsed": round(elapsed, 6),
+            **_encode(redactResponse(data)),
+        })
+        return _response(response.status, response.reason, responseHeaders, data, preload_content)
+
+
+class Player:
+    """
+    Serves the exchanges of a cassette instead of the network
+
+    Requests are matched on method, path and query (credentials excluded).
+    Identical requests get the recorded responses in order, the last one
+    being repeated once they are used up (e.g. for polls). The recorded
+    latency is reproduced, multiplied by `scale`.
+    """
+    def __init__(self, path : Path, scale : float = 1.0):
+        self._scale = scale
+        self._exchanges : Dict[Tuple[str, str], Deque[Dict]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        with _open(path, "r") as cassette:
+            for line in cassette:
+                if line.strip():
+                    exchange = json.loads(line)
+                    self._exchanges[(exchange["method"], exchange["url"])].append(exchange)
+
+    def wrap(self, inner):
+        return ReplayPoolManager(inner, self)
+
+    def next(self, method : str, url : str) -> Optional[Dict]:
+        with self._lock:
+            exchanges = self._exchanges.get((method, url))
+            if not exchanges:
+                return None
+            return exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+    def wait(self, exchange : Dict):
+        """
+        Waits for the recorded latency of an exchange, scaled
+        """
+        if self._scale > 0:
+            time.sleep(exchange["elapsed"] * self._scale)
+
+    def close(self):
+        pass
+
+
+class ReplayPoolManager:
+    """
+    Pool manager answering from a Player, the wrapped one is never used
+    """
+    def __init__(self, inner, player : Player):
+        self._inner = inner
+        self._player = player
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def request(self, method : str, url : str, body = None, fields = None, headers = None, **kwargs):
+        preload_content = kwargs.get("preload_content", True)
+        path = redactUrl(url)
+        exchange = self._player.next(method, path)
+        if exchange is None:
+            return _response(404, "Not in cassette", {"Content-Type": "text/plain"},
+                             f"No recorded response for {method} {path}".encode(), preload_content)
+        self._player.wait(exchange)
+        return _response(exchange["status"], exchange.get("reason", ""), exchange.get("headers", {}),
+                         _decode(exchange), preload_content)
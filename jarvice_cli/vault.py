@@ -0,0 +1,418 @@
+"""
+Client of the storage holding Jarvice XE vaults
+
+The generated API only lists vaults, files are read and written through
+the storage endpoint of the cluster, which speaks WebDAV (like the Jarvice
+data drop). Its url is set with --storage-url, JARVICE_STORAGE_URL or
+storage_url in ~/.jarvice.cfg, and a vault is the top directory of the
+same name. Requests use HTTP basic auth with the Jarvice username and API
+key, and go through the CallPolicy of the session.
+
+Besides plain WebDAV (PROPFIND, GET, PUT, MKCOL, MOVE), two widely used
+extensions are relied on when the server supports them:
+- ranged PUT (Content-Range), to upload large files in parallel chunks,
+- the OC-Checksum and X-OC-Mtime headers, for checksums and modification times.
+"""
+from __future__ import annotations
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+from jarvice_cli.lazy import lazy_import
+from jarvice_cli import timings
+
+if TYPE_CHECKING:
+    from jarvice_cli.policy import CallPolicy
+
+urllib3 = lazy_import("urllib3")
+
+# Entries of a directory handed over at once by VaultStorage.tree()
+LIST_BATCH = 500
+
+_PROPFIND = (b'<?xml version="1.0" encoding="utf-8"?>'
+             b'<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/><d:getcontentlength/>'
+             b'<d:getlastmodified/><d:getetag/></d:prop></d:propfind>')
+
+
+class VaultError(Exception):
+    """
+    Storage request that failed, with its HTTP status (0 if no answer)
+    """
+    def __init__(self, status : int, reason : str):
+        super().__init__(f"({status}) {reason}" if status else reason)
+        self.status = status
+        self.reason = reason
+
+
+class RemoteEntry(NamedTuple):
+    path : str
+    is_dir : bool
+    size : int
+    mtime : float
+    etag : Optional[str]
+
+
+def joinPath(*parts : str) -> str:
+    """
+    Remote path made of parts, with a leading / and no trailing /
+    """
+    segments = [s for part in parts for s in part.split("/") if s and s != "."]
+    if ".." in segments:
+        raise ValueError("Remote paths can't contain '..'")
+    return "/" + "/".join(segments)
+
+
+class VaultStorage:
+    """
+    WebDAV client of the storage of a vault
+
+    A single urllib3 pool is shared by every request, so connections are
+    kept alive. An instance is thread-safe.
+    """
+    def __init__(self, url : str, vault : str, username : str, apikey : str,
+                 pool_size : int = 10, policy : Optional[CallPolicy] = None):
+        """
+        Args:
+            url (str) : url of the storage endpoint
+            vault (str) : name of the vault, its top directory
+            username (str) : Jarvice user
+            apikey (str) : API key of the user
+            pool_size (int) : maximum number of keep-alive connections
+            policy (CallPolicy) : retries and timeouts of requests, none if None
+        """
+        self._base = url.rstrip("/")
+        self._root = joinPath(vault)
+        self._headers = urllib3.util.make_headers(basic_auth=f"{username}:{apikey}")
+        self._policy = policy
+        self._pool_size = pool_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self._prefix = urlsplit(self._base).path.rstrip("/") + self._root
+        self._mtimes : Dict[str, float] = {}
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.clear()
+            self._pool = None
+
+    def _manager(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    pool = urllib3.PoolManager(maxsize=self._pool_size)
+                    if self._policy is not None:
+                        pool = self._policy.wrap(pool)
+                    self._pool = timings.wrap(pool)
+        return self._pool
+
+    def url(self, path : str) -> str:
+        return self._base + quote(joinPath(self._root, path))
+
+    def _request(self, method : str, path : str, body = None, headers : Optional[Dict[str, str]] = None,
+                 expect : tuple = (200, 201, 204, 206, 207), idempotent : bool = True,
+                 preload_content : bool = True):
+        allHeaders = dict(self._headers)
+        allHeaders.update(headers or {})
+
+        def call():
+            if hasattr(body, "seek"):
+                # A file body is read by every attempt
+                body.seek(0)
+            response = self._manager().request(method, self.url(path), body=body, headers=allHeaders,
+                                               preload_content=preload_content)
+            if response.status not in expect:
+                response.drain_conn()
+                # Raised as an ApiException, so that the policy retries 5xx and 429
+                import jarviceapi_client
+
+                raise jarviceapi_client.ApiException(status=response.status, reason=f"{method} {path}: {response.reason}")
+            return response
+        try:
+            with timings.span(f"vault {method}", "api"):
+                return self._policy.call(call, idempotent) if self._policy is not None else call()
+        except Exception as e:
+            status = getattr(e, "status", None)
+            if status is None:
+                raise VaultError(0, f"{method} {path}: {e}") from e
+            raise VaultError(status, getattr(e, "reason", None) or str(e)) from e
+
+    def _relative(self, href : str) -> str:
+        # hrefs are usually absolute paths, only full urls need splitting
+        path = unquote(href if href.startswith("/") else urlsplit(href).path)
+        if path.startswith(self._prefix):
+            path = path[len(self._prefix):]
+        return joinPath(path)
+
+    def _mtime(self, value : Optional[str]) -> float:
+        """
+        Time of a getlastmodified, memoized: files of a directory often share it
+        """
+        if not value:
+            return 0.0
+        mtime = self._mtimes.get(value)
+        if mtime is None:
+            import email.utils
+
+            try:
+                mtime = email.utils.parsedate_to_datetime(value).timestamp()
+            except (TypeError, ValueError):
+                mtime = 0.0
+            if len(self._mtimes) > 4096:
+                self._mtimes.clear()
+            self._mtimes[value] = mtime
+        return mtime
+
+    def _entry(self, response) -> RemoteEntry:
+        """
+        Entry of a <response> element of a PROPFIND answer
+        """
+        href = response.findtext("{DAV:}href") or ""
+        is_dir, size, mtime, etag = False, None, None, None
+        for propstat in response.iterfind("{DAV:}propstat"):
+            if " 200 " not in (propstat.findtext("{DAV:}status") or ""):
+                continue
+            prop = propstat.find("{DAV:}prop")
+            if prop is None:
+                continue
+            is_dir = prop.find("{DAV:}resourcetype/{DAV:}collection") is not None
+            size = prop.findtext("{DAV:}getcontentlength")
+            mtime = prop.findtext("{DAV:}getlastmodified")
+            etag = prop.findtext("{DAV:}getetag")
+        return RemoteEntry(self._relative(href), is_dir, int(size or 0), self._mtime(mtime), etag)
+
+    def _propfind(self, path : str, depth : str) -> Iterator[RemoteEntry]:
+        """
+        Entries of a PROPFIND answer, parsed as it is received, so that
+        directories of any size are listed in constant memory
+        """
+        import xml.etree.ElementTree as ElementTree
+
+        response = self._request("PROPFIND", path, _PROPFIND, {"Depth": depth, "Content-Type": "application/xml"},
+                                 preload_content=False)
+        try:
+            for _, element in ElementTree.iterparse(response, events=("end",)):
+                if element.tag == "{DAV:}response":
+                    yield self._entry(element)
+                    element.clear()
+        except ElementTree.ParseError as e:
+            raise VaultError(0, f"PROPFIND {path}: invalid answer ({e})") from e
+        finally:
+            response.release_conn()
+
+    def stat(self, path : str) -> Optional[RemoteEntry]:
+        """
+        Entry of a file or directory, None if it doesn't exist
+
+        Raises:
+            VaultError
+        """
+        try:
+            return next(self._propfind(path, "0"), None)
+        except VaultError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def iterList(self, path : str) -> Iterator[RemoteEntry]:
+        """
+        Entries of a directory, without the directory itself, as they are
+        received. The entry of a file is the file itself.
+
+        Raises:
+            VaultError
+        """
+        directory = joinPath(path)
+        for entry in self._propfind(path, "1"):
+            if entry.path != directory or not entry.is_dir:
+                yield entry
+
+    def list(self, path : str) -> List[RemoteEntry]:
+        """
+        Entries of a directory, without the directory itself
+
+        Raises:
+            VaultError
+        """
+        return list(self.iterList(path))
+
+    def tree(self, path : str, max_parallel : int = 1,
+             errors : Optional[List[Tuple[str, BaseException]]] = None) -> Iterator[RemoteEntry]:
+        """
+        Entries under a directory, recursively, listing up to max_parallel
+        directories at once. Entries come in batches as directories are
+        received, not in a set order.
+
+        Args:
+            path (str) : directory
+            max_parallel (int) : directories listed at once
+            errors (list) : (directory, error) of the directories that can't
+                be listed are appended to it, and the others are still
+                listed. If None, the first error is raised.
+
+        Raises:
+            VaultError
+        """
+        # Not imported at module level, they are slow to import and only needed here
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Batches received and not yet yielded are bounded, so a slow reader
+        # holds back the traversal instead of filling memory
+        batches : queue.Queue = queue.Queue(maxsize=max(1, max_parallel) * 4)
+        stop = threading.Event()
+        lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=max(1, max_parallel))
+        submitted = 1
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def visit(directory : str):
+            nonlocal submitted
+            batch : List[RemoteEntry] = []
+            error = None
+            try:
+                for entry in self.iterList(directory):
+                    if entry.is_dir:
+                        with lock:
+                            submitted += 1
+                        executor.submit(visit, entry.path)
+                    batch.append(entry)
+                    if len(batch) >= LIST_BATCH:
+                        if not put((directory, batch, None, False)):
+                            return
+                        batch = []
+            except Exception as e:
+                error = e
+            put((directory, batch, error, True))
+
+        try:
+            executor.submit(visit, joinPath(path))
+            finished = 0
+            while True:
+                with lock:
+                    if finished == submitted:
+                        break
+                directory, batch, error, last = batches.get()
+                yield from batch
+                if error is not None:
+                    if errors is None:
+                        raise error
+                    errors.append((directory, error))
+                if last:
+                    finished += 1
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def walk(self, path : str, max_parallel : int = 1) -> Iterator[RemoteEntry]:
+        """
+        Files under a directory, recursively
+
+        Raises:
+            VaultError
+        """
+        return (entry for entry in self.tree(path, max_parallel) if not entry.is_dir)
+
+    def checksum(self, path : str) -> Optional[str]:
+        """
+        SHA256 of a file, as given by the server in OC-Checksum, None if it gives none
+
+        Raises:
+            VaultError
+        """
+        response = self._request("HEAD", path)
+        for checksum in (response.headers.get("OC-Checksum") or "").split():
+            kind, _, value = checksum.partition(":")
+            if kind.upper() == "SHA256":
+                return value.lower()
+        return None
+
+    def read(self, path : str, start : int = 0, end : Optional[int] = None) -> bytes:
+        """
+        Bytes start to end (excluded) of a file, to its end if end is None
+
+        Raises:
+            VaultError
+        """
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        response = self._request("GET", path, headers=headers)
+        data = response.data
+        if headers and response.status != 206:
+            # Range ignored by the server
+            data = data[start:end]
+        return data
+
+    def write(self, path : str, data : bytes, start : Optional[int] = None, total : Optional[int] = None,
+              mtime : Optional[float] = None):
+        """
+        Writes a whole file, or with start and total the bytes of a file
+        from start (ranged PUT)
+
+        Raises:
+            VaultError: the server refuses ranged PUT with status 400, 405, 416 or 501
+        """
+        headers = {"Content-Type": "application/octet-stream"}
+        if start is not None:
+            headers["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{total}"
+        if mtime is not None:
+            headers["X-OC-Mtime"] = str(int(mtime))
+        self._request("PUT", path, data, headers)
+
+    def writeFile(self, path : str, file : BinaryIO, mtime : Optional[float] = None):
+        """
+        Writes a whole file from an open binary file, streamed instead of read
+        in memory
+
+        Raises:
+            VaultError
+        """
+        import os
+
+        headers = {"Content-Type": "application/octet-stream",
+                   "Content-Length": str(os.fstat(file.fileno()).st_size)}
+        if mtime is not None:
+            headers["X-OC-Mtime"] = str(int(mtime))
+        self._request("PUT", path, file, headers)
+
+    def mkdir(self, path : str):
+        """
+        Creates a directory and its parents, existing ones are kept
+
+        Raises:
+            VaultError
+        """
+        current = ""
+        for segment in joinPath(path).split("/")[1:]:
+            current += "/" + segment
+            try:
+                self._request("MKCOL", current, expect=(201,))
+            except VaultError as e:
+                # 405: already exists
+                if e.status != 405:
+                    raise
+
+    def move(self, source : str, destination : str):
+        """
+        Renames a file, replacing the destination
+
+        Raises:
+            VaultError
+        """
+        self._request("MOVE", source, headers={"Destination": self.url(destination), "Overwrite": "T"})
+
+    def delete(self, path : str):
+        """
+        Raises:
+            VaultError
+        """
+        self._request("DELETE", path)
@@ -0,0 +1,42 @@
+"""
+Import time of the commands, see benchmarks/bench_startup.py
+
+JARVICE_CLI_BENCH_SCALE multiplies the budgets, for slow machines.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("jarviceapi_client")
+
+from benchmarks.bench_startup import COMMANDS, importTime
+from benchmarks.mockserver import MockJarviceServer
+
+# Runs per command, the fastest is kept
+REPEAT = 3
+SCALE = float(os.environ.get("JARVICE_CLI_BENCH_SCALE", "1"))
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = MockJarviceServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("name", list(COMMANDS))
+def test_import_time(server, name):
+    argv, budget, _ = COMMANDS[name]
+    runs = [importTime(argv, server.url) for _ in range(REPEAT)]
+    assert runs[0][2] == 0, runs[0][3]
+    elapsed = min(run[0] for run in runs)
+    assert elapsed <= budget * SCALE, f"{name}: imports take {elapsed:.1f} ms, budget {budget * SCALE:.0f} ms"
+
+
+@pytest.mark.parametrize("name, module", [(name, module) for name in ("help", "shutdown")
+                                          for module in COMMANDS[name][2]])
+def test_modules_not_loaded(server, name, module):
+    # --help must not load the client, raw output must not load rich
+    _, modules, returncode, error = importTime(COMMANDS[name][0], server.url)
+    assert returncode == 0, error
+    assert not any(m == module or m.startswith(module + ".") for m in modules), f"{name} imports {module}"
@@ -0,0 +1,118 @@
+"""
+Vault transfers against the local storage server of the benchmarks
+"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("urllib3")
+
+from benchmarks.storageserver import MockStorageServer
+from jarvice_cli.transfer import PART_SUFFIX, Transfer
+from jarvice_cli.vault import VaultStorage
+
+VAULT = "vault"
+CHUNK_SIZE = 64 * 1024
+# Chunks of the large file
+CHUNKS = 5
+
+
+def startServer(tmp_path, ranged_put : bool = True) -> MockStorageServer:
+    root = tmp_path / "storage"
+    (root / VAULT).mkdir(parents=True)
+    return MockStorageServer(str(root), ranged_put=ranged_put).start()
+
+
+@pytest.fixture(autouse=True)
+def cacheDir(tmp_path, monkeypatch):
+    # State of interrupted uploads
+    monkeypatch.setenv("JARVICE_CLI_CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = startServer(tmp_path)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def local(tmp_path):
+    """
+    Directory with small files and a file of CHUNKS chunks
+    """
+    directory = tmp_path / "local"
+    (directory / "small").mkdir(parents=True)
+    for n in range(3):
+        (directory / "small" / f"file{n}.txt").write_bytes(os.urandom(100 + n))
+    (directory / "large.bin").write_bytes(os.urandom(CHUNK_SIZE * (CHUNKS - 1) + 1000))
+    return directory
+
+
+def transfer(server : MockStorageServer) -> Transfer:
+    return Transfer(VaultStorage(server.url, VAULT, "user", "key"), max_parallel=4, chunk_size=CHUNK_SIZE)
+
+
+def files(directory):
+    return {path.relative_to(directory).as_posix(): path.read_bytes()
+            for path in directory.rglob("*") if path.is_file()}
+
+
+def test_round_trip(server, local, tmp_path):
+    stats = transfer(server).upload(local, "/data")
+    assert (stats.failed, stats.transferred) == (0, 4)
+    assert files(server.root / VAULT / "data") == files(local)
+    stats = transfer(server).download("/data", tmp_path / "download")
+    assert (stats.failed, stats.transferred) == (0, 4)
+    assert files(tmp_path / "download") == files(local)
+
+
+def test_skip_in_sync(server, local, tmp_path):
+    transfer(server).upload(local, "/data")
+    server.reset_counters()
+    stats = transfer(server).upload(local, "/data")
+    assert (stats.files, stats.skipped, stats.transferred, stats.bytes) == (4, 4, 0, 0)
+    transfer(server).download("/data", tmp_path / "download")
+    stats = transfer(server).download("/data", tmp_path / "download")
+    assert (stats.files, stats.skipped, stats.transferred, stats.bytes) == (4, 4, 0, 0)
+
+
+def test_resume_download(server, local, tmp_path):
+    transfer(server).upload(local, "/data")
+    remote = server.root / VAULT / "data" / "large.bin"
+    server.reset_counters()
+    transfer(server).download("/data/large.bin", tmp_path / "fresh.bin")
+    fresh = server.requests
+
+    # Download interrupted after its first two chunks
+    destination = tmp_path / "large.bin"
+    part = destination.with_name(destination.name + PART_SUFFIX)
+    part.write_bytes(remote.read_bytes()[:2 * CHUNK_SIZE])
+    storage = VaultStorage(server.url, VAULT, "user", "key")
+    entry = storage.stat("/data/large.bin")
+    part.with_name(part.name + ".json").write_text(json.dumps({
+        "size": entry.size, "mtime": entry.mtime, "etag": entry.etag, "chunk_size": CHUNK_SIZE, "done": [0, 1]}))
+    server.reset_counters()
+    stats = transfer(server).download("/data/large.bin", destination)
+    assert (stats.failed, stats.transferred, stats.bytes) == (0, 1, remote.stat().st_size - 2 * CHUNK_SIZE)
+    assert server.requests == fresh - 2
+    assert destination.read_bytes() == remote.read_bytes()
+    assert not part.exists()
+
+
+def test_upload_without_ranged_put(tmp_path, local, monkeypatch):
+    streamed = []
+    writeFile = VaultStorage.writeFile
+    monkeypatch.setattr(VaultStorage, "writeFile",
+                        lambda self, path, file, mtime=None: streamed.append(path) or writeFile(self, path, file, mtime))
+    server = startServer(tmp_path, ranged_put=False)
+    try:
+        stats = transfer(server).upload(local, "/data")
+        assert (stats.failed, stats.transferred) == (0, 4)
+        # The large file is sent whole, streamed from the disk
+        assert streamed == ["/data/large.bin"]
+        assert files(server.root / VAULT / "data") == files(local)
+        assert not list((server.root / VAULT).rglob("*" + PART_SUFFIX))
+    finally:
+        server.stop()